@@ -0,0 +1,69 @@
+"""
+Compares the CloudEvent JSON encode and decode paths of the cloudevents
+library's JSONFormat with func_python's EventFormat using each installed
+JSON codec.
+
+    PYTHONPATH=src python benchmarks/codec.py [iterations]
+"""
+import sys
+import timeit
+
+from cloudevents.core.formats.json import JSONFormat
+from cloudevents.core.v1.event import CloudEvent
+
+import func_python.codec
+from func_python.cloudevent import EventFormat, event_from_dict
+
+
+def event():
+    return CloudEvent(
+        attributes={
+            "type": "com.example.order.created",
+            "source": "https://example.com/orders",
+            "subject": "order-1234",
+        },
+        data={
+            "id": 1234,
+            "customer": {"id": 42, "name": "Jane Doe", "tier": "gold"},
+            "items": [{"sku": f"SKU-{i}", "quantity": i, "price": i * 9.99}
+                      for i in range(20)],
+            "notes": "x" * 256,
+        })
+
+
+def formats():
+    yield "cloudevents JSONFormat", JSONFormat()
+    for name, codec in func_python.codec.CODECS.items():
+        try:
+            yield f"EventFormat ({name})", EventFormat(codec())
+        except ImportError:
+            print(f"{name}: not installed", file=sys.stderr)
+
+
+def main(iterations):
+    e = event()
+    structured = JSONFormat().write(e)
+    data = JSONFormat().write_data(e.get_data(), None)
+    batch = b"[" + b",".join([structured] * 10) + b"]"
+
+    print(f"{'format':<28}{'write':>12}{'read':>12}{'read_data':>12}"
+          f"{'batch':>12}   (us per op)")
+    for name, fmt in formats():
+        cases = [
+            lambda: fmt.write(e),
+            lambda: fmt.read(None, structured),
+            lambda: fmt.read_data(data, "application/json"),
+        ]
+        if isinstance(fmt, EventFormat):
+            cases.append(lambda: [event_from_dict(i)
+                                  for i in fmt.codec.loads(batch)])
+        else:
+            cases.append(lambda: [fmt.read(None, structured)
+                                  for _ in range(10)])
+        results = [timeit.timeit(case, number=iterations) / iterations * 1e6
+                   for case in cases]
+        print(f"{name:<28}" + "".join(f"{r:>12.2f}" for r in results))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,74 @@
+"""
+Measures the cold start of the example Functions in cmd/fhttp and
+cmd/fcloudevent: the time from starting the process to its first successful
+response (a readiness probe), as the queue-proxy sees it when scaling from
+zero.  The startup profile of the last run of each is also shown.
+
+    PYTHONPATH=src python benchmarks/coldstart.py [runs]
+"""
+import http.client
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOST, PORT = "127.0.0.1", 8089
+FUNCTIONS = ("cmd/fhttp/main.py", "cmd/fcloudevent/main.py")
+TIMEOUT = 30.0
+
+
+def ready():
+    conn = http.client.HTTPConnection(HOST, PORT, timeout=1.0)
+    try:
+        conn.request("GET", "/health/readiness")
+        return conn.getresponse().status == 200
+    except OSError:
+        return False
+    finally:
+        conn.close()
+
+
+def cold_start(script):
+    env = dict(os.environ, LISTEN_ADDRESS=f"{HOST}:{PORT}",
+               FUNC_STARTUP_PROFILE="true",
+               PYTHONPATH=os.pathsep.join(
+                   filter(None, [os.path.join(ROOT, "src"),
+                                 os.getenv("PYTHONPATH")])))
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, script)],
+                               env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE, text=True)
+    try:
+        while not ready():
+            if process.poll() is not None:
+                raise RuntimeError(f"{script} exited: {process.stderr.read()}")
+            if time.perf_counter() - started > TIMEOUT:
+                raise RuntimeError(f"{script} did not become ready")
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - started
+    finally:
+        process.send_signal(signal.SIGTERM)
+        _, stderr = process.communicate(timeout=TIMEOUT)
+    profile = [line for line in stderr.splitlines() if "startup:" in line]
+    return elapsed, profile
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for script in FUNCTIONS:
+        times = []
+        for _ in range(runs):
+            elapsed, profile = cold_start(script)
+            times.append(elapsed * 1000)
+        print(f"{script}: median {statistics.median(times):.1f}ms "
+              f"min {min(times):.1f}ms max {max(times):.1f}ms "
+              f"({runs} runs)")
+        for line in profile:
+            print(f"    {line.split('startup: ', 1)[1]}")
+
+
+if __name__ == "__main__":
+    main()
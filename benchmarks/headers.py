@@ -0,0 +1,99 @@
+"""
+Compares CloudEvent header handling through the cloudevents library's HTTP
+binding (decoding every header to a dict of strings, and encoding every
+header of the response) with func_python's bytes-level header paths.
+
+    PYTHONPATH=src python benchmarks/headers.py [iterations]
+"""
+import sys
+import timeit
+
+from cloudevents.core.bindings.http import (
+    HTTPMessage, from_http_event, to_binary_event, to_structured_event,
+)
+from cloudevents.core.v1.event import CloudEvent
+
+from func_python.cloudevent import (
+    EVENT_FORMAT, STRUCTURED_HEADERS, binary_attributes, binary_headers,
+)
+
+# A typical request as forwarded by the queue-proxy
+REQUEST_HEADERS = [
+    (b"host", b"function.default.svc.cluster.local"),
+    (b"user-agent", b"Go-http-client/1.1"),
+    (b"content-length", b"19"),
+    (b"accept-encoding", b"gzip"),
+    (b"ce-id", b"0b5a3ee7-2b95-4a0e-8d4b-61e5e8f3a0c2"),
+    (b"ce-source", b"/apis/v1/namespaces/default/pingsources/ping"),
+    (b"ce-specversion", b"1.0"),
+    (b"ce-time", b"2026-01-01T00:00:00.000000Z"),
+    (b"ce-type", b"dev.knative.sources.ping"),
+    (b"content-type", b"application/json"),
+    (b"forwarded", b"for=10.0.0.1;proto=http"),
+    (b"k-proxy-request", b"activator"),
+    (b"traceparent", b"00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"),
+    (b"x-forwarded-for", b"10.0.0.1, 10.0.0.2"),
+    (b"x-request-id", b"5c7c8b9e-1a2b-4c3d-9e8f-7a6b5c4d3e2f"),
+]
+BODY = b'{"message": "ping"}'
+
+
+def response_event():
+    return CloudEvent(attributes={
+        "type": "com.example.response",
+        "source": "/function/example",
+        "datacontenttype": "application/json",
+    }, data={"message": "OK"})
+
+
+def library_decode():
+    headers = {k.decode("utf-8").lower(): v.decode("utf-8")
+               for k, v in REQUEST_HEADERS}
+    return from_http_event(HTTPMessage(headers=headers, body=BODY))
+
+
+def func_decode():
+    attributes = binary_attributes(REQUEST_HEADERS)
+    return CloudEvent(attributes, EVENT_FORMAT.read_data(
+        BODY, attributes.get("datacontenttype")))
+
+
+def library_encode(event, to_event):
+    msg = to_event(event)
+    return [(k.encode(), v.encode()) for k, v in msg.headers.items()] + \
+        [(b"content-length", str(len(msg.body)).encode())]
+
+
+# Both sides include encoding the body, as the library does so when
+# producing its headers.
+def func_encode_binary(event):
+    body = EVENT_FORMAT.write_data(event.get_data(),
+                                   event.get_datacontenttype())
+    return binary_headers(event) + [(b"content-length", str(len(body)).encode())]
+
+
+def func_encode_structured(event):
+    body = EVENT_FORMAT.write(event)
+    return STRUCTURED_HEADERS + [(b"content-length", str(len(body)).encode())]
+
+
+def main(iterations):
+    event = response_event()
+    cases = [
+        ("decode binary request", library_decode, func_decode),
+        ("encode binary response",
+         lambda: library_encode(event, to_binary_event),
+         lambda: func_encode_binary(event)),
+        ("encode structured response",
+         lambda: library_encode(event, to_structured_event),
+         lambda: func_encode_structured(event)),
+    ]
+    print(f"{'case':<38}{'library':>12}{'func':>12}   (us per op)")
+    for name, library, func in cases:
+        results = [timeit.timeit(f, number=iterations) / iterations * 1e6
+                   for f in (library, func)]
+        print(f"{name:<38}" + "".join(f"{r:>12.2f}" for r in results))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -1,6 +1,6 @@
 import argparse
 import logging
-from func_python.cloudevent import serve
+from func_python.cloudevent import serve, decode_data
 from cloudevents.core.v1.event import CloudEvent
 
 # Set the default logging level to INFO
@@ -39,10 +39,7 @@ async def handle(scope, receive, send):
     logging.info(f"Received CloudEvent: type={event.get_type()}, source={event.get_source()}")
 
     # Handle event data - it might be bytes or dict
-    event_data = event.get_data()
-    if isinstance(event_data, bytes):
-        import json
-        event_data = json.loads(event_data)
+    event_data = decode_data(event)
     logging.info(f"CloudEvent data: {event_data}")
 
     response_event = CloudEvent(
@@ -90,10 +87,7 @@ class MyCloudEventFunction:
         logging.info(f"Received CloudEvent #{self.event_count}: type={event.get_type()}, source={event.get_source()}")
 
         # Handle event data - it might be bytes or dict
-        event_data = event.get_data()
-        if isinstance(event_data, bytes):
-            import json
-            event_data = json.loads(event_data)
+        event_data = decode_data(event)
         logging.info(f"CloudEvent data: {event_data}")
         logging.info(f"Total events processed: {self.event_count}")
 
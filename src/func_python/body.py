@@ -0,0 +1,212 @@
+import os
+
+import func_python.compression
+
+DEFAULT_MAX_BODY_SIZE = 0  # unlimited
+DEFAULT_DECOMPRESS = True
+DEFAULT_MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024  # bytes
+
+
+class BodyTooLarge(Exception):
+    """ Raised when a request body exceeds the maximum allowed size """
+
+
+class UnsupportedEncoding(Exception):
+    """ Raised when a request body's Content-Encoding can not be decoded """
+
+
+class InvalidBody(ValueError):
+    """ Raised when a compressed request body is corrupt or truncated """
+
+
+def max_body_size(size: int | None = None) -> int:
+    """
+    Returns the maximum request body size in bytes, read from the
+    'FUNC_MAX_BODY_SIZE' environment variable unless given explicitly.
+    Zero means unlimited.
+    """
+    if size is None:
+        size = int(os.getenv('FUNC_MAX_BODY_SIZE', DEFAULT_MAX_BODY_SIZE))
+    if size < 0:
+        raise ValueError(f"maximum body size must not be negative, got {size}")
+    return size
+
+
+def decompression(decompress: bool | None = None,
+                  max_size: int | None = None,
+                  default: bool = DEFAULT_DECOMPRESS) -> tuple[bool, int]:
+    """
+    Returns whether compressed request bodies are decompressed, read from
+    'FUNC_DECOMPRESS_REQUESTS' (else the given default), and the maximum
+    size of a decompressed body, read from 'FUNC_MAX_DECOMPRESSED_SIZE',
+    unless given explicitly.
+    """
+    if decompress is None:
+        decompress = os.getenv('FUNC_DECOMPRESS_REQUESTS',
+                               str(default)).lower() \
+            in ('1', 'true', 'yes')
+    if max_size is None:
+        max_size = int(os.getenv('FUNC_MAX_DECOMPRESSED_SIZE',
+                                 DEFAULT_MAX_DECOMPRESSED_SIZE))
+    if max_size < 0:
+        raise ValueError(f"maximum decompressed size must not be negative, "
+                         f"got {max_size}")
+    return decompress, max_size
+
+
+def content_length(scope) -> int | None:
+    """ Returns the request's declared Content-Length, if any """
+    for k, v in scope.get('headers', []):
+        if k.lower() == b'content-length':
+            try:
+                return int(v)
+            except ValueError:
+                return None
+    return None
+
+
+async def read_body(receive, max_size: int = 0, length: int | None = None,
+                    as_memoryview: bool = False):
+    """
+    Receives the complete request body.
+
+    Chunks are collected and joined once at the end, so a body received in
+    many chunks is copied at most once.  A body received in a single chunk
+    is returned without copying.
+
+    :param receive: The ASGI receive callable.
+    :param max_size: Maximum body size in bytes, zero for unlimited.
+    :param length: The declared Content-Length.  When it exceeds max_size
+                   the request is rejected before any of the body is read.
+    :param as_memoryview: Return a memoryview rather than bytes.
+    :raises BodyTooLarge: If the body exceeds max_size.  Reading stops as
+                          soon as the limit is crossed.
+    """
+    if max_size and length is not None and length > max_size:
+        raise BodyTooLarge(f"request body of {length} bytes exceeds "
+                           f"maximum of {max_size} bytes")
+
+    chunks = []
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunk = message.get("body", b"")
+        if chunk:
+            size += len(chunk)
+            if max_size and size > max_size:
+                raise BodyTooLarge(f"request body exceeds maximum of "
+                                   f"{max_size} bytes")
+            chunks.append(chunk)
+        more_body = message.get("more_body", False)
+
+    if as_memoryview:
+        if len(chunks) == 1:
+            return memoryview(chunks[0])
+        buffer = bytearray(size)
+        offset = 0
+        for chunk in chunks:
+            buffer[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+        return memoryview(buffer)
+
+    if len(chunks) == 1:
+        return bytes(chunks[0])
+    return b"".join(chunks)
+
+
+class BodyReceiver:
+    """
+    A receive callable which counts the bytes received, enforces the maximum
+    body size and offers reading the complete body with a single call:
+
+        body = await receive.body()
+
+    It may still be called directly to receive raw ASGI messages.
+
+    If decompress is set, a body with a Content-Encoding of gzip, deflate or
+    br (with the brotli package installed) is decompressed as it is
+    received, and the Content-Encoding and Content-Length headers are
+    removed from the scope.  The maximum body size then applies to the
+    decompressed body too, which is further limited to max_decompressed
+    bytes.  Decompression stops as soon as a limit is crossed, so a small
+    request can not expand to exhaust memory.  Corrupt bodies raise
+    InvalidBody.  Other encodings raise UnsupportedEncoding if strict, and
+    are otherwise received untouched.
+    """
+
+    def __init__(self, receive, scope, max_size: int = 0,
+                 decompress: bool = False, max_decompressed: int = 0,
+                 strict: bool = True):
+        self._receive = receive
+        self._scope = scope
+        self._max_size = max_size
+        self.received = 0
+        self._body = None
+        self._decoder = None
+        self._encoding = None
+        self._strict = strict
+        if decompress:
+            self._find_encoding(max_decompressed)
+
+    def _find_encoding(self, max_decompressed):
+        headers = self._scope.get('headers', [])
+        for k, v in headers:
+            if k.lower() == b'content-encoding':
+                break
+        else:
+            return
+        encoding = v.decode('latin-1').strip().lower()
+        if encoding in ('', 'identity'):
+            return
+        self._encoding = encoding
+        self._decoder = func_python.compression.decoder(encoding)
+        if self._decoder is None:
+            if not self._strict:
+                self._encoding = None
+            return
+        limits = [n for n in (self._max_size, max_decompressed) if n]
+        self._limit = min(limits) if limits else None
+        self.decompressed = 0
+        self._scope['headers'] = [
+            (k, v) for k, v in headers
+            if k.lower() not in (b'content-encoding', b'content-length')]
+
+    async def __call__(self):
+        if self._encoding is not None and self._decoder is None:
+            raise UnsupportedEncoding(f"unsupported content encoding: "
+                                      f"<{self._encoding}>")
+        message = await self._receive()
+        chunk = message.get("body")
+        if chunk:
+            self.received += len(chunk)
+            if self._max_size and self.received > self._max_size:
+                raise BodyTooLarge(f"request body exceeds maximum of "
+                                   f"{self._max_size} bytes")
+        if self._decoder is not None and message.get("type") == "http.request":
+            message = self._decompress(message, chunk)
+        return message
+
+    def _decompress(self, message, chunk):
+        # None is no limit, which is distinct from no bytes remaining
+        remaining = None if self._limit is None \
+            else self._limit - self.decompressed
+        try:
+            body = self._decoder.decompress(chunk, remaining) if chunk else b''
+            self.decompressed += len(body)
+            if self._limit is not None and self.decompressed > self._limit:
+                raise BodyTooLarge(f"decompressed request body exceeds "
+                                   f"maximum of {self._limit} bytes")
+            if not message.get("more_body", False):
+                body += self._decoder.finish()
+        except ValueError as e:
+            raise InvalidBody(str(e))
+        return dict(message, body=body)
+
+    async def body(self, as_memoryview: bool = False):
+        """ Receive the complete request body.  The result is retained, so
+        this may be called more than once. """
+        if self._body is None:
+            self._body = await read_body(self, self._max_size,
+                                         content_length(self._scope))
+        return memoryview(self._body) if as_memoryview else self._body
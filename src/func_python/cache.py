@@ -0,0 +1,315 @@
+import asyncio
+import collections
+import hashlib
+import os
+import time
+
+DEFAULT_RESPONSE_CACHE_SIZE = 0  # bytes, zero is disabled
+DEFAULT_RESPONSE_CACHE_TTL = 60.0  # seconds
+DEFAULT_RESPONSE_CACHE_HEADERS = 'accept'
+
+CACHEABLE_METHODS = ('GET',)
+
+# Approximate overhead of an entry, beyond its body and headers
+ENTRY_OVERHEAD = 256  # bytes
+
+
+def cache_control(value: bytes) -> dict:
+    """ Returns the directives of a Cache-Control header, lowercased, with
+    the value of those which have one (such as max-age) """
+    directives = {}
+    for item in value.decode('latin-1').lower().split(','):
+        name, _, arg = item.strip().partition('=')
+        if name:
+            directives[name] = arg.strip().strip('"')
+    return directives
+
+
+def _seconds(directives, name):
+    try:
+        return float(directives[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def _header(headers, name: bytes):
+    for k, v in headers:
+        if k.lower() == name:
+            return v
+    return None
+
+
+def etag(body: bytes) -> bytes:
+    """ Returns a strong entity tag for a response body """
+    return b'"' + hashlib.blake2b(
+        body, digest_size=16).hexdigest().encode() + b'"'
+
+
+def _opaque(etag: bytes) -> bytes:
+    """ An entity tag without its weak indicator, for weak comparison """
+    etag = etag.strip()
+    return etag[2:] if etag.startswith(b'W/') else etag
+
+
+def matches(if_none_match: bytes, etag: bytes) -> bool:
+    """ Returns whether an If-None-Match header matches the entity tag """
+    if if_none_match.strip() == b'*':
+        return True
+    etag = _opaque(etag)
+    return any(_opaque(t) == etag for t in if_none_match.split(b','))
+
+
+class Entry:
+    __slots__ = ('status', 'headers', 'body', 'etag', 'stored', 'expires',
+                 'size')
+
+    def __init__(self, status, headers, body, etag, ttl):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.stored = time.monotonic()
+        self.expires = self.stored + ttl
+        self.size = len(body) + ENTRY_OVERHEAD + \
+            sum(len(k) + len(v) for k, v in headers)
+
+
+class Capture:
+    """ Capture wraps an ASGI send callable, recording the response to store
+    in the cache unless it exceeds the cache's size or is not a plain body.
+    The start of a response which may be stored is held back until its body
+    begins, so that a response sent in a single message is given the same
+    ETag as it will have in the cache. """
+
+    __slots__ = ('_send', '_cache', '_start', 'status', 'headers', 'chunks',
+                 'size', 'complete', 'cacheable')
+
+    def __init__(self, send, cache):
+        self._send = send
+        self._cache = cache
+        self._start = None
+        self.status = None
+        self.headers = []
+        self.chunks = []
+        self.size = 0
+        self.complete = False
+        self.cacheable = True
+
+    async def __call__(self, message):
+        kind = message['type']
+        if kind == 'http.response.start':
+            self.status = message['status']
+            self.headers = list(message.get('headers', ()))
+            if _header(self.headers, b'etag') is None and \
+                    self._cache.lifetime(self.status, self.headers):
+                self._start = message
+                return
+        elif kind == 'http.response.body':
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if self.cacheable:
+                self.size += len(body)
+                if self.size > self._cache.max_size:
+                    self.cacheable = False
+                    self.chunks = []
+                else:
+                    self.chunks.append(body)
+            self.complete = not more_body
+            if self._start is not None and self.cacheable and not more_body:
+                self.headers.append((b'etag', etag(body)))
+                self._start = dict(self._start, headers=list(self.headers))
+        else:
+            self.cacheable = False  # pathsend and other extensions
+        if self._start is not None:
+            start, self._start = self._start, None
+            await self._send(start)
+        await self._send(message)
+
+
+class ResponseCache:
+    """
+    ResponseCache caches the responses of HTTP Functions to GET requests,
+    in memory, up to 'FUNC_RESPONSE_CACHE_SIZE' bytes (which must be set to
+    enable it), evicting the least recently used.  Responses are keyed on
+    the method, path, query string and the request headers listed in
+    'FUNC_RESPONSE_CACHE_HEADERS'.
+
+    Only 200 responses are cached, for the max-age (or s-maxage) of their
+    Cache-Control, or 'FUNC_RESPONSE_CACHE_TTL' seconds if they have none.
+    Responses with no-store, no-cache or private, which set cookies, or
+    which vary by request headers other than those of the key are not
+    cached, nor are requests with no-store or an Authorization header;
+    requests with no-cache or max-age=0 are handled afresh.  Cached
+    responses are given an ETag if they have none, and requests with a
+    matching If-None-Match are answered with a 304.  The response which is
+    stored has the same ETag unless it was streamed in several messages.
+
+    Concurrent requests which miss the cache for the same key wait for the
+    first of them to be handled, rather than each invoking the Function.
+    """
+
+    def __init__(self, size: int | None = None, ttl: float | None = None,
+                 headers: str | None = None):
+        if size is None:
+            size = int(os.getenv('FUNC_RESPONSE_CACHE_SIZE',
+                                 DEFAULT_RESPONSE_CACHE_SIZE))
+        if ttl is None:
+            ttl = float(os.getenv('FUNC_RESPONSE_CACHE_TTL',
+                                  DEFAULT_RESPONSE_CACHE_TTL))
+        if headers is None:
+            headers = os.getenv('FUNC_RESPONSE_CACHE_HEADERS',
+                                DEFAULT_RESPONSE_CACHE_HEADERS)
+        self.max_size = size
+        self.ttl = ttl
+        self.headers = tuple(h.strip().lower().encode() for h in
+                             headers.split(',') if h.strip())
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._pending = {}  # keys being handled, to their completion
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def key(self, scope):
+        """ Returns the cache key of a request, and whether a cached
+        response may be used (rather than only stored), or None if the
+        request is not cacheable. """
+        if scope['method'] not in CACHEABLE_METHODS:
+            return None
+        values = dict.fromkeys(self.headers, b'')
+        fresh = True
+        for k, v in scope.get('headers', ()):
+            k = k.lower()
+            if k == b'authorization':
+                return None
+            if k == b'cache-control':
+                directives = cache_control(v)
+                if 'no-store' in directives:
+                    return None
+                if 'no-cache' in directives or \
+                        _seconds(directives, 'max-age') == 0:
+                    fresh = False
+            if k in values:
+                values[k] = v
+        return (scope['method'], scope['path'], scope.get('query_string'),
+                *values.values()), fresh
+
+    async def lookup(self, key, fresh: bool = True):
+        """
+        Returns the cached response for key, if any, and whether the caller
+        should store its response: in which case release must be called once
+        it has been handled.  A request for which another of the same key is
+        being handled waits for it to complete.
+        """
+        if fresh:
+            entry = self._get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry, False
+        self.misses += 1
+        pending = self._pending.get(key)
+        if pending is not None:
+            if not fresh:
+                return None, False
+            await asyncio.shield(pending)
+            return self._get(key), False
+        self._pending[key] = asyncio.get_running_loop().create_future()
+        return None, True
+
+    def release(self, key, capture: Capture):
+        """ Store the captured response for key, if it may be cached, and
+        wake any requests waiting for it. """
+        try:
+            entry = self._entry(capture)
+            if entry is not None:
+                self._put(key, entry)
+        finally:
+            pending = self._pending.pop(key, None)
+            if pending is not None:
+                pending.set_result(None)
+
+    async def respond(self, send, scope, entry: Entry):
+        """ Send a cached response, or a 304 if the request's If-None-Match
+        matches its entity tag """
+        age = str(int(time.monotonic() - entry.stored)).encode()
+        for k, v in scope.get('headers', ()):
+            if k.lower() == b'if-none-match' and matches(v, entry.etag):
+                headers = [(k, v) for k, v in entry.headers
+                           if k.lower() in (b'etag', b'cache-control',
+                                            b'vary', b'expires')]
+                await send({'type': 'http.response.start', 'status': 304,
+                            'headers': headers + [(b'age', age)]})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+        await send({'type': 'http.response.start', 'status': entry.status,
+                    'headers': entry.headers + [(b'age', age)]})
+        await send({'type': 'http.response.body', 'body': entry.body})
+
+    def lifetime(self, status, headers):
+        """ Returns the seconds for which a response with the given status
+        and headers may be cached, or None if it may not be """
+        if status != 200:
+            return None
+        ttl = self.ttl
+        for k, v in headers:
+            k = k.lower()
+            if k == b'cache-control':
+                directives = cache_control(v)
+                if directives.keys() & {'no-store', 'no-cache', 'private'}:
+                    return None
+                max_age = _seconds(directives, 's-maxage')
+                if max_age is None:
+                    max_age = _seconds(directives, 'max-age')
+                if max_age is not None:
+                    ttl = max_age
+            elif k == b'set-cookie':
+                return None
+            elif k == b'vary':
+                # Responses varying by request headers which are not part
+                # of the key (or by anything, with "*") can not be reused
+                names = {n.strip().lower() for n in v.split(b',')}
+                if not names - {b''} <= set(self.headers):
+                    return None
+        return ttl if ttl > 0 else None
+
+    def _entry(self, capture):
+        if not (capture.complete and capture.cacheable):
+            return None
+        ttl = self.lifetime(capture.status, capture.headers)
+        if ttl is None:
+            return None
+        body = b''.join(capture.chunks)
+        headers = capture.headers
+        tag = _header(headers, b'etag')
+        if tag is None:
+            tag = etag(body)
+            headers = headers + [(b'etag', tag)]
+        return Entry(capture.status, headers, body, tag, ttl)
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key, entry):
+        if entry.size > self.max_size:
+            return
+        self._remove(key)
+        self._entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_size:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
@@ -0,0 +1,153 @@
+import asyncio
+import collections
+import ssl
+import urllib.parse
+
+DEFAULT_POOL_SIZE = 10  # connections
+DEFAULT_REQUEST_TIMEOUT = 10.0  # seconds
+
+MAX_HEADER_LINE = 65536  # bytes
+
+
+class Response:
+    __slots__ = ('status', 'headers', 'body')
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def header(self, name: bytes):
+        for k, v in self.headers:
+            if k == name:
+                return v
+        return None
+
+
+class Pool:
+    """
+    Pool is a minimal HTTP/1.1 client for sending requests to a single
+    origin, keeping up to size connections alive for reuse rather than
+    connecting for each request.  Requests beyond size wait for a
+    connection.  Each request must complete within timeout seconds.
+    """
+
+    def __init__(self, url: str, size: int = DEFAULT_POOL_SIZE,
+                 timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        url = urllib.parse.urlsplit(url)
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            raise ValueError(f"invalid URL: <{url.geturl()}>")
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() \
+            if url.scheme == 'https' else None
+        self.path = (url.path or '/') + (f'?{url.query}' if url.query else '')
+        self.authority = url.netloc.rpartition('@')[2].encode('idna')
+        self.timeout = timeout
+        self._idle = collections.deque()
+        self._slots = asyncio.Semaphore(size)
+        self.connections = 0  # opened, for reporting reuse
+
+    async def request(self, method: str, headers, body: bytes = b''):
+        """ Send a request with the given encoded (name, value) header
+        pairs, returning the Response.  Raises OSError (including
+        ConnectionError) or asyncio.TimeoutError if it fails. """
+        async with self._slots:
+            return await asyncio.wait_for(
+                self._request(method, headers, body), self.timeout)
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.popleft()
+            writer.close()
+
+    async def _request(self, method, headers, body):
+        reader, writer, reused = await self._connect()
+        try:
+            writer.write(self._encode(method, headers, body))
+            await writer.drain()
+            response, keep_alive = await self._read(reader, method)
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            writer.close()
+            if reused and not isinstance(e, ValueError):
+                # The server may have closed the idle connection: retry the
+                # request on another
+                return await self._request(method, headers, body)
+            if isinstance(e, asyncio.IncompleteReadError):
+                raise ConnectionError("connection closed by server")
+            raise
+        except BaseException:
+            writer.close()
+            raise
+        if keep_alive:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return response
+
+    async def _connect(self):
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        self.connections += 1
+        reader, writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl, limit=MAX_HEADER_LINE)
+        return reader, writer, False
+
+    def _encode(self, method, headers, body):
+        lines = [f'{method} {self.path} HTTP/1.1'.encode(),
+                 b'host: ' + self.authority,
+                 b'content-length: ' + str(len(body)).encode()]
+        lines.extend(k + b': ' + v for k, v in headers)
+        return b'\r\n'.join(lines) + b'\r\n\r\n' + body
+
+    async def _read(self, reader, method):
+        while True:
+            version, status, headers = await self._read_head(reader)
+            if status == 101:
+                raise ValueError("unexpected switch of protocols")
+            if status >= 200:
+                break
+            # Interim responses (such as 100 Continue or 103 Early Hints)
+            # are followed by the final response on the same connection
+        response = Response(status, headers, b'')
+        keep_alive = version != b'HTTP/1.0'
+        connection = response.header(b'connection')
+        if connection is not None:
+            keep_alive = connection.lower() != b'close'
+        if method == 'HEAD' or status in (204, 304):
+            return response, keep_alive
+        length = response.header(b'content-length')
+        if length is not None:
+            response.body = await reader.readexactly(int(length))
+        elif response.header(b'transfer-encoding') == b'chunked':
+            response.body = await self._read_chunked(reader)
+        else:
+            response.body = await reader.read()
+            keep_alive = False
+        return response, keep_alive
+
+    async def _read_head(self, reader):
+        line = await reader.readuntil(b'\r\n')
+        version, status, *_ = line.split(None, 2) + [b'']
+        if not version.startswith(b'HTTP/1.'):
+            raise ValueError(f"invalid HTTP response: {line[:64]!r}")
+        status = int(status)
+        headers = []
+        while (line := await reader.readuntil(b'\r\n')) != b'\r\n':
+            k, _, v = line.partition(b':')
+            headers.append((k.strip().lower(), v.strip()))
+        return version, status, headers
+
+    async def _read_chunked(self, reader):
+        chunks = []
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            if size == 0:
+                while await reader.readuntil(b'\r\n') != b'\r\n':
+                    pass  # trailers
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
@@ -1,43 +1,132 @@
 import asyncio
+import base64
+import datetime
 import logging
 import os
+import random
+import re
 import signal
-
-import hypercorn.config
-import hypercorn.asyncio
+import time
+import urllib.parse
 
 from cloudevents.core.v1.event import CloudEvent
-from cloudevents.core.bindings.http import (
-    from_http_event, to_structured_event, to_binary_event, HTTPMessage,
-)
 from cloudevents.core.exceptions import CloudEventValidationError
+from cloudevents.core.formats.json import JSONFormat
+from cloudevents.core.spec import SPECVERSION_V0_3, SPECVERSION_V1_0
+from dateutil.parser import isoparse
 
+import func_python.body
+import func_python.client
+import func_python.compression
+import func_python.codec
+import func_python.config
+import func_python.dedup
+import func_python.drain
+import func_python.executor
+import func_python.health
+import func_python.limiter
+import func_python.metrics
+import func_python.ordering
+import func_python.router
 import func_python.sock
+import func_python.startup
+import func_python.timeout
+import func_python.warmup
+import func_python.workers
 
 DEFAULT_LOG_LEVEL = logging.INFO
 
-logging.basicConfig(level=DEFAULT_LOG_LEVEL)
+DEFAULT_BATCH_PARALLELISM = 0  # disabled
+
+DEFAULT_EMIT_BUFFER_SIZE = 1000  # events
+DEFAULT_EMIT_BATCH_SIZE = 100  # events
+DEFAULT_EMIT_LINGER = 0.005  # seconds
+DEFAULT_EMIT_RETRIES = 5
+DEFAULT_EMIT_BACKOFF = 0.1  # seconds, doubled on each retry
+MAX_EMIT_BACKOFF = 10.0  # seconds
+
+# Responses after which an event is sent again
+RETRY_STATUSES = (408, 429)
+
+BATCH_CONTENT_TYPE = "application/cloudevents-batch+json"
+
+REQUIRED_ATTRIBUTES = ("id", "source", "type", "specversion")
+
+# Attributes which are the same for every event of a given type, and whose
+# encoded headers are therefore cached as a template per type.
+TEMPLATE_ATTRIBUTES = ("type", "source", "specversion", "datacontenttype",
+                       "dataschema")
+
+# Bounds on the header encoding caches
+MAX_CACHED_HEADERS = 256
+
+STRUCTURED_HEADERS = [(b"content-type", b"application/cloudevents+json")]
+BATCH_HEADERS = [(b"content-type", BATCH_CONTENT_TYPE.encode())]
+
+# Per the HTTP binding, header values are percent-encoded except for
+# printable ASCII other than space, double-quote and percent.
+_UNSAFE_HEADER_VALUE = re.compile(r'[^\x21\x23\x24\x26-\x7e]')
 
+_header_names = {}     # attribute name -> encoded ce- header name
+_attribute_names = {}  # ce- header name -> attribute name
+_templates = {}        # template attribute values -> encoded headers
 
-def serve(f):
+
+def serve(f, workers=None, config=None):
     """serve a function f by wrapping it in an ASGI web application
     and starting.  The function can be either a constructor for a functon
     instance (named "new") or a simple ASGI handler function (named "handle").
+
+    When more than one worker is requested (via the workers argument or the
+    FUNC_WORKERS environment variable), each worker is a separate process
+    with its own event loop, function instance and SO_REUSEPORT listeners;
+    unix socket listeners are bound once and shared by the workers.
+
+    config is an optional mapping of Hypercorn settings, which take
+    precedence over those read from the environment.
     """
-    logging.debug("func runtime creating function instance")
+    # Logging is configured here rather than on import, leaving it to the
+    # Function if it has configured logging itself.
+    logging.basicConfig(level=DEFAULT_LOG_LEVEL)
+    profile = func_python.startup.Profile()
+    profile.mark("import")
 
-    if f.__name__ == 'new':
-        return ASGIApplication(f()).serve()
-    elif f.__name__ == 'handle':
-        try:
-            return ASGIApplication(DefaultFunction(f)).serve()
-        except Exception as e:
-            logging.error(f"Server failed to start: {e}")
-            raise
-    else:
+    if f.__name__ not in ('new', 'handle'):
         raise ValueError("function must be either be a constructor 'new' or a "
                          "handler function 'handle'.")
 
+    workers = func_python.workers.count(workers)
+    if workers > 1:
+        # Unix sockets are bound once here and inherited by the workers
+        cfg = func_python.config.hypercorn_config(config)
+        shared = func_python.sock.bind_shared(cfg.backlog)
+        try:
+            return func_python.workers.run(
+                lambda: _serve(f, config, reuse_port=True, profile=profile,
+                               shared=shared),
+                workers,
+                func_python.workers.worker_shutdown_timeout(
+                    cfg.graceful_timeout))
+        finally:
+            for sock in shared.values():
+                sock.close()
+    return _serve(f, config, profile=profile)
+
+
+def _serve(f, config=None, reuse_port=False, profile=None, shared=None):
+    logging.debug("func runtime creating function instance")
+
+    if f.__name__ == 'new':
+        return ASGIApplication(f(), profile).serve(config,
+                                                   reuse_port=reuse_port,
+                                                   shared=shared)
+    try:
+        return ASGIApplication(DefaultFunction(f), profile).serve(
+            config, reuse_port=reuse_port, shared=shared)
+    except Exception as e:
+        logging.error(f"Server failed to start: {e}")
+        raise
+
 
 class DefaultFunction:
     """DefaultFunction is used when the provided functon is not a constructor
@@ -55,11 +144,51 @@ class ASGIApplication():
     """ ASGIApplication is a wrapper around a Function instance which
     exposes it as an ASGI Application.
     """
-    def __init__(self, f):
+    def __init__(self, f, profile=None):
         self.f = f
+        self.profile = profile or func_python.startup.Profile(False)
+        self.profile.mark("new")
+        self._first_request = self.profile.enabled
         self.stop_event = asyncio.Event()
+        self.max_body_size = func_python.body.max_body_size()
+        self.decompress, self.max_decompressed_size = \
+            func_python.body.decompression()
+        self.lazy_events = os.getenv('FUNC_LAZY_EVENTS', 'false').lower() \
+            in ('1', 'true', 'yes')
+        self.batch_parallelism = int(os.getenv('FUNC_BATCH_PARALLELISM',
+                                               DEFAULT_BATCH_PARALLELISM))
+        self.limiter = func_python.limiter.Limiter()
+        self.drain = func_python.drain.Drain(lambda: self.limiter.inflight)
+        self.timeouts = func_python.timeout.Timeouts()
+        self.dedup = func_python.dedup.Dedup(getattr(f, "dedup_backend", None))
+        self.ordering = func_python.ordering.Ordering()
+        self.metrics = None
+        if func_python.metrics.enabled():
+            self.metrics = func_python.metrics.Metrics(label="type", gauges={
+                'func_requests_inflight': lambda: self.limiter.inflight,
+                'func_requests_queued': lambda: self.limiter.queued,
+                'func_draining': lambda: int(self.drain.draining),
+                'func_ordered_keys': lambda: self.ordering.active,
+            }, counters={
+                'func_request_timeouts_total': lambda: self.timeouts.expired,
+                'func_duplicate_events_total': lambda: self.dedup.duplicates,
+            })
         if hasattr(self.f, "handle") is not True:
             raise AttributeError("Function must implement a 'handle' method.")
+        # Synchronous hooks, and a synchronous handle, are run on a pool
+        self.executor = func_python.executor.Executor()
+        self.handle_is_async = func_python.executor.is_async(self.f.handle)
+        # A Router given as handle is dispatched to directly, so that
+        # synchronous routes are run on the executor
+        self.router = self.f.handle if isinstance(
+            self.f.handle, func_python.router.Router) else None
+        self.compression = func_python.compression.Compression(
+            executor=self.executor)
+        self.liveness = func_python.health.Probe(
+            getattr(self.f, "alive", None), self.executor)
+        self.readiness = func_python.health.Probe(
+            getattr(self.f, "ready", None), self.executor)
+        self.warmup = func_python.warmup.Warmup(self.f, self.executor)
 
         # Inform the user via logs that defaults will be used for health
         # endpoints if no matchin methods were provided.
@@ -74,39 +203,56 @@ class ASGIApplication():
                 "implementation for readiness checks."
             )
 
-    def serve(self):
+    def serve(self, config=None, reuse_port=False, shared=None):
         """serve serving this ASGIhandler, delegating implementation of
            methods as necessary to the wrapped Function instance"""
-        cfg = hypercorn.config.Config()
-        cfg.bind = func_python.sock.bind()
+        cfg = func_python.config.hypercorn_config(config)
+        cfg.bind = func_python.sock.bind(reuse_port=reuse_port, backlog=cfg.backlog,
+                                         shared=shared)
+        self.profile.mark("bind")
 
         logging.info(f"function starting on {cfg.bind}")
-        return asyncio.run(self._serve(cfg))
+        return func_python.config.run(self._serve(cfg))
 
     async def _serve(self, cfg):
+        import hypercorn.asyncio
+        self.profile.mark("server")
+
         loop = asyncio.get_event_loop()
         loop.add_signal_handler(signal.SIGINT, self._handle_signal)
         loop.add_signal_handler(signal.SIGTERM, self._handle_signal)
 
-        await hypercorn.asyncio.serve(self, cfg)
+        await hypercorn.asyncio.serve(self, cfg,
+                                      shutdown_trigger=self.drain.trigger)
 
     def _handle_signal(self):
-        logging.info("Signal received: initiating shutdown")
+        self.drain.signal()
         self.stop_event.set()
 
     async def on_start(self):
         """on_start handles the ASGI server start event, delegating control
            to the internal Function instance if it has a "start" method."""
         if hasattr(self.f, "start"):
-            self.f.start(os.environ.copy())
+            await self.executor.call(self.f.start, os.environ.copy())
         else:
             logging.debug("function does not implement 'start'. Skipping.")
+        if self.router is not None:
+            self.router.compile()
+        self.liveness.start()
+        self.readiness.start()
+        self.warmup.start(self.warm_up)
 
     async def on_stop(self):
+        await self.drain.stop()
+        await self.warmup.stop()
+        await self.liveness.stop()
+        await self.readiness.stop()
         if hasattr(self.f, "stop"):
-            self.f.stop()
+            await self.executor.call(self.f.stop)
         else:
             logging.debug("function does not implement 'stop'. Skipping.")
+        await Emitter.stop_all()
+        self.executor.shutdown()
         self.stop_event.set()
 
     async def __call__(self, scope, receive, send):
@@ -122,6 +268,7 @@ class ASGIApplication():
                                     'message': str(e)})
                         return
                     await send({'type': 'lifespan.startup.complete'})
+                    self.profile.mark("lifespan startup")
                 elif message['type'] == 'lifespan.shutdown':
                     await self.on_stop()
                     await send({'type': 'lifespan.shutdown.complete'})
@@ -137,120 +284,542 @@ class ASGIApplication():
                                  )
             return
 
+        if self._first_request:
+            self._first_request = False
+            self.profile.mark("first request")
+
         # Route request
         try:
             if scope['path'] == '/health/liveness':
                 await self.handle_liveness(scope, receive, send)
             elif scope['path'] == '/health/readiness':
                 await self.handle_readiness(scope, receive, send)
+            elif self.metrics is not None and \
+                    scope['path'] == self.metrics.path:
+                await self.metrics.respond(send)
             else:
-                # CloudEvents Middleware
-                # Currently the http and cloudevents middleware implementations
-                # are identical with the exception of this section which
-                # reads the request as a CloudEvent and adds it to the scope,
-                # and sends a response CloudEvent if returned.
-                # Should this implementation prove adequate, we can combine
-                # into a single middleware with a swithch to enable this
-                # interstitial encode/decode, and thus avoid the approx. 200
-                # lines of shared server boilerplate.
-                #
-                try:
-                    # Decode the event and make it available in the scope
-                    scope["event"] = await decode_event(scope, receive)
-                    # Wrap the sender in a CloudEventSender
-                    send = CloudEventSender(send)
-                    # Delegate processing to user's Function
-                    await self.f.handle(scope, receive, send)
-                except (CloudEventValidationError, ValueError) as e:
-                    # Log the non-CloudEvent request for debugging
-                    logging.warning(f"Received non-CloudEvent request: {scope['method']} {scope['path']}")
-                    headers_dict = {k.decode('utf-8'): v.decode('utf-8') for k, v in scope.get('headers', [])}
-                    logging.debug(f"Request headers: {headers_dict}")
-
-                    # Return 400 Bad Request for non-CloudEvent requests
-                    await send({
-                        'type': 'http.response.start',
-                        'status': 400,
-                        'headers': [[b'content-type', b'text/plain']]
-                    })
-                    await send({
-                        'type': 'http.response.body',
-                        'body': b'Bad Request: This endpoint expects CloudEvent requests. '
-                    })
-                    return
+                await self.handle_request(scope, receive, send)
         except Exception as e:
-            # For other unexpected errors, try to send a CloudEvent error response
-            # But check if send is already a CloudEventSender
-            if hasattr(send, 'structured'):
+            # Errors raised by the Function are sent as CloudEvents by
+            # handle_request; fallback to plain HTTP for all others.
+            logging.error(f"Unexpected error: {e}")
+            await send_exception(send, 500, f"Internal Server Error: {e}".encode())
+
+    async def handle_request(self, scope, receive, send):
+        """handle_request admits the request, shedding it with a 503 if the
+           function is overloaded, and then decodes the event and invokes the
+           function."""
+        try:
+            await self.limiter.acquire()
+        except func_python.limiter.Overloaded:
+            await self.limiter.reject(send)
+            return
+        receive = func_python.body.BodyReceiver(
+            receive, scope, self.max_body_size, self.decompress,
+            self.max_decompressed_size)
+        # The response is recorded for metrics, and to know whether a
+        # request which times out can still be answered with a 504.
+        if self.metrics is not None or self.timeouts.enabled:
+            send = recorder = func_python.metrics.Recorder(send)
+        # Plain HTTP errors are sent with the sender as it is before being
+        # wrapped in a CloudEventSender, as lazily decoded events can raise
+        # them from within the handler.
+        respond = send
+        capture = None
+        started = time.perf_counter()
+        try:
+            # CloudEvents Middleware
+            # Currently the http and cloudevents middleware implementations
+            # are identical with the exception of this section which
+            # reads the request as a CloudEvent and adds it to the scope,
+            # and sends a response CloudEvent if returned.
+            # Should this implementation prove adequate, we can combine
+            # into a single middleware with a swithch to enable this
+            # interstitial encode/decode, and thus avoid the approx. 200
+            # lines of shared server boilerplate.
+            #
+            try:
+                # Decode the event and make it available in the scope.
+                # Batches are made available as a list.
+                event = await decode_event(scope, receive, self.max_body_size,
+                                           self.lazy_events)
+                if isinstance(event, list):
+                    scope["event"], scope["events"] = None, event
+                else:
+                    scope["event"] = event
+                # Wrap the sender in a CloudEventSender, compressing its
+                # responses if enabled
+                if self.compression.enabled:
+                    send = self.compression.wrap(scope, send)
+                # Duplicates of events already handled are answered without
+                # invoking the Function
+                if self.dedup.enabled and scope["event"] is not None:
+                    key = (event.get_source(), event.get_id())
+                    response = await self.dedup.acquire(key)
+                    if response is not None:
+                        await func_python.dedup.send_response(send, response)
+                        return
+                    send = capture = func_python.dedup.Capture(send)
+                send = CloudEventSender(send)
+                # Delegate processing to user's Function
+                if "events" in scope and self.batch_parallelism > 0:
+                    handler = self.fan_out(scope, receive, send)
+                else:
+                    handler = self.ordered(scope["event"],
+                                           self.invoke(scope, receive, send))
+                timeout = self.timeouts.enabled and self.timeouts.get(
+                    scope['path'], event.get_type() if scope["event"] else None)
+                if not timeout:
+                    await handler
+                elif await self.timeouts.run(handler, scope, timeout) \
+                        and not recorder.started:
+                    await send_exception_cloudevent(send, 504,
+                                                    "Error: timed out")
+            except func_python.body.BodyTooLarge as e:
+                logging.warning(f"Rejected CloudEvent request: {e}")
+                await send_exception(respond, 413, f"Error: {e}")
+                return
+            except func_python.body.UnsupportedEncoding as e:
+                logging.warning(f"Rejected CloudEvent request: {e}")
+                await send_exception(respond, 415, f"Error: {e}")
+                return
+            except func_python.body.InvalidBody as e:
+                logging.warning(f"Rejected CloudEvent request: {e}")
+                await send_exception(respond, 400, f"Error: {e}")
+                return
+            except (CloudEventValidationError, ValueError) as e:
+                # Log the non-CloudEvent request for debugging
+                logging.warning(f"Received non-CloudEvent request: {scope['method']} {scope['path']}")
+                headers_dict = {k.decode('utf-8'): v.decode('utf-8') for k, v in scope.get('headers', [])}
+                logging.debug(f"Request headers: {headers_dict}")
+
+                # Return 400 Bad Request for non-CloudEvent requests
+                await respond({
+                    'type': 'http.response.start',
+                    'status': 400,
+                    'headers': [[b'content-type', b'text/plain']]
+                })
+                await respond({
+                    'type': 'http.response.body',
+                    'body': b'Bad Request: This endpoint expects CloudEvent requests. '
+                })
+                return
+            except Exception as e:
+                # For other unexpected errors, try to send a CloudEvent error
+                # response, if send is already a CloudEventSender
+                if not hasattr(send, 'structured'):
+                    raise
                 await send_exception_cloudevent(send, 500, f"Error: {e}")
-            else:
-                # Fallback to plain HTTP error
-                logging.error(f"Unexpected error: {e}")
-                await send_exception(send, 500, f"Internal Server Error: {e}".encode())
+        finally:
+            if capture is not None:
+                await self.dedup.release(key, capture)
+            self.limiter.release()
+            if self.metrics is not None:
+                event = scope.get("event")
+                self.metrics.observe(time.perf_counter() - started,
+                                     recorder.status or 500, receive.received,
+                                     recorder.size,
+                                     event.get_type() if event else None)
 
-    async def handle_liveness(self, scope, receive, send):
-        alive = True
-        message = "OK"
-        if hasattr(self.f, "alive"):
-            result = self.f.alive()
-            # The message return is optional
-            if isinstance(result, tuple):
-                alive, message = result
-            else:
-                alive = result
+    async def fan_out(self, scope, receive, send):
+        """fan_out invokes the Function once for each event of a batch, with
+           at most batch_parallelism running at once, and replies with the
+           batch of events they sent."""
+        semaphore = asyncio.Semaphore(self.batch_parallelism)
+
+        async def handle(event):
+            collector = BatchCollector()
+            await self.ordered(event, limit(
+                self.invoke(dict(scope, event=event), receive, collector)))
+            return collector.events
+
+        async def limit(coro):
+            async with semaphore:
+                await coro
+
+        results = await asyncio.gather(
+            *(handle(e) for e in scope.pop("events")), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        await send.batch([e for events in results for e in events])
+
+    async def warm_up(self, request):
+        """warm_up sends a synthetic request through the function, discarding
+           the response.  The request may also be a CloudEvent, which is
+           sent in binary mode."""
+        if not isinstance(request, dict):
+            request = {
+                "headers": binary_headers(request),
+                "body": EVENT_FORMAT.write_data(
+                    request.get_data(), request.get_datacontenttype()),
+            }
+        scope, receive = func_python.warmup.request(request)
+        receive = func_python.body.BodyReceiver(receive, scope)
+        event = await decode_event(scope, receive, lazy=self.lazy_events)
+        if isinstance(event, list):
+            scope["event"], scope["events"] = None, event
+        else:
+            scope["event"] = event
+        send = CloudEventSender(func_python.warmup.discard)
+        if "events" in scope and self.batch_parallelism > 0:
+            await self.fan_out(scope, receive, send)
+        else:
+            await self.invoke(scope, receive, send)
 
-        if alive:
-            await send({'type': 'http.response.start', 'status': 200,
-                        'headers': [[b'content-type', b'text/plain']]})
+    def ordered(self, event, coro):
+        """ordered returns the handler coroutine for the event, to be run
+           after earlier events of the same key if events are ordered."""
+        if not self.ordering.enabled or event is None:
+            return coro
+        key = self.ordering.key(event)
+        if key is None:
+            return coro
+        return self.ordering.run(key, coro)
+
+    async def invoke(self, scope, receive, send):
+        """invoke the Function's handler, or the route for the event if it
+           is a Router, on the executor if it is not a coroutine function."""
+        handle, is_async = self.f.handle, self.handle_is_async
+        if self.router is not None:
+            route = self.router.resolve(scope.get("event"))
+            if route is None:
+                # Events of a batch which match no route are dropped
+                if not isinstance(send, BatchCollector):
+                    await self.router.respond_unrouted(send)
+                return
+            handle, is_async = route
+        if is_async:
+            await handle(scope, receive, send)
         else:
-            await send({'type': 'http.response.start', 'status': 500,
-                        'headers': [[b'content-type', b'text/plain']]})
+            await self.executor.handle(handle, scope, receive, send)
 
-        await send({'type': 'http.response.body',
-                    'body': f'{message}'.encode('utf-8'),
-                    })
+    async def handle_liveness(self, scope, receive, send):
+        await self.liveness.respond(send)
 
     async def handle_readiness(self, scope, receive, send):
-        ready = True
-        message = "OK"
-        if hasattr(self.f, "ready"):
-            result = self.f.ready()
-            # The message return is optional
-            if isinstance(result, tuple):
-                ready, message = result
-            else:
-                ready = result
+        # Report not ready while draining, warming up or overloaded, so that
+        # traffic is routed elsewhere, and expose the admission gauges
+        # (and so drain progress) either way.
+        if self.drain.draining or not self.warmup.done:
+            start, body = self.drain.response if self.drain.draining \
+                else self.warmup.response
+            await send(dict(start, headers=start['headers']
+                            + self.limiter.gauges()))
+            await send(body)
+            return
+        if self.limiter.overloaded:
+            await self.limiter.reject(send, self.limiter.gauges())
+            return
+        await self.readiness.respond(send, self.limiter.gauges())
+
+
+async def decode_event(scope, receive, max_size=0, lazy=False):
+    """Decode the request as a CloudEvent.  A request in the batched content
+    mode is decoded as a list of CloudEvents.  If lazy, a request in the
+    binary content mode is decoded as a LazyEvent, without reading the
+    body."""
+    if lazy and is_binary(scope):
+        return LazyEvent(scope.get("headers", []), receive, max_size,
+                         func_python.body.content_length(scope))
+    body = await func_python.body.read_body(
+        receive, max_size, func_python.body.content_length(scope))
+    if is_binary(scope):
+        attributes = binary_attributes(scope["headers"])
+        factory = event_factory(
+            attributes.get("specversion", SPECVERSION_V1_0))
+        return factory(attributes, EVENT_FORMAT.read_data(
+            body, attributes.get("datacontenttype")))
+    if content_type(scope).startswith(BATCH_CONTENT_TYPE):
+        return decode_batch(body)
+    return EVENT_FORMAT.read(None, body)
+
+
+def event_factory(specversion):
+    """Returns the CloudEvent class for a specversion, defaulting to 1.0 as
+    do the cloudevents bindings.  The 0.3 class is imported when first
+    needed, rather than with the bindings on startup."""
+    if specversion == SPECVERSION_V0_3:
+        from cloudevents.core.v03.event import CloudEvent as CloudEventV03
+        return CloudEventV03
+    return CloudEvent
+
+
+def content_type(scope):
+    for k, v in scope.get("headers", []):
+        if k.lower() == b"content-type":
+            return v.decode("latin-1")
+    return ""
+
+
+def binary_attributes(headers):
+    """Decode the attributes of a binary mode CloudEvent directly from the
+    ASGI header list."""
+    attributes = {}
+    for k, v in headers:
+        if k[:3].lower() == b"ce-":
+            name = _attribute_names.get(k)
+            if name is None:
+                name = k[3:].decode("utf-8").lower()
+                if len(_attribute_names) < MAX_CACHED_HEADERS:
+                    _attribute_names[k] = name
+            value = v.decode("utf-8")
+            if "%" in value:
+                value = urllib.parse.unquote(value)
+            attributes[name] = value
+        elif k.lower() == b"content-type":
+            attributes["datacontenttype"] = v.decode("utf-8")
+    if "time" in attributes:
+        attributes["time"] = isoparse(attributes["time"])
+    return attributes
+
+
+def binary_headers(event):
+    """Encode the attributes of an event as binary mode headers.  Headers
+    for the attributes shared by all events of a type are encoded once and
+    reused."""
+    attributes = event.get_attributes()
+    key = tuple(attributes.get(a) for a in TEMPLATE_ATTRIBUTES)
+    template = _templates.get(key)
+    if template is None:
+        template = [_binary_header(a, v)
+                    for a, v in zip(TEMPLATE_ATTRIBUTES, key) if v is not None]
+        if len(_templates) < MAX_CACHED_HEADERS:
+            _templates[key] = template
+    headers = list(template)
+    for name, value in attributes.items():
+        if value is not None and name not in TEMPLATE_ATTRIBUTES:
+            headers.append(_binary_header(name, value))
+    return headers
+
+
+def _binary_header(name, value):
+    if name == "datacontenttype":
+        return (b"content-type", str(value).encode("utf-8"))
+    header = _header_names.get(name)
+    if header is None:
+        header = b"ce-" + name.encode("utf-8")
+        if len(_header_names) < MAX_CACHED_HEADERS:
+            _header_names[name] = header
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+    else:
+        value = str(value)
+    if _UNSAFE_HEADER_VALUE.search(value):
+        value = urllib.parse.quote(value, safe="!#$&'()*+,-./:;<=>?@[\\]^_`{|}~")
+    return (header, value.encode("ascii"))
+
+
+def is_binary(scope):
+    """Returns true if the request is in the binary content mode"""
+    for k, _ in scope.get("headers", []):
+        if k[:3].lower() == b"ce-":
+            return True
+    return False
+
+
+class LazyEvent:
+    """
+    LazyEvent is a CloudEvent in the binary content mode, decoded on demand.
+
+    Attributes are read from the request's ce- headers, and are available
+    immediately with the usual getters (get_type etc.).  The request body is
+    not read until requested:
+
+        body = await event.body()   # the raw data, unparsed
+        data = await event.data()   # the data, parsed per datacontenttype
+        event = await event.load()  # a complete CloudEvent
+
+    After any of these, get_data returns the parsed data as it does for a
+    CloudEvent.
+    """
+
+    def __init__(self, headers, receive, max_size=0, length=None):
+        attributes = binary_attributes(headers)
+        missing = [a for a in REQUIRED_ATTRIBUTES if a not in attributes]
+        if missing:
+            raise ValueError(f"missing required attributes: {missing}")
+        self._attributes = attributes
+        self._receive = receive
+        self._max_size = max_size
+        self._length = length
+        self._body = None
+        self._data = None
+        self._parsed = False
+        self._event = None
+
+    def get_id(self):
+        return self._attributes["id"]
+
+    def get_source(self):
+        return self._attributes["source"]
+
+    def get_type(self):
+        return self._attributes["type"]
+
+    def get_specversion(self):
+        return self._attributes["specversion"]
+
+    def get_datacontenttype(self):
+        return self._attributes.get("datacontenttype")
+
+    def get_dataschema(self):
+        return self._attributes.get("dataschema")
+
+    def get_subject(self):
+        return self._attributes.get("subject")
+
+    def get_time(self):
+        return self._attributes.get("time")
+
+    def get_extension(self, extension_name):
+        return self._attributes.get(extension_name)
+
+    def get_attributes(self):
+        return self._attributes
+
+    def get_data(self):
+        if self._body is None:
+            raise RuntimeError("the data of a LazyEvent must first be "
+                               "received with 'await event.data()'")
+        if not self._parsed:
+            self._data = EVENT_FORMAT.read_data(
+                self._body, self.get_datacontenttype())
+            self._parsed = True
+        return self._data
+
+    async def body(self):
+        """Receive the event's data without parsing it"""
+        if self._body is None:
+            self._body = await func_python.body.read_body(
+                self._receive, self._max_size, self._length)
+        return self._body
+
+    async def data(self):
+        """Receive the event's data, parsed per its datacontenttype"""
+        await self.body()
+        return self.get_data()
+
+    async def load(self):
+        """Receive the event's data and return the complete CloudEvent"""
+        if self._event is None:
+            data = await self.data()
+            factory = event_factory(self.get_specversion())
+            self._event = factory(dict(self._attributes), data)
+        return self._event
+
+
+def decode_batch(body):
+    """Decode the body of a batched content mode request: a JSON array of
+    structured CloudEvents."""
+    items = EVENT_FORMAT.codec.loads(body)
+    if not isinstance(items, list):
+        raise ValueError("a CloudEvent batch must be a JSON array")
+    return [event_from_dict(item) for item in items]
 
-        if ready:
-            await send({'type': 'http.response.start', 'status': 200,
-                        'headers': [[b'content-type', b'text/plain']]})
+
+def event_from_dict(attributes, factory=None):
+    """Create a CloudEvent from its decoded JSON structured representation,
+    as does the JSON format for a single event."""
+    if not isinstance(attributes, dict):
+        raise ValueError("a structured CloudEvent must be a JSON object")
+    if factory is None:
+        specversion = attributes.get("specversion", SPECVERSION_V1_0)
+        factory = event_factory(specversion)
+    if "time" in attributes:
+        attributes["time"] = isoparse(attributes["time"])
+    data = attributes.pop("data", None)
+    if data is None:
+        data_base64 = attributes.pop("data_base64", None)
+        if data_base64 is not None:
+            data = base64.b64decode(data_base64)
+    elif isinstance(data, str) and \
+            attributes.get("datacontentencoding", "").lower() == "base64":
+        data = base64.b64decode(data)  # v0.3
+    return factory(attributes, data)
+
+
+def decode_data(event):
+    """Returns the event's data, decoding it with the JSON codec if it is
+    bytes, or a string with a JSON content type.  Other data, and data which
+    is not valid JSON, is returned unchanged."""
+    data = event.get_data()
+    if isinstance(data, (bytes, bytearray)) or (
+            isinstance(data, str) and
+            EVENT_FORMAT.is_json(event.get_datacontenttype())):
+        try:
+            return EVENT_FORMAT.codec.loads(data)
+        except ValueError:
+            pass
+    return data
+
+
+class EventFormat(JSONFormat):
+    """EventFormat is the JSON event format, using the fastest installed
+    JSON codec (see func_python.codec) for events and their JSON data."""
+
+    def __init__(self, codec=None):
+        self.codec = codec or func_python.codec.select()
+
+    def is_json(self, datacontenttype):
+        return self.JSON_CONTENT_TYPE_PATTERN.match(
+            datacontenttype or self.DEFAULT_CONTENT_TYPE) is not None
+
+    def read(self, event_factory, data):
+        return event_from_dict(self.codec.loads(data), event_factory)
+
+    def write(self, event):
+        return self.codec.dumps(self.to_dict(event))
+
+    def to_dict(self, event):
+        """The structured representation of the event, before encoding"""
+        data = event.get_data()
+        attributes = dict(event.get_attributes())
+        if data is None:
+            return attributes
+        if isinstance(data, (bytes, bytearray)):
+            encoded = base64.b64encode(data).decode("utf-8")
+            if attributes.get("specversion") == SPECVERSION_V0_3:
+                attributes["datacontentencoding"] = "base64"
+                attributes["data"] = encoded
+            else:
+                attributes["data_base64"] = encoded
+        elif self.is_json(attributes.get("datacontenttype")):
+            attributes["data"] = data
         else:
-            await send({'type': 'http.response.start', 'status': 500,
-                        'headers': [[b'content-type', b'text/plain']]})
+            attributes["data"] = str(data)
+        return attributes
+
+    def write_data(self, data, datacontenttype):
+        if isinstance(data, dict):
+            try:
+                return self.codec.dumps(data)
+            except TypeError:
+                pass
+        return super().write_data(data, datacontenttype)
 
-        await send({'type': 'http.response.body',
-                    'body': f'{message}'.encode('utf-8'),
-                    })
+    def read_data(self, body, datacontenttype):
+        if not body:
+            return None
+        if self.is_json(datacontenttype):
+            try:
+                return self.codec.loads(body)
+            except ValueError:
+                pass
+        try:
+            return body.decode("utf-8")
+        except UnicodeDecodeError:
+            return body
 
 
-async def decode_event(scope, receive):
-    body = await receive_body(receive)
-    headers = {
-        k.decode("utf-8").lower(): v.decode("utf-8")
-        for k, v in scope.get("headers", [])
-    }
-    return from_http_event(HTTPMessage(headers=headers, body=body))
+EVENT_FORMAT = EventFormat()
 
 
 async def receive_body(receive):
     """For CloudEvents: receive the body and return it as bytes"""
-    body = b""
-    more_body = True
-    while more_body:
-        message = await receive()
-        body += message.get("body", b"")
-        more_body = message.get("more_body", False)
-    return body
+    return await func_python.body.read_body(receive)
 
 
 async def send_exception(send, code, message):
@@ -281,11 +850,10 @@ async def send_exception_cloudevent(send, status, message):
             'status': status,
             'headers': [[b'content-type', b'application/json']]
         })
-        import json
-        error_body = json.dumps({"error": {"message": message, "type": "dev.functions.error"}})
+        error_body = EVENT_FORMAT.codec.dumps({"error": {"message": message, "type": "dev.functions.error"}})
         await send({
             'type': 'http.response.body',
-            'body': error_body.encode()
+            'body': error_body
         })
 
 
@@ -301,13 +869,19 @@ class CloudEventSender:
 
     async def structured(self, event, status=200):
         """send as a structured cloudevent"""
-        msg = to_structured_event(event)
-        await self._send_encoded_cloudevent(msg.headers, msg.body, status)
+        await self._send_encoded_cloudevent(
+            STRUCTURED_HEADERS, EVENT_FORMAT.write(event), status)
 
     async def binary(self, event, status=200):
         """send as a binary cloudevent"""
-        msg = to_binary_event(event)
-        await self._send_encoded_cloudevent(msg.headers, msg.body, status)
+        body = EVENT_FORMAT.write_data(event.get_data(),
+                                       event.get_datacontenttype())
+        await self._send_encoded_cloudevent(binary_headers(event), body, status)
+
+    async def batch(self, events, status=200):
+        """send as a batch of structured cloudevents"""
+        body = b"[" + b",".join(EVENT_FORMAT.write(e) for e in events) + b"]"
+        await self._send_encoded_cloudevent(BATCH_HEADERS, body, status)
 
     async def http(self, message):
         """Send a raw http response, bypassing the automatic cloudevent
@@ -315,11 +889,11 @@ class CloudEventSender:
         await self._send(message)
 
     async def _send_encoded_cloudevent(self, headers, body, status=200):
-        """Send the given cloudevent headers and body."""
-        headers = [
-            (k.encode(), v.encode())
-            for k, v in headers.items()
-        ] + [(b"content-length", str(len(body)).encode())]
+        """Send the given cloudevent headers and body.  The headers are a
+        list of encoded (name, value) pairs, or a dict to be encoded."""
+        if isinstance(headers, dict):
+            headers = [(k.encode(), v.encode()) for k, v in headers.items()]
+        headers = headers + [(b"content-length", str(len(body)).encode())]
 
         await self._send({
             "type": "http.response.start",
@@ -331,3 +905,207 @@ class CloudEventSender:
             "type": "http.response.body",
             "body": body,
         })
+
+
+class BatchCollector:
+    """A sender used when fanning a batch out to the Function one event at a
+    time.  Events sent are collected to be returned together as a batch."""
+
+    def __init__(self):
+        self.events = []
+
+    async def __call__(self, event, status: int = 200):
+        self.events.append(event)
+
+    async def structured(self, event, status=200):
+        self.events.append(event)
+
+    async def binary(self, event, status=200):
+        self.events.append(event)
+
+    async def batch(self, events, status=200):
+        self.events.extend(events)
+
+    async def http(self, message):
+        raise ValueError("raw http responses can not be sent for an event "
+                         "which is part of a batch")
+
+
+class Emitter:
+    """
+    Emitter sends CloudEvents to a sink, by default 'K_SINK' as set by a
+    SinkBinding or a source's sink:
+
+        def start(self, env):
+            self.emitter = Emitter(env.get("K_SINK"))
+
+        async def handle(self, scope, receive, send):
+            await self.emitter.emit(event)
+
+    Events are buffered in memory, up to buffer_size ('FUNC_EMIT_BUFFER_SIZE'),
+    beyond which emit waits, and are sent in the background in batches of up
+    to batch_size ('FUNC_EMIT_BATCH_SIZE') collected for at most linger
+    seconds ('FUNC_EMIT_LINGER').  The events of a batch are sent in binary
+    mode concurrently, over a pool of keep-alive connections (see
+    func_python.client.Pool), or as a single batched mode request if
+    batched is set ('FUNC_EMIT_BATCHED') for sinks which accept them.
+
+    Events which fail to send, with a connection error, a timeout, a 408,
+    429 or 5xx response, are retried up to retries times ('FUNC_EMIT_RETRIES')
+    with exponential backoff from backoff seconds ('FUNC_EMIT_BACKOFF') and
+    full jitter.  Events which still fail, or are rejected, are logged and
+    dropped.  The buffer is flushed by stop(), and emitters which have not
+    been stopped are stopped once the Function has stopped.
+    """
+
+    _running = set()
+
+    def __init__(self, sink: str | None = None,
+                 buffer_size: int | None = None,
+                 batch_size: int | None = None, linger: float | None = None,
+                 batched: bool | None = None, retries: int | None = None,
+                 backoff: float | None = None,
+                 connections: int = func_python.client.DEFAULT_POOL_SIZE,
+                 timeout: float = func_python.client.DEFAULT_REQUEST_TIMEOUT):
+        if sink is None:
+            sink = os.getenv('K_SINK')
+        if not sink:
+            raise ValueError("no sink to emit events to: K_SINK is not set")
+        if buffer_size is None:
+            buffer_size = int(os.getenv('FUNC_EMIT_BUFFER_SIZE',
+                                        DEFAULT_EMIT_BUFFER_SIZE))
+        if batch_size is None:
+            batch_size = int(os.getenv('FUNC_EMIT_BATCH_SIZE',
+                                       DEFAULT_EMIT_BATCH_SIZE))
+        if linger is None:
+            linger = float(os.getenv('FUNC_EMIT_LINGER', DEFAULT_EMIT_LINGER))
+        if batched is None:
+            batched = os.getenv('FUNC_EMIT_BATCHED', 'false').lower() \
+                in ('1', 'true', 'yes')
+        if retries is None:
+            retries = int(os.getenv('FUNC_EMIT_RETRIES', DEFAULT_EMIT_RETRIES))
+        if backoff is None:
+            backoff = float(os.getenv('FUNC_EMIT_BACKOFF',
+                                      DEFAULT_EMIT_BACKOFF))
+        self.sink = sink
+        self.buffer_size = buffer_size
+        self.batch_size = max(1, batch_size)
+        self.linger = linger
+        self.batched = batched
+        self.retries = retries
+        self.backoff = backoff
+        self.connections = connections
+        self.timeout = timeout
+        self.sent = 0
+        self.failed = 0
+        self._pool = None
+        self._queue = None
+        self._worker = None
+
+    async def emit(self, event):
+        """ Buffer the event to be sent, waiting if the buffer is full """
+        if self._worker is None:
+            self._start()
+        await self._queue.put(event)
+
+    async def flush(self):
+        """ Wait for the events buffered to be sent (or dropped) """
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self, timeout: float | None = None):
+        """ Flush the buffer, waiting at most timeout seconds, and close the
+        connections """
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"dropping {self._queue.qsize()} events not "
+                            f"sent to {self.sink} within {timeout}s")
+        finally:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            Emitter._running.discard(self)
+            await self._pool.close()
+
+    @classmethod
+    async def stop_all(cls):
+        for emitter in list(cls._running):
+            await emitter.stop()
+
+    def _start(self):
+        self._pool = func_python.client.Pool(self.sink, self.connections,
+                                             self.timeout)
+        self._queue = asyncio.Queue(self.buffer_size)
+        self._worker = asyncio.create_task(self._run())
+        Emitter._running.add(self)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.linger
+            while len(batch) < self.batch_size:
+                if self._queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(
+                            self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(self._queue.get_nowait())
+            try:
+                if self.batched:
+                    await self._send(batch, *self._encode_batch(batch))
+                else:
+                    encoded = [self._encode(e) for e in batch]
+                    await asyncio.gather(*(self._send([e], *args)
+                                           for e, args in zip(batch, encoded)))
+            except Exception as e:
+                self.failed += len(batch)
+                logging.error(f"failed to send {len(batch)} events to "
+                              f"{self.sink} ({type(e).__name__}: {e})")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _encode(self, event):
+        return binary_headers(event), EVENT_FORMAT.write_data(
+            event.get_data(), event.get_datacontenttype())
+
+    def _encode_batch(self, events):
+        return BATCH_HEADERS, \
+            b"[" + b",".join(EVENT_FORMAT.write(e) for e in events) + b"]"
+
+    async def _send(self, events, headers, body):
+        """ Send the encoded events, retrying as necessary """
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(random.uniform(0, min(
+                    MAX_EMIT_BACKOFF, self.backoff * 2 ** (attempt - 1))))
+            try:
+                response = await self._pool.request("POST", headers, body)
+            except (OSError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__}: {e}"
+                continue
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                break
+            if 200 <= response.status < 300:
+                self.sent += len(events)
+                return
+            error = f"status {response.status}"
+            if response.status not in RETRY_STATUSES \
+                    and response.status < 500:
+                break
+        self.failed += len(events)
+        logging.error(f"failed to send {len(events)} events to {self.sink} "
+                      f"({error})")
@@ -0,0 +1,103 @@
+import datetime
+import json
+import logging
+import os
+
+DEFAULT_JSON_CODEC = 'auto'
+
+
+class Codec:
+    """
+    Codec encodes and decodes JSON.  The standard library implementation is
+    always available; faster implementations are used when installed.
+
+    loads raises a ValueError for invalid input, and dumps a TypeError for
+    values which can not be encoded.  Datetimes are encoded as RFC 3339
+    strings, with UTC as "Z".  The exception is msgspec, which encodes
+    bytes as base64 strings rather than raising a TypeError.
+    """
+
+    name = 'json'
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj, default=_default,
+                          separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonCodec(Codec):
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._loads = orjson.loads
+        self._dumps = orjson.dumps
+        self._options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def loads(self, data):
+        return self._loads(data)
+
+    def dumps(self, obj) -> bytes:
+        return self._dumps(obj, option=self._options)
+
+
+class MsgspecCodec(Codec):
+    """ Unlike the other codecs, bytes are encoded as base64 strings """
+
+    name = 'msgspec'
+
+    def __init__(self):
+        import msgspec
+        self._decoder = msgspec.json.Decoder()
+        self._encoder = msgspec.json.Encoder()
+
+    def loads(self, data):
+        return self._decoder.decode(data)
+
+    def dumps(self, obj) -> bytes:
+        return self._encoder.encode(obj)
+
+
+CODECS = {
+    'orjson': OrjsonCodec,
+    'msgspec': MsgspecCodec,
+    'json': Codec,
+}
+
+
+def select(name: str | None = None) -> Codec:
+    """
+    Returns the JSON codec named by 'FUNC_JSON_CODEC' (one of "orjson",
+    "msgspec" or "json"), unless given explicitly.  The default, "auto",
+    selects the first of these which is installed.
+    """
+    if name is None:
+        name = os.getenv('FUNC_JSON_CODEC', DEFAULT_JSON_CODEC)
+    if name == 'auto':
+        codec = None
+        for cls in CODECS.values():
+            try:
+                codec = cls()
+                break
+            except ImportError:
+                continue
+    elif name in CODECS:
+        codec = CODECS[name]()
+    else:
+        raise ValueError(f"unknown JSON codec: <{name}>")
+    # Not logged with logging.debug, which would configure the root logger
+    # when called on import, before the Function configures it.
+    logging.getLogger(__name__).debug(f"using JSON codec {codec.name}")
+    return codec
+
+
+def _default(obj):
+    if isinstance(obj, datetime.datetime):
+        dt = obj.isoformat()
+        if dt.endswith("+00:00"):
+            dt = dt[:-6] + "Z"
+        return dt
+    raise TypeError(f"Object of type {type(obj).__name__} "
+                    "is not JSON serializable")
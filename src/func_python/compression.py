@@ -0,0 +1,336 @@
+import logging
+import os
+import zlib
+
+DEFAULT_COMPRESSION = ''  # disabled
+DEFAULT_COMPRESSION_MIN_SIZE = 1024  # bytes
+DEFAULT_COMPRESSION_OFFLOAD_SIZE = 65536  # bytes
+
+# Content types worth compressing.  Others (images, archives, ...) are
+# usually compressed already.
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/xml',
+                      'application/javascript', 'application/cloudevents',
+                      'application/x-ndjson', 'image/svg+xml')
+COMPRESSIBLE_SUFFIXES = ('+json', '+xml')
+
+# Bound on the cache of negotiated Accept-Encoding values
+MAX_CACHED_ACCEPT = 256
+
+
+class Gzip:
+    name = 'gzip'
+
+    def compress(self, data: bytes) -> bytes:
+        c = zlib.compressobj(6, zlib.DEFLATED, 31)
+        return c.compress(data) + c.flush()
+
+    def stream(self):
+        return _GzipStream()
+
+
+class _GzipStream:
+    __slots__ = ('_c',)
+
+    def __init__(self):
+        self._c = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+
+class Brotli:
+    name = 'br'
+
+    def __init__(self):
+        import brotli
+        self._brotli = brotli
+
+    def compress(self, data: bytes) -> bytes:
+        return self._brotli.compress(data, quality=4)
+
+    def stream(self):
+        return _BrotliStream(self._brotli.Compressor(quality=4))
+
+
+class _BrotliStream:
+    __slots__ = ('_c',)
+
+    def __init__(self, c):
+        self._c = c
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data) + self._c.flush()
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+class Zstd:
+    name = 'zstd'
+
+    def __init__(self):
+        import zstandard
+        self._zstd = zstandard
+        self._compressor = zstandard.ZstdCompressor(level=3)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def stream(self):
+        return _ZstdStream(self._compressor.compressobj(),
+                           self._zstd.COMPRESSOBJ_FLUSH_BLOCK)
+
+
+class _ZstdStream:
+    __slots__ = ('_c', '_block')
+
+    def __init__(self, c, block):
+        self._c = c
+        self._block = block
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data) + self._c.flush(self._block)
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+
+ENCODINGS = {
+    'br': Brotli,
+    'zstd': Zstd,
+    'gzip': Gzip,
+}
+
+
+class Compression:
+    """
+    Compression encodes responses with the first of the encodings listed in
+    'FUNC_COMPRESSION' (for example "br,zstd,gzip") which the client accepts.
+    Brotli and zstd require the brotli and zstandard packages, and are
+    skipped if they are not installed.
+
+    Responses smaller than 'FUNC_COMPRESSION_MIN_SIZE' bytes, of content
+    types which are not compressible, or which are already encoded are sent
+    as they are.  Streamed responses are compressed as they are sent, and
+    larger than 'FUNC_COMPRESSION_OFFLOAD_SIZE' bytes are compressed on the
+    executor's offload pool rather than the event loop (not the pool which
+    synchronous handlers, which may be sending them, are run on).
+    """
+
+    def __init__(self, encodings: str | None = None,
+                 min_size: int | None = None,
+                 offload_size: int | None = None, executor=None):
+        if encodings is None:
+            encodings = os.getenv('FUNC_COMPRESSION', DEFAULT_COMPRESSION)
+        if min_size is None:
+            min_size = int(os.getenv('FUNC_COMPRESSION_MIN_SIZE',
+                                     DEFAULT_COMPRESSION_MIN_SIZE))
+        if offload_size is None:
+            offload_size = int(os.getenv('FUNC_COMPRESSION_OFFLOAD_SIZE',
+                                         DEFAULT_COMPRESSION_OFFLOAD_SIZE))
+        self.encoders = {}
+        for name in filter(None, (e.strip() for e in encodings.split(','))):
+            if name not in ENCODINGS:
+                raise ValueError(f"unknown compression encoding: <{name}>")
+            try:
+                self.encoders[name] = ENCODINGS[name]()
+            except ImportError:
+                logging.warning(f"{name} compression is not installed")
+        self.min_size = min_size
+        self.offload_size = offload_size
+        self.executor = executor
+        self._negotiated = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.encoders)
+
+    def wrap(self, scope, send):
+        """ Returns send wrapped to compress the response, if the request
+        accepts any of the encodings, or send itself otherwise. """
+        for k, v in scope.get("headers", ()):
+            if k == b"accept-encoding":
+                encoder = self.negotiate(v)
+                if encoder is not None:
+                    return Compressor(send, encoder, self)
+                break
+        return send
+
+    def negotiate(self, accept: bytes):
+        """ Returns the encoder for an Accept-Encoding value, if any """
+        try:
+            return self._negotiated[accept]
+        except KeyError:
+            pass
+        accepted = {}
+        for item in accept.decode('latin-1').lower().split(','):
+            name, _, params = item.strip().partition(';')
+            q = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            accepted[name.strip()] = q
+        encoder = None
+        for name, e in self.encoders.items():
+            if accepted.get(name, accepted.get('*', 0.0)) > 0:
+                encoder = e
+                break
+        if len(self._negotiated) < MAX_CACHED_ACCEPT:
+            self._negotiated[accept] = encoder
+        return encoder
+
+    async def compress(self, encoder, data: bytes) -> bytes:
+        if len(data) >= self.offload_size and self.executor is not None:
+            return await self.executor.offload(encoder.compress, data)
+        return encoder.compress(data)
+
+
+class _ZlibDecoder:
+    __slots__ = ('_d',)
+
+    def __init__(self, wbits):
+        self._d = zlib.decompressobj(wbits)
+
+    def decompress(self, data: bytes, limit: int | None) -> bytes:
+        """ Decompress the next chunk, producing at most limit bytes plus one
+        so that exceeding the limit is detected without inflating further.
+        A limit of None is unlimited. """
+        try:
+            return self._d.decompress(data, 0 if limit is None else limit + 1)
+        except zlib.error as e:
+            raise ValueError(f"invalid compressed body: {e}")
+
+    def finish(self) -> bytes:
+        if not self._d.eof:
+            raise ValueError("invalid compressed body: truncated")
+        return b''
+
+
+class _BrotliDecoder:
+    __slots__ = ('_d', '_brotli')
+
+    def __init__(self):
+        import brotli
+        self._brotli = brotli
+        self._d = brotli.Decompressor()
+
+    def decompress(self, data: bytes, limit: int | None) -> bytes:
+        try:
+            if limit is not None:
+                return self._d.process(data, output_buffer_limit=limit + 1)
+            return self._d.process(data)
+        except self._brotli.error as e:
+            raise ValueError(f"invalid compressed body: {e}")
+
+    def finish(self) -> bytes:
+        if not self._d.is_finished():
+            raise ValueError("invalid compressed body: truncated")
+        return b''
+
+
+# Decoders for request bodies, by Content-Encoding.  Each decompresses
+# incrementally with bounded output.  zstd is not included, as the zstandard
+# package can not bound the output of a chunk.
+DECODERS = {
+    'gzip': lambda: _ZlibDecoder(16 + zlib.MAX_WBITS),
+    'x-gzip': lambda: _ZlibDecoder(16 + zlib.MAX_WBITS),
+    'deflate': lambda: _ZlibDecoder(zlib.MAX_WBITS),
+    'br': _BrotliDecoder,
+}
+
+
+def decoder(encoding: str):
+    """ Returns a decoder for a request's Content-Encoding, or None if it is
+    not supported (or its package is not installed) """
+    factory = DECODERS.get(encoding.strip().lower())
+    if factory is None:
+        return None
+    try:
+        return factory()
+    except ImportError:
+        return None
+
+
+def compressible(content_type: bytes) -> bool:
+    content_type = content_type.decode('latin-1').split(';', 1)[0].strip()
+    return content_type.startswith(COMPRESSIBLE_TYPES) or \
+        content_type.endswith(COMPRESSIBLE_SUFFIXES)
+
+
+class Compressor:
+    """ Compressor wraps an ASGI send callable, compressing the response
+    with the negotiated encoder where that is worthwhile. """
+
+    __slots__ = ('_send', '_encoder', '_compression', '_start', '_stream')
+
+    def __init__(self, send, encoder, compression):
+        self._send = send
+        self._encoder = encoder
+        self._compression = compression
+        self._start = None  # the response start, until the body is seen
+        self._stream = None
+
+    async def __call__(self, message):
+        kind = message['type']
+        if kind == 'http.response.start':
+            headers = message.get('headers', ())
+            if self._compressible(headers):
+                self._start = message
+                return
+        elif kind == 'http.response.body' and (
+                self._start is not None or self._stream is not None):
+            await self._body(message)
+            return
+        elif self._start is not None:
+            # Bodies sent by other means, such as pathsend, are passed on
+            start, self._start = self._start, None
+            await self._send(start)
+        await self._send(message)
+
+    def _compressible(self, headers) -> bool:
+        compressible_type = False
+        for k, v in headers:
+            k = k.lower()
+            if k == b'content-encoding':
+                return False
+            if k == b'content-type':
+                compressible_type = compressible(v)
+        return compressible_type
+
+    async def _body(self, message):
+        body = message.get('body', b'')
+        more = message.get('more_body', False)
+        if self._stream is None:
+            start, self._start = self._start, None
+            if not more and len(body) < self._compression.min_size:
+                await self._send(start)
+                await self._send(message)
+                return
+            headers = [(k, v) for k, v in start.get('headers', ())
+                       if k.lower() != b'content-length']
+            headers.append((b'content-encoding', self._encoder.name.encode()))
+            headers.append((b'vary', b'accept-encoding'))
+            if not more:
+                body = await self._compression.compress(self._encoder, body)
+                headers.append((b'content-length', str(len(body)).encode()))
+                await self._send(dict(start, headers=headers))
+                await self._send({'type': 'http.response.body', 'body': body})
+                return
+            await self._send(dict(start, headers=headers))
+            self._stream = self._encoder.stream()
+        if len(body) >= self._compression.offload_size \
+                and self._compression.executor is not None:
+            body = await self._compression.executor.offload(
+                self._stream.compress, body)
+        elif body:
+            body = self._stream.compress(body)
+        if not more:
+            body += self._stream.finish()
+        await self._send({'type': 'http.response.body', 'body': body,
+                          'more_body': more})
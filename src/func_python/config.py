@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import os
+import socket
+import sys
+
+DEFAULT_EVENT_LOOP = 'auto'
+# Hypercorn's default backlog of 100 overflows under the burst of
+# connections which follows scaling from zero.
+DEFAULT_BACKLOG = socket.SOMAXCONN
+# Seconds to wait for requests in flight when shutting down, rather than
+# Hypercorn's 3.
+DEFAULT_GRACEFUL_TIMEOUT = 30.0
+
+
+def _bool(value: str) -> bool:
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _log(value: str):
+    # Hypercorn accepts "-" for stdout, or a file path.  Allow disabling.
+    return None if value.lower() in ('', 'off', 'false', 'none') else value
+
+
+# Environment variables which map onto Hypercorn settings, with the parser
+# for their values.
+SETTINGS = {
+    'FUNC_KEEP_ALIVE_TIMEOUT': ('keep_alive_timeout', float),
+    'FUNC_KEEP_ALIVE_MAX_REQUESTS': ('keep_alive_max_requests', int),
+    'FUNC_READ_TIMEOUT': ('read_timeout', int),
+    'FUNC_BACKLOG': ('backlog', int),
+    'FUNC_GRACEFUL_TIMEOUT': ('graceful_timeout', float),
+    'FUNC_H11_MAX_INCOMPLETE_SIZE': ('h11_max_incomplete_size', int),
+    'FUNC_H2_MAX_CONCURRENT_STREAMS': ('h2_max_concurrent_streams', int),
+    'FUNC_MAX_APP_QUEUE_SIZE': ('max_app_queue_size', int),
+    'FUNC_ACCESS_LOG': ('accesslog', _log),
+    'FUNC_ACCESS_LOG_FORMAT': ('access_log_format', str),
+    'FUNC_ERROR_LOG': ('errorlog', _log),
+    'FUNC_INCLUDE_SERVER_HEADER': ('include_server_header', _bool),
+    'FUNC_INCLUDE_DATE_HEADER': ('include_date_header', _bool),
+}
+
+
+def hypercorn_config(overrides: dict | None = None):
+    """
+    Returns the Hypercorn configuration, built from the defaults, then the
+    environment variables of SETTINGS, then the given overrides (a mapping
+    of Hypercorn setting names to values, as passed to serve's config).
+    """
+    import hypercorn.config
+    cfg = hypercorn.config.Config()
+    cfg.backlog = DEFAULT_BACKLOG
+    cfg.graceful_timeout = DEFAULT_GRACEFUL_TIMEOUT
+    for env, (name, parse) in SETTINGS.items():
+        value = os.getenv(env)
+        if value is not None:
+            try:
+                setattr(cfg, name, parse(value))
+            except ValueError:
+                raise ValueError(f"invalid value for {env}: <{value}>")
+    for name, value in (overrides or {}).items():
+        if name == 'bind' or not hasattr(cfg, name):
+            raise ValueError(f"unsupported server setting: <{name}>")
+        setattr(cfg, name, value)
+    return cfg
+
+
+def event_loop_factory(name: str | None = None):
+    """
+    Returns the factory for the event loop named by 'FUNC_EVENT_LOOP'
+    ("uvloop" or "asyncio"), unless given explicitly.  The default, "auto",
+    uses uvloop when it is installed.  None is returned for asyncio's own.
+    """
+    if name is None:
+        name = os.getenv('FUNC_EVENT_LOOP', DEFAULT_EVENT_LOOP)
+    if name not in ('auto', 'uvloop', 'asyncio'):
+        raise ValueError(f"unknown event loop: <{name}>")
+    if name == 'asyncio':
+        return None
+    try:
+        import uvloop
+    except ImportError:
+        if name == 'uvloop':
+            raise
+        logging.debug("uvloop is not installed. Using asyncio's event loop.")
+        return None
+    return uvloop.new_event_loop
+
+
+def run(main):
+    """ Run the coroutine main to completion on the selected event loop """
+    factory = event_loop_factory()
+    if factory is None:
+        return asyncio.run(main)
+    logging.debug("using uvloop event loop")
+    if sys.version_info >= (3, 11):
+        with asyncio.Runner(loop_factory=factory) as runner:
+            return runner.run(main)
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return asyncio.run(main)
@@ -0,0 +1,183 @@
+import abc
+import asyncio
+import collections
+import logging
+import os
+import time
+
+DEFAULT_DEDUP_SIZE = 0  # events remembered, zero is disabled
+DEFAULT_DEDUP_TTL = 600.0  # seconds
+DEFAULT_DEDUP_REPLAY = False
+
+# The response to a duplicate which is not replayed
+ACKNOWLEDGED = (200, [], b"")
+
+
+class Backend(abc.ABC):
+    """
+    Backend is the interface of a store of the events which have been
+    processed, which may be implemented to share them between instances
+    (in Redis, for example).  Keys are (source, id) tuples, and values are
+    the response to replay: a tuple of status, a list of header name and
+    value bytes pairs, and body bytes.
+    """
+
+    @abc.abstractmethod
+    async def get(self, key):
+        """ Returns the value stored for key, or None if it is not stored
+        or has expired """
+
+    @abc.abstractmethod
+    async def set(self, key, value, ttl: float):
+        """ Store the value for key, for ttl seconds """
+
+
+class MemoryBackend(Backend):
+    """ MemoryBackend stores at most size entries in memory, evicting the
+    least recently used when full. """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._entries = collections.OrderedDict()
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key, value, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Capture:
+    """ Capture wraps an ASGI send callable, recording the response so that
+    it may be replayed. """
+
+    __slots__ = ('_send', 'status', 'headers', 'chunks', 'complete')
+
+    def __init__(self, send):
+        self._send = send
+        self.status = None
+        self.headers = []
+        self.chunks = []
+        self.complete = False
+
+    async def __call__(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+            self.headers = list(message.get('headers', ()))
+        elif message['type'] == 'http.response.body':
+            self.chunks.append(message.get('body', b''))
+            self.complete = not message.get('more_body', False)
+        await self._send(message)
+
+    @property
+    def response(self):
+        """ The response, if it was completed successfully """
+        if not self.complete or not 200 <= self.status < 300:
+            return None
+        return (self.status, self.headers, b"".join(self.chunks))
+
+
+class Dedup:
+    """
+    Dedup suppresses duplicate deliveries of CloudEvents, which at-least-once
+    brokers may redeliver.  Events are identified by their source and id,
+    and once one has been handled successfully (with a 2xx response) its
+    duplicates are acknowledged with a 200 without invoking the Function.
+    With 'FUNC_DEDUP_REPLAY' set the original response is replayed instead,
+    so that a reply event is not lost if the broker did not receive it.
+
+    Handled events are remembered for 'FUNC_DEDUP_TTL' seconds by the given
+    Backend or, by default, in memory for the 'FUNC_DEDUP_SIZE' most
+    recently seen, which must be set to enable deduplication.  Duplicates
+    arriving while the event is still being handled wait for it, and are
+    handled themselves if it fails.  Events of batches are not deduplicated.
+    """
+
+    def __init__(self, backend: Backend | None = None,
+                 size: int | None = None, ttl: float | None = None,
+                 replay: bool | None = None):
+        if size is None:
+            size = int(os.getenv('FUNC_DEDUP_SIZE', DEFAULT_DEDUP_SIZE))
+        if ttl is None:
+            ttl = float(os.getenv('FUNC_DEDUP_TTL', DEFAULT_DEDUP_TTL))
+        if replay is None:
+            replay = os.getenv('FUNC_DEDUP_REPLAY',
+                               str(DEFAULT_DEDUP_REPLAY)).lower() \
+                in ('1', 'true', 'yes')
+        if backend is None and size > 0:
+            backend = MemoryBackend(size)
+        self.backend = backend
+        self.ttl = ttl
+        self.replay = replay
+        self.duplicates = 0
+        self._pending = {}  # keys being handled, to their completion
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    async def acquire(self, key):
+        """
+        Returns the response to a duplicate of the event with key, waiting
+        for a delivery already being handled to complete.  Returns None if
+        the event should be handled, in which case release must be called
+        once it has been.
+        """
+        while (pending := self._pending.get(key)) is not None:
+            await asyncio.shield(pending)
+        self._pending[key] = asyncio.get_running_loop().create_future()
+        try:
+            response = await self.backend.get(key)
+        except Exception as e:
+            logging.warning(f"dedup backend failed: {e}")
+            response = None
+        except BaseException:
+            # Cancelled: wake the deliveries waiting for this one
+            self._release(key)
+            raise
+        if response is None:
+            return None
+        self._release(key)
+        self.duplicates += 1
+        logging.debug(f"duplicate event {key[1]} from {key[0]}")
+        return response
+
+    async def release(self, key, capture: Capture):
+        """ Record the captured response to the event with key, if it was
+        handled successfully, and wake any duplicates waiting for it. """
+        try:
+            response = capture.response
+            if response is not None:
+                await self.backend.set(
+                    key, response if self.replay else ACKNOWLEDGED, self.ttl)
+        except Exception as e:
+            logging.warning(f"dedup backend failed: {e}")
+        finally:
+            self._release(key)
+
+    def _release(self, key):
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            pending.set_result(None)
+
+
+async def send_response(send, response):
+    """ Send a response recorded by Capture """
+    status, headers, body = response
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
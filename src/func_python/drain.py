@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import os
+import time
+
+import func_python.health
+
+DEFAULT_DRAIN_GRACE_PERIOD = 0.0  # seconds
+PROGRESS_INTERVAL = 1.0  # seconds between logging drain progress
+
+
+class Drain:
+    """
+    Drain shuts the Function down gracefully on SIGINT or SIGTERM.
+
+    Readiness fails as soon as the signal is received, so that no new traffic
+    is routed to the Function, but requests continue to be accepted for
+    'FUNC_DRAIN_GRACE_PERIOD' seconds while that takes effect.  The server
+    then stops accepting connections and waits for the requests in flight to
+    complete (up to its graceful timeout, 'FUNC_GRACEFUL_TIMEOUT') before the
+    Function's stop method is called.  A second signal ends the grace period
+    early.
+
+    Progress is logged every second while draining, and the number of
+    requests still in flight is reported by readiness and metrics.
+    """
+
+    def __init__(self, inflight, grace_period: float | None = None):
+        if grace_period is None:
+            grace_period = float(os.getenv('FUNC_DRAIN_GRACE_PERIOD',
+                                           DEFAULT_DRAIN_GRACE_PERIOD))
+        self.inflight = inflight
+        self.grace_period = grace_period
+        self.draining = False
+        self.response = func_python.health.encode(False, "Draining")
+        self._started = None
+        self._signalled = asyncio.Event()
+        self._forced = asyncio.Event()
+        self._progress = None
+
+    def signal(self):
+        """ Begin draining, or end the grace period if already draining """
+        if self.draining:
+            logging.info("Signal received: ending grace period")
+            self._forced.set()
+            return
+        logging.info("Signal received: draining")
+        self.draining = True
+        self._started = time.monotonic()
+        self._signalled.set()
+        self._progress = asyncio.ensure_future(self._log_progress())
+
+    async def trigger(self):
+        """ Returns once the server should stop accepting connections: after
+        the grace period following a signal. """
+        await self._signalled.wait()
+        if self.grace_period > 0:
+            try:
+                await asyncio.wait_for(self._forced.wait(), self.grace_period)
+            except asyncio.TimeoutError:
+                pass
+        logging.info(f"no longer accepting connections; waiting for "
+                     f"{self.inflight()} requests in flight")
+
+    async def stop(self):
+        """ Stop reporting progress, once requests have drained """
+        if self._progress is not None:
+            self._progress.cancel()
+            self._progress = None
+        if self.draining:
+            logging.info(f"drained in {time.monotonic() - self._started:.1f}s"
+                         f" with {self.inflight()} requests in flight")
+
+    async def _log_progress(self):
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            logging.info(f"draining for {time.monotonic() - self._started:.0f}s:"
+                         f" {self.inflight()} requests in flight")
@@ -0,0 +1,110 @@
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+import os
+
+DEFAULT_THREADS = 0  # use the standard library's default pool size
+
+
+def is_async(fn) -> bool:
+    """ Returns true if calling fn returns an awaitable, either because it is
+    a coroutine function or an object with an async __call__ """
+    return inspect.iscoroutinefunction(fn) or \
+        inspect.iscoroutinefunction(getattr(fn, "__call__", None))
+
+
+class Executor:
+    """
+    Executor runs the synchronous parts of a Function (its hooks, and its
+    handler if it is not a coroutine) on a bounded pool of threads, so that
+    blocking work does not stall the event loop.  The pool size is read from
+    'FUNC_THREADS' unless given explicitly.
+
+    Work offloaded by the middleware on a handler's behalf (reading files,
+    iterating synchronous iterables, compressing) is run on a second pool of
+    the same size.  A synchronous handler blocks its pool thread while such
+    work completes, so queueing it on the handler pool could deadlock.
+    """
+
+    def __init__(self, max_workers: int | None = None):
+        if max_workers is None:
+            max_workers = int(os.getenv('FUNC_THREADS', DEFAULT_THREADS))
+        if max_workers < 0:
+            raise ValueError(f"number of threads must not be negative, "
+                             f"got {max_workers}")
+        self.max_workers = max_workers or None
+        self._pool = None
+        self._offload_pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="func")
+        return self._pool
+
+    @property
+    def offload_pool(self):
+        if self._offload_pool is None:
+            self._offload_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="func-offload")
+        return self._offload_pool
+
+    async def offload(self, fn, *args):
+        """ Call the synchronous fn on the offload pool, for work done by
+        the middleware which a handler on the pool may be waiting for. """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.offload_pool, functools.partial(fn, *args))
+
+    async def call(self, fn, *args):
+        """ Call fn, awaiting it directly if it is a coroutine function
+        and otherwise running it on the pool. """
+        if is_async(fn):
+            return await fn(*args)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self.pool, functools.partial(fn, *args))
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def handle(self, handler, scope, receive, send):
+        """ Run a synchronous ASGI handler on the pool.  It is given blocking
+        versions of receive and send (including any async methods of send,
+        such as those of a CloudEventSender). """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self.pool, handler, scope,
+            Blocking(receive, loop), Blocking(send, loop))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+        if self._offload_pool is not None:
+            self._offload_pool.shutdown(wait=False)
+            self._offload_pool = None
+
+
+class Blocking:
+    """
+    Blocking wraps an async callable for use from a pool thread: calling it
+    (or any of its async methods) runs the coroutine on the event loop and
+    blocks until it completes.
+    """
+
+    def __init__(self, target, loop):
+        self._target = target
+        self._loop = loop
+
+    def __call__(self, *args, **kwargs):
+        return asyncio.run_coroutine_threadsafe(
+            self._target(*args, **kwargs), self._loop).result()
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if is_async(attr):
+            return Blocking(attr, self._loop)
+        return attr
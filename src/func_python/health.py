@@ -0,0 +1,130 @@
+import asyncio
+import inspect
+import logging
+import os
+import time
+
+DEFAULT_PROBE_CACHE_TTL = 0.0  # seconds, zero disables caching
+DEFAULT_PROBE_REFRESH_INTERVAL = 0.0  # seconds, zero disables the refresher
+
+_HEADERS = [[b'content-type', b'text/plain']]
+
+# Pre-encoded responses, keyed by (ok, message)
+_responses = {}
+
+
+def encode(ok, message):
+    """ Returns the (start, body) ASGI messages for a probe result, reusing
+    previously encoded messages for the same result. """
+    key = (bool(ok), str(message))
+    response = _responses.get(key)
+    if response is None:
+        response = (
+            {'type': 'http.response.start', 'status': 200 if ok else 500,
+             'headers': _HEADERS},
+            {'type': 'http.response.body', 'body': key[1].encode('utf-8')},
+        )
+        if len(_responses) < 1024:  # bound the memory used by odd messages
+            _responses[key] = response
+    return response
+
+
+class Probe:
+    """
+    Probe serves a liveness or readiness check.
+
+    The check is the Function's optional 'alive' or 'ready' method, which
+    returns either a boolean or a tuple of (boolean, message).  Without a
+    check the probe always succeeds with "OK".
+
+    Results are cached for 'FUNC_PROBE_CACHE_TTL' seconds, and concurrent
+    probes arriving while the check runs share its result.  When
+    'FUNC_PROBE_REFRESH_INTERVAL' is set the check is instead run in the
+    background on that interval, and probes are answered from the latest
+    result without ever invoking the check.
+
+    Synchronous checks are run on the given executor, if any.
+    """
+
+    def __init__(self, check=None, executor=None, ttl: float | None = None,
+                 interval: float | None = None):
+        if ttl is None:
+            ttl = float(os.getenv('FUNC_PROBE_CACHE_TTL',
+                                  DEFAULT_PROBE_CACHE_TTL))
+        if interval is None:
+            interval = float(os.getenv('FUNC_PROBE_REFRESH_INTERVAL',
+                                       DEFAULT_PROBE_REFRESH_INTERVAL))
+        self.check = check
+        self.executor = executor
+        self.ttl = ttl
+        self.interval = interval if check is not None else 0.0
+        self._response = encode(True, "OK") if check is None else None
+        self._expires = 0.0
+        self._pending = None
+        self._task = None
+
+    def start(self):
+        """ Start the background refresher, if configured. """
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self):
+        """ Stop the background refresher, if running. """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def respond(self, send, headers=None):
+        """ Send the probe's response, with any additional headers. """
+        response = self._response
+        if response is None or (self.check is not None and self._task is None
+                                and time.monotonic() >= self._expires):
+            response = await self.refresh()
+        start, body = response
+        if headers:
+            start = dict(start, headers=start['headers'] + headers)
+        await send(start)
+        await send(body)
+
+    async def refresh(self, background=False):
+        """ Run the check, sharing the result with any concurrent callers,
+        and return the encoded response. """
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._refresh(background))
+            self._pending.add_done_callback(self._clear_pending)
+        return await asyncio.shield(self._pending)
+
+    def _clear_pending(self, _):
+        self._pending = None
+
+    async def _refresh(self, background):
+        try:
+            if self.executor is not None:
+                result = await self.executor.call(self.check)
+            else:
+                result = self.check()
+                if inspect.isawaitable(result):
+                    result = await result
+            # The message return is optional
+            if isinstance(result, tuple):
+                ok, message = result
+            else:
+                ok, message = result, "OK"
+            response = encode(ok, message)
+        except Exception as e:
+            if not background:
+                raise
+            logging.error(f"probe check failed: {e}")
+            response = encode(False, f"Error: {e}")
+        self._response = response
+        self._expires = time.monotonic() + self.ttl
+        return response
+
+    async def _refresh_periodically(self):
+        while True:
+            await self.refresh(background=True)
+            await asyncio.sleep(self.interval)
@@ -3,36 +3,82 @@ import asyncio
 import logging
 import os
 import signal
-
-import hypercorn.config
-import hypercorn.asyncio
-
+import time
+
+import func_python.body
+import func_python.cache
+import func_python.compression
+import func_python.config
+import func_python.drain
+import func_python.executor
+import func_python.health
+import func_python.limiter
+import func_python.metrics
+import func_python.response
 import func_python.sock
+import func_python.startup
+import func_python.timeout
+import func_python.warmup
+import func_python.workers
 
 DEFAULT_LOG_LEVEL = logging.INFO
 
-logging.basicConfig(level=DEFAULT_LOG_LEVEL)
 
-
-def serve(f):
+def serve(f, workers=None, config=None):
     """serve a function f by wrapping it in an ASGI web application
     and starting.  The function can be either a constructor for a functon
     instance (named "new") or a simple ASGI handler function (named "handle").
+
+    When more than one worker is requested (via the workers argument or the
+    FUNC_WORKERS environment variable), each worker is a separate process
+    with its own event loop, function instance and SO_REUSEPORT listeners;
+    unix socket listeners are bound once and shared by the workers.
+
+    config is an optional mapping of Hypercorn settings, which take
+    precedence over those read from the environment.
     """
-    logging.debug("func runtime creating function instance")
+    # Logging is configured here rather than on import, leaving it to the
+    # Function if it has configured logging itself.
+    logging.basicConfig(level=DEFAULT_LOG_LEVEL)
+    profile = func_python.startup.Profile()
+    profile.mark("import")
 
-    if f.__name__ == 'new':
-        return ASGIApplication(f()).serve()
-    elif f.__name__ == 'handle':
-        try:
-            return ASGIApplication(DefaultFunction(f)).serve()
-        except Exception as e:
-            logging.error(f"Server failed to start: {e}")
-            raise
-    else:
+    if f.__name__ not in ('new', 'handle'):
         raise ValueError("function must be either be a constructor 'new' or a "
                          "handler function 'handle'.")
 
+    workers = func_python.workers.count(workers)
+    if workers > 1:
+        # Unix sockets are bound once here and inherited by the workers
+        cfg = func_python.config.hypercorn_config(config)
+        shared = func_python.sock.bind_shared(cfg.backlog)
+        try:
+            return func_python.workers.run(
+                lambda: _serve(f, config, reuse_port=True, profile=profile,
+                               shared=shared),
+                workers,
+                func_python.workers.worker_shutdown_timeout(
+                    cfg.graceful_timeout))
+        finally:
+            for sock in shared.values():
+                sock.close()
+    return _serve(f, config, profile=profile)
+
+
+def _serve(f, config=None, reuse_port=False, profile=None, shared=None):
+    logging.debug("func runtime creating function instance")
+
+    if f.__name__ == 'new':
+        return ASGIApplication(f(), profile).serve(config,
+                                                   reuse_port=reuse_port,
+                                                   shared=shared)
+    try:
+        return ASGIApplication(DefaultFunction(f), profile).serve(
+            config, reuse_port=reuse_port, shared=shared)
+    except Exception as e:
+        logging.error(f"Server failed to start: {e}")
+        raise
+
 
 class DefaultFunction:
     """DefaultFunction is used when the provided functon is not a constructor
@@ -47,11 +93,44 @@ class DefaultFunction:
 
 
 class ASGIApplication():
-    def __init__(self, f):
+    def __init__(self, f, profile=None):
         self.f = f
+        self.profile = profile or func_python.startup.Profile(False)
+        self.profile.mark("new")
+        self._first_request = self.profile.enabled
         self.stop_event = asyncio.Event()
+        self.max_body_size = func_python.body.max_body_size()
+        # Request bodies are passed to HTTP functions as they were sent,
+        # unless decompression is enabled
+        self.decompress, self.max_decompressed_size = \
+            func_python.body.decompression(default=False)
+        self.limiter = func_python.limiter.Limiter()
+        self.drain = func_python.drain.Drain(lambda: self.limiter.inflight)
+        self.timeouts = func_python.timeout.Timeouts()
+        self.cache = func_python.cache.ResponseCache()
+        self.metrics = None
+        if func_python.metrics.enabled():
+            self.metrics = func_python.metrics.Metrics(gauges={
+                'func_requests_inflight': lambda: self.limiter.inflight,
+                'func_requests_queued': lambda: self.limiter.queued,
+                'func_draining': lambda: int(self.drain.draining),
+            }, counters={
+                'func_request_timeouts_total': lambda: self.timeouts.expired,
+                'func_response_cache_hits_total': lambda: self.cache.hits,
+                'func_response_cache_misses_total': lambda: self.cache.misses,
+            })
         if hasattr(self.f, "handle") is not True:
             raise AttributeError("Function must implement a 'handle' method.")
+        # Synchronous hooks, and a synchronous handle, are run on a pool
+        self.executor = func_python.executor.Executor()
+        self.handle_is_async = func_python.executor.is_async(self.f.handle)
+        self.compression = func_python.compression.Compression(
+            executor=self.executor)
+        self.liveness = func_python.health.Probe(
+            getattr(self.f, "alive", None), self.executor)
+        self.readiness = func_python.health.Probe(
+            getattr(self.f, "ready", None), self.executor)
+        self.warmup = func_python.warmup.Warmup(self.f, self.executor)
 
         # Inform the user via logs that defaults will be used for health
         # endpoints if no matchin methods were provided.
@@ -67,39 +146,53 @@ class ASGIApplication():
                 "implementation for readiness checks."
             )
 
-    def serve(self):
+    def serve(self, config=None, reuse_port=False, shared=None):
         """serve serving this ASGIhandler, delegating implementation of
            methods as necessary to the wrapped Function instance"""
-        cfg = hypercorn.config.Config()
-        cfg.bind = func_python.sock.bind()
+        cfg = func_python.config.hypercorn_config(config)
+        cfg.bind = func_python.sock.bind(reuse_port=reuse_port, backlog=cfg.backlog,
+                                         shared=shared)
+        self.profile.mark("bind")
 
         logging.debug(f"function starting on {cfg.bind}")
-        return asyncio.run(self._serve(cfg))
+        return func_python.config.run(self._serve(cfg))
 
     async def _serve(self, cfg):
+        import hypercorn.asyncio
+        self.profile.mark("server")
+
         loop = asyncio.get_event_loop()
         loop.add_signal_handler(signal.SIGINT, self._handle_signal)
         loop.add_signal_handler(signal.SIGTERM, self._handle_signal)
 
-        await hypercorn.asyncio.serve(self, cfg)
+        await hypercorn.asyncio.serve(self, cfg,
+                                      shutdown_trigger=self.drain.trigger)
 
     def _handle_signal(self):
-        logging.info("Signal received: initiating shutdown")
+        self.drain.signal()
         self.stop_event.set()
 
     async def on_start(self):
         """on_start handles the ASGI server start event, delegating control
            to the internal Function instance if it has a "start" method."""
         if hasattr(self.f, "start"):
-            self.f.start(os.environ.copy())
+            await self.executor.call(self.f.start, os.environ.copy())
         else:
             logging.info("function does not implement 'start'. Skipping.")
+        self.liveness.start()
+        self.readiness.start()
+        self.warmup.start(self.warm_up)
 
     async def on_stop(self):
+        await self.drain.stop()
+        await self.warmup.stop()
+        await self.liveness.stop()
+        await self.readiness.stop()
         if hasattr(self.f, "stop"):
-            self.f.stop()
+            await self.executor.call(self.f.stop)
         else:
             logging.info("function does not implement 'stop'. Skipping.")
+        self.executor.shutdown()
         self.stop_event.set()
 
     async def __call__(self, scope, receive, send):
@@ -115,6 +208,7 @@ class ASGIApplication():
                                     'message': str(e)})
                         return
                     await send({'type': 'lifespan.startup.complete'})
+                    self.profile.mark("lifespan startup")
                 elif message['type'] == 'lifespan.shutdown':
                     await self.on_stop()
                     await send({'type': 'lifespan.shutdown.complete'})
@@ -130,60 +224,123 @@ class ASGIApplication():
                                  )
             return
 
+        if self._first_request:
+            self._first_request = False
+            self.profile.mark("first request")
+
         # Route request
         try:
             if scope['path'] == '/health/liveness':
                 await self.handle_liveness(scope, receive, send)
             elif scope['path'] == '/health/readiness':
                 await self.handle_readiness(scope, receive, send)
+            elif self.metrics is not None and \
+                    scope['path'] == self.metrics.path:
+                await self.metrics.respond(send)
             else:
-                await self.f.handle(scope, receive, send)
+                await self.handle_request(scope, receive, send)
+        except func_python.body.BodyTooLarge as e:
+            await send_exception(send, 413, f"Error: {e}")
+        except func_python.body.InvalidBody as e:
+            await send_exception(send, 400, f"Error: {e}")
         except Exception as e:
             await send_exception(send, 500, f"Error: {e}")
 
-    async def handle_liveness(self, scope, receive, send):
-        alive = True
-        message = "OK"
-        if hasattr(self.f, "alive"):
-            result = self.f.alive()
-            # The message return is optional
-            if isinstance(result, tuple):
-                alive, message = result
-            else:
-                alive = result
-
-        if alive:
-            await send({'type': 'http.response.start', 'status': 200,
-                        'headers': [[b'content-type', b'text/plain']]})
+    async def handle_request(self, scope, receive, send):
+        """handle_request admits the request, shedding it with a 503 if the
+           function is overloaded, and then invokes the function."""
+        try:
+            await self.limiter.acquire()
+        except func_python.limiter.Overloaded:
+            await self.limiter.reject(send)
+            return
+        # Wrap the receiver in a BodyReceiver, which enforces the
+        # maximum body size and offers "await receive.body()"
+        receive = func_python.body.BodyReceiver(
+            receive, scope, self.max_body_size, self.decompress,
+            self.max_decompressed_size, strict=False)
+        # The response is recorded for metrics, and to know whether a
+        # request which times out can still be answered with a 504.
+        if self.metrics is not None or self.timeouts.enabled:
+            send = recorder = func_python.metrics.Recorder(send)
+        capture = None
+        started = time.perf_counter()
+        try:
+            length = func_python.body.content_length(scope)
+            if self.max_body_size and length is not None \
+                    and length > self.max_body_size:
+                await send_exception(send, 413, "Request body too large")
+                return
+            sender = send
+            if self.compression.enabled:
+                sender = self.compression.wrap(scope, sender)
+            # Responses to cacheable requests are served from the cache, or
+            # captured to store in it
+            key = self.cache.enabled and self.cache.key(scope)
+            if key:
+                key, fresh = key
+                entry, leader = await self.cache.lookup(key, fresh)
+                if entry is not None:
+                    await self.cache.respond(sender, scope, entry)
+                    return
+                if leader:
+                    sender = capture = func_python.cache.Capture(
+                        sender, self.cache)
+            # Wrap the sender in a ResponseSender, which offers streaming
+            # helpers such as "await send.stream(chunks)"
+            sender = func_python.response.ResponseSender(
+                sender, scope, self.executor)
+            timeout = self.timeouts.enabled and \
+                self.timeouts.get(scope['path'])
+            if not timeout:
+                await self.invoke(scope, receive, sender)
+            elif await self.timeouts.run(self.invoke(scope, receive, sender),
+                                         scope, timeout) \
+                    and not recorder.started:
+                await send_exception(send, 504, "Gateway Timeout")
+        finally:
+            if capture is not None:
+                self.cache.release(key, capture)
+            self.limiter.release()
+            if self.metrics is not None:
+                self.metrics.observe(time.perf_counter() - started,
+                                     recorder.status or 500,
+                                     receive.received, recorder.size)
+
+    async def warm_up(self, request):
+        """warm_up sends a synthetic request through the function, discarding
+           the response."""
+        scope, receive = func_python.warmup.request(request)
+        receive = func_python.body.BodyReceiver(receive, scope)
+        await self.invoke(scope, receive, func_python.response.ResponseSender(
+            func_python.warmup.discard, scope, self.executor))
+
+    async def invoke(self, scope, receive, send):
+        """invoke the Function's handler, on the executor if it is not a
+           coroutine function."""
+        if self.handle_is_async:
+            await self.f.handle(scope, receive, send)
         else:
-            await send({'type': 'http.response.start', 'status': 500,
-                        'headers': [[b'content-type', b'text/plain']]})
+            await self.executor.handle(self.f.handle, scope, receive, send)
 
-        await send({'type': 'http.response.body',
-                    'body': f'{message}'.encode('utf-8'),
-                    })
+    async def handle_liveness(self, scope, receive, send):
+        await self.liveness.respond(send)
 
     async def handle_readiness(self, scope, receive, send):
-        ready = True
-        message = "OK"
-        if hasattr(self.f, "ready"):
-            result = self.f.ready()
-            # The message return is optional
-            if isinstance(result, tuple):
-                ready, message = result
-            else:
-                ready = result
-
-        if ready:
-            await send({'type': 'http.response.start', 'status': 200,
-                        'headers': [[b'content-type', b'text/plain']]})
-        else:
-            await send({'type': 'http.response.start', 'status': 500,
-                        'headers': [[b'content-type', b'text/plain']]})
-
-        await send({'type': 'http.response.body',
-                    'body': f'{message}'.encode('utf-8'),
-                    })
+        # Report not ready while draining, warming up or overloaded, so that
+        # traffic is routed elsewhere, and expose the admission gauges
+        # (and so drain progress) either way.
+        if self.drain.draining or not self.warmup.done:
+            start, body = self.drain.response if self.drain.draining \
+                else self.warmup.response
+            await send(dict(start, headers=start['headers']
+                            + self.limiter.gauges()))
+            await send(body)
+            return
+        if self.limiter.overloaded:
+            await self.limiter.reject(send, self.limiter.gauges())
+            return
+        await self.readiness.respond(send, self.limiter.gauges())
 
 
 async def send_exception(send, code, message):
@@ -0,0 +1,114 @@
+import asyncio
+import collections
+import os
+
+DEFAULT_MAX_CONCURRENCY = 0  # unlimited
+DEFAULT_MAX_QUEUE = 0  # shed immediately when saturated
+DEFAULT_QUEUE_TIMEOUT = 0.0  # seconds, zero waits indefinitely
+DEFAULT_RETRY_AFTER = 1  # seconds
+
+
+class Overloaded(Exception):
+    """ Raised when a request can not be admitted """
+
+
+class Limiter:
+    """
+    Limiter is an admission controller for requests to the Function.
+
+    At most 'FUNC_MAX_CONCURRENCY' requests are handled at once, defaulting
+    to Knative's 'CONTAINER_CONCURRENCY' when that is present in the
+    environment.  Zero is unlimited.  Requests beyond that wait in a queue of
+    up to 'FUNC_MAX_QUEUE' entries for at most 'FUNC_QUEUE_TIMEOUT' seconds,
+    and are otherwise rejected immediately with a 503 carrying a Retry-After
+    of 'FUNC_RETRY_AFTER' seconds.
+
+    The number of requests in flight is tracked even when unlimited.
+    """
+
+    def __init__(self, max_concurrency: int | None = None,
+                 max_queue: int | None = None,
+                 queue_timeout: float | None = None,
+                 retry_after: int | None = None):
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv(
+                'FUNC_MAX_CONCURRENCY',
+                os.getenv('CONTAINER_CONCURRENCY', DEFAULT_MAX_CONCURRENCY)))
+        if max_queue is None:
+            max_queue = int(os.getenv('FUNC_MAX_QUEUE', DEFAULT_MAX_QUEUE))
+        if queue_timeout is None:
+            queue_timeout = float(os.getenv('FUNC_QUEUE_TIMEOUT',
+                                            DEFAULT_QUEUE_TIMEOUT))
+        if retry_after is None:
+            retry_after = int(os.getenv('FUNC_RETRY_AFTER',
+                                        DEFAULT_RETRY_AFTER))
+        if max_concurrency < 0 or max_queue < 0:
+            raise ValueError("concurrency and queue limits must not be negative")
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self._waiters = collections.deque()
+        self._rejection = (
+            {'type': 'http.response.start', 'status': 503,
+             'headers': [[b'content-type', b'text/plain'],
+                         [b'retry-after', str(retry_after).encode()]]},
+            {'type': 'http.response.body', 'body': b'Service Unavailable'},
+        )
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def overloaded(self) -> bool:
+        """ True when a new request would be rejected """
+        return self.max_concurrency > 0 \
+            and self.inflight >= self.max_concurrency \
+            and self.queued >= self.max_queue
+
+    async def acquire(self):
+        """ Admit a request, waiting in the queue if necessary.
+        :raises Overloaded: if the request was not admitted. """
+        if self.max_concurrency == 0 or (
+                self.inflight < self.max_concurrency and not self._waiters):
+            self.inflight += 1
+            return
+        if self.queued >= self.max_queue:
+            raise Overloaded("too many requests")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout or None)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up on it
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise Overloaded("timed out waiting for admission")
+            raise
+
+    def release(self):
+        """ Release a slot, handing it directly to the next waiter if any """
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.inflight -= 1
+
+    def gauges(self):
+        """ Returns the in-flight and queued gauges as response headers """
+        return [[b'x-func-inflight', str(self.inflight).encode()],
+                [b'x-func-queued', str(self.queued).encode()]]
+
+    async def reject(self, send, headers=None):
+        """ Send the 503 response for a request which was not admitted """
+        start, body = self._rejection
+        if headers:
+            start = dict(start, headers=start['headers'] + headers)
+        await send(start)
+        await send(body)
@@ -0,0 +1,168 @@
+import bisect
+import os
+
+DEFAULT_METRICS_PATH = '/metrics'
+
+# Fixed histogram buckets.  Upper bounds, in seconds and bytes respectively.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+                16777216)
+
+# Label values beyond this many distinct values are recorded as "other", so
+# that untrusted input (such as CloudEvent types) can not grow memory.
+MAX_LABEL_VALUES = 100
+
+_HEADERS = [[b'content-type', b'text/plain; version=0.0.4; charset=utf-8']]
+
+
+def enabled() -> bool:
+    """ Returns true if the metrics endpoint is enabled with 'FUNC_METRICS' """
+    return os.getenv('FUNC_METRICS', 'false').lower() in ('1', 'true', 'yes')
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets.  Observations only increment existing
+    counters; cumulative counts are computed when rendered.
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels, lines):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {self.count}')
+        labels = labels.rstrip(',')
+        labels = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{labels} {self.sum}')
+        lines.append(f'{name}_count{labels} {self.count}')
+
+
+class Series:
+    """ The metrics recorded for one value of the optional label """
+
+    __slots__ = ('statuses', 'duration', 'request_size', 'response_size')
+
+    def __init__(self):
+        self.statuses = {}
+        self.duration = Histogram(LATENCY_BUCKETS)
+        self.request_size = Histogram(SIZE_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+
+
+class Metrics:
+    """
+    Metrics records requests handled by the Function, and serves them in
+    the Prometheus text format at 'FUNC_METRICS_PATH'.
+
+    Metrics may be partitioned by a single label (for example the type of
+    CloudEvent).  Gauges and counters maintained elsewhere are given as
+    mappings of metric name to a callable returning the current value, and
+    are read when rendered.
+    """
+
+    def __init__(self, label: str | None = None, gauges=None,
+                 path: str | None = None, counters=None):
+        if path is None:
+            path = os.getenv('FUNC_METRICS_PATH', DEFAULT_METRICS_PATH)
+        self.path = path
+        self.label = label
+        self.gauges = gauges or {}
+        self.counters = counters or {}
+        self._series = {}
+
+    def observe(self, duration, status, request_size, response_size,
+                value=None):
+        """ Record a handled request """
+        series = self._series.get(value)
+        if series is None:
+            series = self._series_for(value)
+        series.statuses[status] = series.statuses.get(status, 0) + 1
+        series.duration.observe(duration)
+        series.request_size.observe(request_size)
+        series.response_size.observe(response_size)
+
+    def _series_for(self, value):
+        if value is not None and len(self._series) >= MAX_LABEL_VALUES:
+            value = 'other'
+        series = self._series.get(value)
+        if series is None:
+            series = self._series[value] = Series()
+        return series
+
+    def render(self) -> bytes:
+        lines = []
+        for name, gauge in self.gauges.items():
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {gauge()}')
+        for name, counter in self.counters.items():
+            lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {counter()}')
+
+        series = [(self._labels(v), s) for v, s in self._series.items()]
+        lines.append('# HELP func_requests_total Requests handled, by status.')
+        lines.append('# TYPE func_requests_total counter')
+        for labels, s in series:
+            for status, count in sorted(s.statuses.items()):
+                lines.append(f'func_requests_total{{{labels}status="{status}"}} {count}')
+        for name, attr, description in (
+                ('func_request_duration_seconds', 'duration',
+                 'Time taken to handle requests.'),
+                ('func_request_size_bytes', 'request_size',
+                 'Size of request bodies.'),
+                ('func_response_size_bytes', 'response_size',
+                 'Size of response bodies.')):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, s in series:
+                getattr(s, attr).render(name, labels, lines)
+        lines.append('')
+        return '\n'.join(lines).encode('utf-8')
+
+    def _labels(self, value):
+        if self.label is None or value is None:
+            return ''
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        return f'{self.label}="{value}",'
+
+    async def respond(self, send):
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': _HEADERS})
+        await send({'type': 'http.response.body', 'body': self.render()})
+
+
+class Recorder:
+    """ Recorder wraps an ASGI send callable, recording the response's
+    status and body size. """
+
+    __slots__ = ('_send', 'status', 'size')
+
+    def __init__(self, send):
+        self._send = send
+        self.status = None
+        self.size = 0
+
+    async def __call__(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message['type'] == 'http.response.body':
+            self.size += len(message.get('body', b''))
+        await self._send(message)
+
+    @property
+    def started(self) -> bool:
+        return self.status is not None
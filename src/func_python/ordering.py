@@ -0,0 +1,114 @@
+import asyncio
+import collections
+import os
+
+DEFAULT_ORDER_BY = ''  # disabled
+DEFAULT_ORDER_MAX_KEYS = 1024
+
+
+class Ordering:
+    """
+    Ordering handles the CloudEvents of each key one at a time, in the order
+    in which they were received, while events of different keys are handled
+    concurrently.  The key is the attribute named by 'FUNC_ORDER_BY': the
+    event's "subject", or an extension attribute such as "partitionkey".
+    Events without it are not ordered.
+
+    Each key being handled has a queue of the events waiting for it, which
+    is removed as soon as it is empty.  At most 'FUNC_ORDER_MAX_KEYS' keys
+    are handled at once; events of further keys wait for one to finish an
+    event, which hands its slot to the key which has waited longest, so
+    that a key with steady traffic does not keep its slot.
+    """
+
+    def __init__(self, order_by: str | None = None,
+                 max_keys: int | None = None):
+        if order_by is None:
+            order_by = os.getenv('FUNC_ORDER_BY', DEFAULT_ORDER_BY)
+        if max_keys is None:
+            max_keys = int(os.getenv('FUNC_ORDER_MAX_KEYS',
+                                     DEFAULT_ORDER_MAX_KEYS))
+        if max_keys < 1:
+            raise ValueError(f"maximum ordered keys must be positive, "
+                             f"got {max_keys}")
+        self.order_by = order_by.strip()
+        self.max_keys = max_keys
+        self.active = 0  # keys being handled
+        self._queues = {}  # keys being handled or waiting, to their turns
+        self._waiting = collections.deque()  # keys waiting to be handled
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.order_by)
+
+    def key(self, event):
+        """ Returns the key by which the event is ordered, or None """
+        if self.order_by == 'subject':
+            return event.get_subject()
+        return event.get_extension(self.order_by)
+
+    async def run(self, key, coro):
+        """ Await the handler coroutine once the events of the same key
+        received before it have been handled """
+        try:
+            await self._acquire(key)
+        except BaseException:
+            coro.close()
+            raise
+        try:
+            await coro
+        finally:
+            self._release(key)
+
+    async def _acquire(self, key):
+        queue = self._queues.get(key)
+        if queue is None:
+            if self.active < self.max_keys and not self._waiting:
+                self._queues[key] = collections.deque()
+                self.active += 1
+                return
+            # Wait for a key to finish, which hands over its slot
+            queue = self._queues[key] = collections.deque()
+            self._waiting.append(key)
+        turn = asyncio.get_running_loop().create_future()
+        queue.append(turn)
+        try:
+            await turn
+        except asyncio.CancelledError:
+            if not turn.cancelled():
+                self._release(key)  # granted as it was cancelled
+            raise
+
+    def _release(self, key):
+        """ Hand the key to its next event or, if keys are waiting for a
+        slot, hand the slot to the one which has waited longest, with the
+        key waiting behind them for its remaining events """
+        queue = self._queues[key]
+        if not self._waiting:
+            if self._wake(queue):
+                return
+            del self._queues[key]
+            self.active -= 1
+            return
+        while queue and queue[0].done():
+            queue.popleft()  # cancelled
+        if queue:
+            self._waiting.append(key)
+        else:
+            del self._queues[key]
+        while self._waiting:
+            waiting = self._waiting.popleft()
+            if self._wake(self._queues[waiting]):
+                return
+            del self._queues[waiting]  # its events were all cancelled
+        self.active -= 1
+
+    @staticmethod
+    def _wake(turns) -> bool:
+        """ Wake the first turn which has not been cancelled """
+        while turns:
+            turn = turns.popleft()
+            if not turn.done():
+                turn.set_result(None)
+                return True
+        return False
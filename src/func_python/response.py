@@ -0,0 +1,155 @@
+import json
+import mimetypes
+import os
+
+DEFAULT_CHUNK_SIZE = 65536  # bytes read from a file per message
+
+SSE_HEADERS = [(b"content-type", b"text/event-stream; charset=utf-8"),
+               (b"cache-control", b"no-cache"),
+               (b"x-accel-buffering", b"no")]
+
+_DONE = object()
+
+
+class ResponseSender:
+    """
+    ResponseSender wraps the ASGI send callable given to HTTP Functions.  It
+    may still be called with ASGI messages, and adds helpers for responses
+    which are streamed rather than built in memory:
+
+        await send.stream(chunks)   # an iterable or async iterable of bytes
+        await send.events(events)   # Server-Sent Events
+        await send.file(path)       # the contents of a file
+
+    Files are sent with the server's "http.response.pathsend" or
+    "http.response.zerocopysend" extensions where it supports them, and are
+    otherwise read and sent in chunks.  Synchronous iterables and file reads
+    are run on the given executor's offload pool, if any, rather than on the
+    event loop.
+    """
+
+    __slots__ = ('_send', '_extensions', '_executor')
+
+    def __init__(self, send, scope, executor=None):
+        self._send = send
+        self._extensions = scope.get("extensions") or {}
+        self._executor = executor
+
+    async def __call__(self, message):
+        await self._send(message)
+
+    async def http(self, message):
+        """Send a raw ASGI message, as does calling the sender"""
+        await self._send(message)
+
+    async def stream(self, chunks, status=200, headers=None,
+                     content_type="application/octet-stream"):
+        """Send the response body as the chunks (bytes or strings) of an
+        iterable or async iterable are produced."""
+        await self._start(status, headers, content_type)
+        async for chunk in self._iterate(chunks):
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            if chunk:
+                await self._send({"type": "http.response.body",
+                                  "body": chunk, "more_body": True})
+        await self._send({"type": "http.response.body", "body": b""})
+
+    async def events(self, events, status=200, headers=None):
+        """Send Server-Sent Events as they are produced by an iterable or
+        async iterable.  Each event is a string, or a dict with any of
+        "data", "event", "id" and "retry", where data which is not a string
+        is sent as JSON."""
+        await self._send({"type": "http.response.start", "status": status,
+                          "headers": SSE_HEADERS + _encode(headers)})
+        async for event in self._iterate(events):
+            await self._send({"type": "http.response.body",
+                              "body": encode_event(event), "more_body": True})
+        await self._send({"type": "http.response.body", "body": b""})
+
+    async def file(self, path, status=200, headers=None, content_type=None,
+                   chunk_size=DEFAULT_CHUNK_SIZE):
+        """Send the contents of the file at path.  The content type is
+        guessed from its name if not given."""
+        path = os.path.abspath(path)
+        if content_type is None:
+            content_type = mimetypes.guess_type(path)[0] \
+                or "application/octet-stream"
+        f = await self._call(open, path, "rb")
+        try:
+            size = os.fstat(f.fileno()).st_size
+            headers = _encode(headers) + [
+                (b"content-length", str(size).encode())]
+            await self._start(status, headers, content_type)
+            if "http.response.pathsend" in self._extensions:
+                await self._send({"type": "http.response.pathsend",
+                                  "path": path})
+            elif "http.response.zerocopysend" in self._extensions:
+                await self._send({"type": "http.response.zerocopysend",
+                                  "file": f})
+            else:
+                while True:
+                    chunk = await self._call(f.read, chunk_size)
+                    await self._send({"type": "http.response.body",
+                                      "body": chunk,
+                                      "more_body": len(chunk) == chunk_size})
+                    if len(chunk) < chunk_size:
+                        break
+        finally:
+            f.close()
+
+    async def _start(self, status, headers, content_type):
+        headers = _encode(headers)
+        if not any(k.lower() == b"content-type" for k, _ in headers):
+            headers.append((b"content-type", content_type.encode()))
+        await self._send({"type": "http.response.start", "status": status,
+                          "headers": headers})
+
+    async def _iterate(self, iterable):
+        if hasattr(iterable, "__aiter__"):
+            async for item in iterable:
+                yield item
+            return
+        if isinstance(iterable, (list, tuple)):
+            for item in iterable:
+                yield item
+            return
+        iterator = iter(iterable)
+        while True:
+            item = await self._call(next, iterator, _DONE)
+            if item is _DONE:
+                return
+            yield item
+
+    async def _call(self, fn, *args):
+        if self._executor is None:
+            return fn(*args)
+        return await self._executor.offload(fn, *args)
+
+
+def encode_event(event) -> bytes:
+    """Encode a Server-Sent Event"""
+    if not isinstance(event, dict):
+        event = {"data": event}
+    lines = []
+    for field in ("event", "id", "retry"):
+        if event.get(field) is not None:
+            lines.append(f"{field}: {event[field]}")
+    data = event.get("data", "")
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    elif not isinstance(data, str):
+        data = json.dumps(data, separators=(",", ":"))
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+def _encode(headers):
+    """Headers as a new list of encoded pairs, given a dict or list"""
+    if not headers:
+        return []
+    if isinstance(headers, dict):
+        headers = headers.items()
+    return [(k.encode("latin-1") if isinstance(k, str) else k,
+             v.encode("latin-1") if isinstance(v, str) else v)
+            for k, v in headers]
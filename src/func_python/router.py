@@ -0,0 +1,168 @@
+import fnmatch
+import os
+import re
+
+import func_python.executor
+
+DEFAULT_UNROUTED = '404'
+
+UNROUTED_POLICIES = ('404', 'ignore')
+
+# Bound on the cache of resolved (type, source) pairs
+MAX_CACHED_ROUTES = 1024
+
+
+class Router:
+    """
+    Router dispatches CloudEvents to handlers registered by their type, a
+    prefix of their type, or a pattern (with the wildcards of fnmatch)
+    matching their source:
+
+        router = Router()
+
+        @router.type("com.example.order.created")
+        async def created(scope, receive, send): ...
+
+        @router.prefix("com.example.order.")
+        async def order(scope, receive, send): ...
+
+        @router.source("https://example.com/legacy/*")
+        def legacy(scope, receive, send): ...
+
+        handle = router
+
+    An exact type takes precedence over the longest matching prefix, which
+    takes precedence over the first matching source pattern, and then the
+    default handler if one is registered.  Registrations are compiled when
+    the Function starts into a dict of types, a trie of prefixes and a
+    single expression of source patterns, so that dispatch does not slow
+    as routes are added, and resolved routes are cached.
+
+    Events matching no route are answered without invoking the Function,
+    according to 'FUNC_UNROUTED': "404" for a 404 Not Found, or "ignore" for
+    a 202 Accepted.
+    """
+
+    def __init__(self, unrouted: str | None = None):
+        if unrouted is None:
+            unrouted = os.getenv('FUNC_UNROUTED', DEFAULT_UNROUTED)
+        if unrouted not in UNROUTED_POLICIES:
+            raise ValueError(f"invalid unrouted policy: <{unrouted}>, "
+                             f"expected one of {UNROUTED_POLICIES}")
+        self.unrouted = unrouted
+        self._types = {}
+        self._prefixes = {}
+        self._sources = []
+        self._default = None
+        self._compiled = False
+
+    def type(self, event_type: str, handler=None):
+        """ Route events of exactly event_type to the handler """
+        return self._register(self._types, event_type, handler)
+
+    def prefix(self, prefix: str, handler=None):
+        """ Route events whose type starts with prefix to the handler """
+        return self._register(self._prefixes, prefix, handler)
+
+    def source(self, pattern: str, handler=None):
+        """ Route events whose source matches the pattern to the handler """
+        def register(handler):
+            self._sources.append((pattern, handler))
+            self._compiled = False
+            return handler
+        return register(handler) if handler is not None else register
+
+    def default(self, handler):
+        """ Route events matching no other route to the handler """
+        self._default = handler
+        self._compiled = False
+        return handler
+
+    def _register(self, routes, key, handler):
+        def register(handler):
+            if key in routes:
+                raise ValueError(f"route already registered: <{key}>")
+            routes[key] = handler
+            self._compiled = False
+            return handler
+        return register(handler) if handler is not None else register
+
+    def compile(self):
+        """ Compile the routes for dispatch.  This is done when the Function
+        starts, and again if routes are registered afterwards. """
+        route = _route
+        self._type_routes = {t: route(h) for t, h in self._types.items()}
+        self._trie = {}
+        for prefix, handler in self._prefixes.items():
+            node = self._trie
+            for c in prefix:
+                node = node.setdefault(c, {})
+            node[None] = route(handler)
+        self._source_routes = [route(h) for _, h in self._sources]
+        self._source_pattern = re.compile('|'.join(
+            f'(?P<s{i}>{fnmatch.translate(p)})'
+            for i, (p, _) in enumerate(self._sources))) \
+            if self._sources else None
+        self._default_route = route(self._default) \
+            if self._default is not None else None
+        self._resolved = {}
+        self._compiled = True
+
+    def resolve(self, event):
+        """ Returns the (handler, is_async) route for the event, or None if
+        it matches no route """
+        if not self._compiled:
+            self.compile()
+        if event is None:
+            return self._default_route
+        event_type, source = event.get_type(), event.get_source()
+        key = (event_type, source)
+        try:
+            return self._resolved[key]
+        except KeyError:
+            pass
+        route = self._type_routes.get(event_type)
+        if route is None:
+            route = self._match_prefix(event_type)
+        if route is None and self._source_pattern is not None and source:
+            match = self._source_pattern.match(source)
+            if match is not None:
+                route = self._source_routes[int(match.lastgroup[1:])]
+        if route is None:
+            route = self._default_route
+        if len(self._resolved) < MAX_CACHED_ROUTES:
+            self._resolved[key] = route
+        return route
+
+    def _match_prefix(self, event_type):
+        node, route = self._trie, self._trie.get(None)
+        for c in event_type:
+            node = node.get(c)
+            if node is None:
+                break
+            route = node.get(None, route)
+        return route
+
+    async def respond_unrouted(self, send):
+        """ Answer an event which matched no route """
+        status = 202 if self.unrouted == 'ignore' else 404
+        await send.http({'type': 'http.response.start', 'status': status,
+                         'headers': [(b'content-length', b'0')]})
+        await send.http({'type': 'http.response.body', 'body': b''})
+
+    async def __call__(self, scope, receive, send):
+        """ Dispatch the event, when the Router is used other than as the
+        Function's handle.  Synchronous handlers are called directly. """
+        route = self.resolve(scope.get("event"))
+        if route is None:
+            await self.respond_unrouted(send)
+            return
+        handler, is_async = route
+        if is_async:
+            await handler(scope, receive, send)
+        else:
+            handler(scope, receive, send)
+
+
+def _route(handler):
+    return handler, func_python.executor.is_async(handler)
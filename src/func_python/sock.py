@@ -2,19 +2,41 @@ import ipaddress
 import logging
 import os
 import socket
+import stat
 
 
 DEFAULT_LISTEN_ADDRESS = '[::]:8080,0.0.0.0:8080'
+DEFAULT_BACKLOG = socket.SOMAXCONN
+DEFAULT_SOCKET_OPTIONS = 'nodelay=1'
 
-def bind() -> list[str]:
+# Socket options which may be set for all listen addresses with 'FUNC_SOCKET_OPTIONS', or for a single address
+# after a "?", both in the form "name=value&name=value".  Options the platform does not support are skipped.
+SOCKET_OPTIONS = {
+    'nodelay': ('IPPROTO_TCP', 'TCP_NODELAY'),
+    'defer_accept': ('IPPROTO_TCP', 'TCP_DEFER_ACCEPT'),
+    'fastopen': ('IPPROTO_TCP', 'TCP_FASTOPEN'),
+    'rcvbuf': ('SOL_SOCKET', 'SO_RCVBUF'),
+    'sndbuf': ('SOL_SOCKET', 'SO_SNDBUF'),
+    'reuseport': ('SOL_SOCKET', 'SO_REUSEPORT'),
+}
+
+def bind(reuse_port: bool = False, backlog: int = DEFAULT_BACKLOG,
+         shared: dict[str, socket.socket] | None = None) -> list[str]:
     """
     This function reads the 'LISTEN_ADDRESS' environment variable and binds sockets according to it's content.
     This function gives us some more control over how sockets are created.
     We creat them ourselves here, and forward them in the "fd://{fd}" format to the hypercorn server.
+    Sockets are listening once bound, so that connections arriving while the Function starts are queued.
+    :param reuse_port: Set SO_REUSEPORT so that several worker processes can each bind their own listener
+                       on the same address, with the kernel balancing connections between them.
+    :param backlog: The listen backlog.  The server listens with the same backlog, which is shared by all sockets.
+    :param shared: Unix domain sockets bound by the supervisor with bind_shared, by address, which are used in place of
+                   binding them again when reuse_port is set.
     :return: Sequence of "bind" strings in format expected by the hypercorn server config.
     """
 
     listen_addresses = os.getenv('LISTEN_ADDRESS', DEFAULT_LISTEN_ADDRESS).split(",")
+    defaults = parse_options(os.getenv('FUNC_SOCKET_OPTIONS', DEFAULT_SOCKET_OPTIONS))
 
     fixup_ipv4_unspecified(listen_addresses)
 
@@ -22,10 +44,32 @@ def bind() -> list[str]:
     result: list[str] = []
 
     for address in listen_addresses:
+        address, _, query = address.partition("?")
+        options = dict(defaults, **parse_options(query))
+        if reuse_port:
+            options['reuseport'] = 1
+        sock: socket.socket
+
         if address.startswith("unix://") or address.startswith("fd://"):
-            logging.error(f'unsupported schema: <{address}>')
+            if address.startswith("unix://") and reuse_port and address not in (shared or {}):
+                if shared is None:
+                    logging.error(f'not binding <{address}> since unix sockets can not be shared by workers')
+                continue  # the supervisor logged why it could not be bound
+            try:
+                if address.startswith("unix://") and reuse_port:
+                    sock = shared[address].dup()
+                elif address.startswith("unix://"):
+                    sock = bind_unix(address[len("unix://"):], options)
+                else:
+                    sock = inherit_fd(address[len("fd://"):])
+                    set_options(sock, options)
+                sock.listen(backlog)
+            except (OSError, ValueError) as e:
+                logging.error(f"cannot bind socket <{address}>: {e}")
+                continue
+            log_options(address, sock, backlog)
+            result.append(f'fd://{sock.detach()}')
             continue
-        sock: socket.socket
 
         [host, port] = address.rsplit(":", 1)
         if '[' in host:
@@ -42,17 +86,178 @@ def bind() -> list[str]:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+            raise Exception('SO_REUSEPORT is not supported on this platform')
+        set_options(sock, options)
         try:
             sock.bind((host, int(port)))
-            result.append(f'fd://{sock.detach()}')
+            sock.listen(backlog)
         except socket.error as e:
             logging.error(f"cannot bind socket <{address}>: {e}")
+            sock.close()
+            continue
+        log_options(address, sock, backlog)
+        result.append(f'fd://{sock.detach()}')
 
     if len(result) <= 0:
         raise Exception('failed to bind any sockets')
 
     return result
 
+def bind_shared(backlog: int = DEFAULT_BACKLOG) -> dict[str, socket.socket]:
+    """
+    This function binds the unix domain sockets of the 'LISTEN_ADDRESS' environment variable once, before worker
+    processes are forked, as unlike TCP sockets they can not each bind their own with SO_REUSEPORT.  The workers inherit
+    the listening sockets, which are passed to bind, and share them.  Addresses which can not be bound are logged and
+    skipped.
+    :param backlog: The listen backlog.
+    :return: Mapping of the unix addresses to their listening sockets, which the caller must close.
+    """
+    defaults = parse_options(os.getenv('FUNC_SOCKET_OPTIONS', DEFAULT_SOCKET_OPTIONS))
+    result: dict[str, socket.socket] = {}
+    for address in os.getenv('LISTEN_ADDRESS', DEFAULT_LISTEN_ADDRESS).split(","):
+        address, _, query = address.partition("?")
+        if not address.startswith("unix://") or address in result:
+            continue
+        try:
+            sock = bind_unix(address[len("unix://"):], dict(defaults, **parse_options(query)))
+            sock.listen(backlog)
+        except (OSError, ValueError) as e:
+            logging.error(f"cannot bind socket <{address}>: {e}")
+            continue
+        result[address] = sock
+    return result
+
+
+def parse_options(query: str) -> dict[str, int]:
+    """
+    This function parses socket options in the form "name=value&name=value".
+    Values are integers, or "true" and "false" for flags.
+    """
+    options = {}
+    for option in filter(None, query.split("&")):
+        name, _, value = option.partition("=")
+        if name not in SOCKET_OPTIONS:
+            raise ValueError(f'unknown socket option: <{name}>')
+        if value.lower() in ('true', 'yes'):
+            value = '1'
+        elif value.lower() in ('false', 'no'):
+            value = '0'
+        try:
+            options[name] = int(value)
+        except ValueError:
+            raise ValueError(f'invalid value for socket option {name}: <{value}>')
+    return options
+
+
+def set_options(sock: socket.socket, options: dict[str, int]) -> None:
+    """
+    This function sets the given socket options, skipping TCP options on unix sockets and logging those the
+    platform does not support.
+    """
+    for name, value in options.items():
+        level, option = SOCKET_OPTIONS[name]
+        if level == 'IPPROTO_TCP' and sock.family == socket.AF_UNIX:
+            continue
+        if not hasattr(socket, option):
+            logging.warning(f'socket option {option} is not supported on this platform')
+            continue
+        try:
+            sock.setsockopt(getattr(socket, level), getattr(socket, option), value)
+        except socket.error as e:
+            logging.warning(f"cannot set {option}: {e}")
+
+
+def log_options(address: str, sock: socket.socket, backlog: int) -> None:
+    """
+    This function logs the effective options of a listening socket, as read back from the kernel.
+    """
+    try:
+        with open('/proc/sys/net/core/somaxconn') as f:
+            backlog = min(backlog, int(f.read()))
+    except (OSError, ValueError):
+        pass
+    effective = [f'backlog={backlog}']
+    for name, (level, option) in SOCKET_OPTIONS.items():
+        if (level == 'IPPROTO_TCP' and sock.family == socket.AF_UNIX) or not hasattr(socket, option):
+            continue
+        try:
+            effective.append(f'{name}={sock.getsockopt(getattr(socket, level), getattr(socket, option))}')
+        except socket.error:
+            continue
+    logging.info(f'listening on <{address}>: {" ".join(effective)}')
+
+
+def bind_unix(path: str, options: dict[str, int] | None = None) -> socket.socket:
+    """
+    This function binds a unix domain socket at the given path, removing any stale socket left there by a previous
+    process.  Paths starting with "@" are in the abstract namespace.
+    The socket's permissions are set from the 'FUNC_SOCKET_MODE' environment variable (octal, e.g. "660") if present.
+    """
+    abstract = path.startswith("@")
+    if abstract:
+        path = "\0" + path[1:]
+    else:
+        remove_stale_unix_socket(path)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        set_options(sock, options or {})
+        sock.bind(path)
+        mode = os.getenv('FUNC_SOCKET_MODE')
+        if mode and not abstract:
+            os.chmod(path, int(mode, 8))
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def remove_stale_unix_socket(path: str) -> None:
+    """
+    This function removes a unix domain socket at the given path if no process is listening on it.
+    It raises a ValueError if something else exists at the path, or the socket is in use.
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError(f'{path} exists and is not a socket')
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        logging.info(f'removing stale socket {path}')
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise ValueError(f'{path} is in use by another process')
+
+
+def inherit_fd(value: str) -> socket.socket:
+    """
+    This function validates a listening socket inherited as a file descriptor, such as through socket activation
+    or from a process handing over its listeners.
+    """
+    fd = int(value)
+    if not stat.S_ISSOCK(os.fstat(fd).st_mode):
+        raise ValueError(f'file descriptor {fd} is not a socket')
+    sock = socket.socket(fileno=fd)
+    try:
+        if sock.type != socket.SOCK_STREAM:
+            raise ValueError(f'file descriptor {fd} is not a stream socket')
+        if sock.family not in (socket.AF_INET, socket.AF_INET6, socket.AF_UNIX):
+            raise ValueError(f'file descriptor {fd} has unsupported address family {sock.family!r}')
+        if sock.family != socket.AF_UNIX and sock.getsockname()[1] == 0:
+            raise ValueError(f'file descriptor {fd} is not bound')
+    except BaseException:
+        sock.detach()
+        raise
+    return sock
+
+
 def fixup_ipv4_unspecified(listen_addresses: list[str]) -> None:
     """
     This function checks if the listen addresses contains unspecified IPv6 address but not unspecified IPv4 address.
@@ -0,0 +1,60 @@
+import logging
+import os
+import time
+
+# Used as the start of the process where its actual start time is unknown
+_imported = time.monotonic()
+
+
+def enabled() -> bool:
+    """ Returns true if the startup profile is enabled with
+    'FUNC_STARTUP_PROFILE' """
+    return os.getenv('FUNC_STARTUP_PROFILE', 'false').lower() \
+        in ('1', 'true', 'yes')
+
+
+def process_age() -> float:
+    """
+    Returns the seconds since the process started.  This is read from the
+    kernel on Linux (to the resolution of a clock tick), and is otherwise the
+    time since this module was imported.
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            # The command name may contain spaces, so fields are counted
+            # from the end of it.  The start time is field 22.
+            fields = f.read().rsplit(')', 1)[1].split()
+        started = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - started
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.monotonic() - _imported
+
+
+class Profile:
+    """
+    Profile logs the time taken by each phase of starting the Function when
+    'FUNC_STARTUP_PROFILE' is enabled: importing (everything before serve is
+    called), new(), binding sockets, the lifespan startup and the first
+    request.  Each is logged with its duration and the time since the
+    process started.
+    """
+
+    def __init__(self, enabled_: bool | None = None):
+        if enabled_ is None:
+            enabled_ = enabled()
+        self.enabled = enabled_
+        self.phases = []
+        self._last = time.monotonic() - process_age()
+
+    def mark(self, phase: str):
+        """ Record the end of a phase """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        self.phases.append((phase, now - self._last))
+        logging.info(f"startup: {phase} took {(now - self._last) * 1000:.1f}ms, "
+                     f"{self.total() * 1000:.1f}ms since process start")
+        self._last = now
+
+    def total(self) -> float:
+        return sum(duration for _, duration in self.phases)
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import os
+import time
+
+DEFAULT_REQUEST_TIMEOUT = 0.0  # seconds, zero is unlimited
+
+
+def remaining(scope) -> float | None:
+    """ Returns the seconds remaining before the request times out, or None
+    if it has no timeout.  Use this to budget calls made while handling. """
+    deadline = scope.get("deadline")
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+class Timeouts:
+    """
+    Timeouts are the time allowed for the Function to handle a request:
+    'FUNC_REQUEST_TIMEOUT' seconds, where zero is unlimited.  This may be
+    overridden by 'FUNC_REQUEST_TIMEOUTS', a comma-separated list of
+    "key=seconds" in which keys beginning with "/" are path prefixes (the
+    longest matching prefix applies) and others are CloudEvent types, which
+    take precedence over paths.
+
+    A request which times out has its handler cancelled, and is answered
+    with a 504 if the response had not yet started.  Its deadline, as a
+    time.monotonic() value, is given to the handler as scope["deadline"].
+    """
+
+    def __init__(self, default: float | None = None,
+                 overrides: str | None = None):
+        if default is None:
+            default = float(os.getenv('FUNC_REQUEST_TIMEOUT',
+                                      DEFAULT_REQUEST_TIMEOUT))
+        if overrides is None:
+            overrides = os.getenv('FUNC_REQUEST_TIMEOUTS', '')
+        self.default = default
+        self.types = {}
+        prefixes = {}
+        for override in filter(None, overrides.split(',')):
+            key, _, seconds = override.strip().rpartition('=')
+            try:
+                seconds = float(seconds)
+            except ValueError:
+                raise ValueError(f"invalid request timeout: <{override}>")
+            if not key:
+                raise ValueError(f"invalid request timeout: <{override}>")
+            if key.startswith('/'):
+                prefixes[key] = seconds
+            else:
+                self.types[key] = seconds
+        # Longest first, so that the first match is the most specific
+        self.prefixes = sorted(prefixes.items(), key=lambda p: -len(p[0]))
+        self.enabled = default > 0 or any(
+            t > 0 for t in (*self.types.values(), *prefixes.values()))
+        self.expired = 0
+
+    def get(self, path: str, type: str | None = None) -> float:
+        """ Returns the timeout for a request, or zero if it has none """
+        if type is not None and type in self.types:
+            return self.types[type]
+        for prefix, seconds in self.prefixes:
+            if path.startswith(prefix):
+                return seconds
+        return self.default
+
+    async def run(self, coro, scope, timeout: float):
+        """
+        Await the handler coroutine with the given timeout, setting the
+        request's deadline in the scope.  Returns True if it timed out.
+        """
+        deadline = scope["deadline"] = time.monotonic() + timeout
+        try:
+            await asyncio.wait_for(coro, timeout)
+        except asyncio.TimeoutError:
+            if time.monotonic() < deadline:
+                raise  # raised by the handler itself
+            self.expired += 1
+            logging.warning(f"request to {scope['path']} timed out after "
+                            f"{timeout}s")
+            return True
+        return False
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+import func_python.health
+
+DEFAULT_WARMUP_TIMEOUT = 30.0  # seconds, zero waits indefinitely
+
+
+def request(r: dict):
+    """ Returns the ASGI (scope, receive) of a synthetic request, given as a
+    dict with any of "method", "path", "query_string", "headers" (a dict or
+    a list of pairs) and "body" (bytes, a string, or a value to encode as
+    JSON). """
+    headers = r.get("headers", [])
+    if isinstance(headers, dict):
+        headers = headers.items()
+    headers = [(_bytes(k).lower(), _bytes(v)) for k, v in headers]
+    body = r.get("body", b"")
+    if not isinstance(body, (bytes, str)):
+        body = json.dumps(body)
+        if not any(k == b"content-type" for k, _ in headers):
+            headers.append((b"content-type", b"application/json"))
+    body = _bytes(body)
+    headers.append((b"content-length", str(len(body)).encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": r.get("method", "POST" if body else "GET").upper(),
+        "scheme": "http",
+        "path": r.get("path", "/"),
+        "raw_path": _bytes(r.get("path", "/")),
+        "query_string": _bytes(r.get("query_string", b"")),
+        "root_path": "",
+        "headers": headers,
+        "client": None,
+        "server": None,
+        "extensions": {},
+        "warmup": True,
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        return {"type": "http.disconnect"}
+
+    return scope, receive
+
+
+async def discard(message):
+    """ An ASGI send which discards the response """
+
+
+def _bytes(value) -> bytes:
+    return value.encode("latin-1") if isinstance(value, str) else value
+
+
+class Warmup:
+    """
+    Warmup sends synthetic requests through the Function before it reports
+    ready, so that caches, lazily imported modules and connections are warm
+    when Knative routes traffic to it.
+
+    The requests are the Function's optional 'warmup' attribute: a list, or
+    a method (which may be a coroutine) returning one.  They are sent in
+    the background once the Function has started, one at a time, and their
+    responses are discarded.  Readiness fails until they are complete, or
+    until 'FUNC_WARMUP_TIMEOUT' seconds have passed.  Errors are logged, and
+    do not prevent the Function from becoming ready.
+    """
+
+    def __init__(self, f, executor=None, timeout: float | None = None):
+        if timeout is None:
+            timeout = float(os.getenv('FUNC_WARMUP_TIMEOUT',
+                                      DEFAULT_WARMUP_TIMEOUT))
+        self.f = f
+        self.executor = executor
+        self.timeout = timeout
+        self.done = not hasattr(f, "warmup")
+        self.response = func_python.health.encode(False, "Warming up")
+        self._task = None
+
+    def start(self, send_request):
+        """ Start sending the requests, each with the coroutine function
+        send_request. """
+        if not self.done:
+            self._task = asyncio.create_task(self._run(send_request))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, send_request):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._send_all(send_request),
+                                   self.timeout or None)
+            logging.info(f"warm-up complete in "
+                         f"{(time.perf_counter() - started) * 1000:.1f}ms")
+        except asyncio.TimeoutError:
+            logging.warning(f"warm-up did not complete within "
+                            f"{self.timeout}s")
+        except Exception as e:
+            logging.error(f"warm-up failed: {e}")
+        finally:
+            self.done = True
+
+    async def _send_all(self, send_request):
+        requests = self.f.warmup
+        if callable(requests):
+            if self.executor is not None:
+                requests = await self.executor.call(requests)
+            else:
+                requests = requests()
+        for r in requests or ():
+            try:
+                await send_request(r)
+            except Exception as e:
+                logging.warning(f"warm-up request failed: {e}")
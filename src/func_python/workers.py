@@ -0,0 +1,182 @@
+import logging
+import os
+import signal
+import time
+
+import func_python.config
+import func_python.drain
+
+DEFAULT_WORKERS = 1
+
+# Seconds allowed beyond draining for a worker to call the Function's stop
+# and exit, when 'FUNC_WORKER_SHUTDOWN_TIMEOUT' is not set.
+SHUTDOWN_MARGIN = 5.0
+
+# Workers which exit sooner than this after being started are considered to
+# be crash-looping, and are restarted only after waiting this long.
+RESTART_BACKOFF = 1.0
+
+# Consecutive crash-looping exits after which the supervisor gives up, as
+# the workers are most likely failing to start (failing to bind, say).
+MAX_FAILED_STARTS = 5
+
+
+def count(workers=None) -> int:
+    """
+    Returns the number of worker processes to serve with.  An explicit value
+    takes precedence over the 'FUNC_WORKERS' environment variable.
+    """
+    if workers is None:
+        workers = os.getenv('FUNC_WORKERS', DEFAULT_WORKERS)
+    try:
+        workers = int(workers)
+    except ValueError:
+        raise ValueError(f"invalid number of workers: <{workers}>")
+    if workers < 1:
+        raise ValueError(f"number of workers must be at least 1, got {workers}")
+    return workers
+
+
+def worker_shutdown_timeout(graceful_timeout: float | None = None) -> float:
+    """
+    Returns the seconds to wait for workers to stop after SIGTERM before
+    killing them: 'FUNC_WORKER_SHUTDOWN_TIMEOUT' if it is set, and otherwise
+    long enough for a worker to drain, through the drain grace period
+    ('FUNC_DRAIN_GRACE_PERIOD') and the server's graceful timeout, and then
+    stop.  The graceful timeout is read from the environment if not given.
+    """
+    timeout = os.getenv('FUNC_WORKER_SHUTDOWN_TIMEOUT')
+    if timeout is not None:
+        return float(timeout)
+    if graceful_timeout is None:
+        graceful_timeout = func_python.config.hypercorn_config().graceful_timeout
+    grace_period = float(os.getenv('FUNC_DRAIN_GRACE_PERIOD',
+                                   func_python.drain.DEFAULT_DRAIN_GRACE_PERIOD))
+    return grace_period + graceful_timeout + SHUTDOWN_MARGIN
+
+
+def run(target, workers: int, shutdown_timeout: float | None = None) -> None:
+    """
+    Runs 'target' in the given number of forked worker processes and
+    supervises them until SIGINT or SIGTERM is received.  Exits with a
+    non-zero status if the workers repeatedly fail to start.
+    """
+    Supervisor(target, workers, shutdown_timeout).run()
+
+
+class Supervisor:
+    """
+    Supervisor forks a fixed number of worker processes, each of which runs
+    'target' (typically serving a function on its own event loop with its
+    own SO_REUSEPORT listeners).  Workers which exit unexpectedly are
+    restarted, unless 'MAX_FAILED_STARTS' exit in a row within
+    'RESTART_BACKOFF' of being started.  On SIGINT or SIGTERM the signal is
+    forwarded to the workers as SIGTERM so they can drain, and any still
+    running after the shutdown timeout (see worker_shutdown_timeout) are
+    killed.
+    """
+
+    def __init__(self, target, workers: int, shutdown_timeout: float | None = None):
+        self.target = target
+        self.workers = workers
+        if shutdown_timeout is None:
+            shutdown_timeout = worker_shutdown_timeout()
+        self.shutdown_timeout = shutdown_timeout
+        self.stopping = False
+        self.failed_starts = 0
+        self.processes = {}  # sentinel -> (process, start time)
+        # Imported here as it is only needed with more than one worker
+        import multiprocessing
+        self._context = multiprocessing.get_context('fork')
+
+    def run(self):
+        import multiprocessing.connection
+        handlers = {
+            s: signal.signal(s, self._handle_signal)
+            for s in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            logging.info(f"starting {self.workers} workers")
+            for _ in range(self.workers):
+                self._spawn()
+            restarts = []  # times at which to replace exited workers
+            while not self.stopping:
+                timeout = 1.0
+                if restarts:
+                    timeout = max(0.0, min(restarts) - time.monotonic())
+                if self.processes:
+                    exited = multiprocessing.connection.wait(
+                        list(self.processes), timeout=timeout)
+                else:
+                    exited = []
+                    time.sleep(timeout)
+                now = time.monotonic()
+                for sentinel in exited:
+                    process, started = self.processes.pop(sentinel)
+                    process.join()
+                    if self.stopping:
+                        break
+                    # Measured as the worker exits, rather than after waiting
+                    # to restart others, so quick exits are not missed.
+                    if now - started < RESTART_BACKOFF:
+                        self.failed_starts += 1
+                    else:
+                        self.failed_starts = 0
+                    if self.failed_starts >= MAX_FAILED_STARTS:
+                        logging.error(f"worker {process.pid} exited with code "
+                                      f"{process.exitcode}. Workers failed "
+                                      f"to start {self.failed_starts} times "
+                                      f"in a row: stopping.")
+                        raise SystemExit(1)
+                    logging.warning(f"worker {process.pid} exited with code "
+                                    f"{process.exitcode}. Restarting.")
+                    restarts.append(
+                        now + RESTART_BACKOFF if self.failed_starts else now)
+                while restarts and min(restarts) <= time.monotonic() \
+                        and not self.stopping:
+                    restarts.remove(min(restarts))
+                    self._spawn()
+        finally:
+            self._shutdown()
+            for s, handler in handlers.items():
+                signal.signal(s, handler)
+
+    def _spawn(self):
+        # Not a daemon, so that the Function may start processes of its own;
+        # workers are stopped by _shutdown however the supervisor exits.
+        process = self._context.Process(target=_worker, args=(self.target,))
+        process.start()
+        self.processes[process.sentinel] = (process, time.monotonic())
+        logging.debug(f"worker {process.pid} started")
+
+    def _handle_signal(self, signum, frame):
+        if self.stopping:
+            return
+        logging.info("Signal received: stopping workers")
+        self.stopping = True
+        for process, _ in self.processes.values():
+            if process.is_alive():
+                process.terminate()  # SIGTERM
+
+    def _shutdown(self):
+        self.stopping = True
+        deadline = time.monotonic() + self.shutdown_timeout
+        for process, _ in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process, _ in self.processes.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logging.warning(f"worker {process.pid} did not stop within "
+                                f"{self.shutdown_timeout}s. Killing.")
+                process.kill()
+                process.join()
+        self.processes.clear()
+
+
+def _worker(target):
+    # The supervisor's handlers were inherited across the fork; restore
+    # the defaults so the server in this process installs its own.
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    target()
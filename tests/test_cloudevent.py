@@ -1,3 +1,7 @@
+import asyncio
+import datetime
+import gzip
+import http.server
 import httpx
 import json
 import logging
@@ -7,8 +11,18 @@ import threading
 import time
 import uuid
 import pytest
-from func_python.cloudevent import serve
-from cloudevents.core.bindings.http import to_structured_event
+import sys
+import func_python.cloudevent
+import func_python.codec
+from func_python.client import Pool
+from func_python.cloudevent import Emitter, serve
+from func_python.dedup import Backend, Dedup, MemoryBackend
+from func_python.ordering import Ordering
+from func_python.router import Router
+from cloudevents.core.bindings.http import (
+    HTTPMessage, from_binary_event, to_binary_event, to_structured_event)
+from cloudevents.core.formats.json import JSONFormat
+from cloudevents.core.v03.event import CloudEvent as CloudEventV03
 from cloudevents.core.v1.event import CloudEvent
 
 logging.basicConfig(level=logging.INFO)
@@ -314,3 +328,949 @@ def wait_for_function():
             logging.info(f"Retrying ({i+1}/{max_retries})...")
             if i >= max_retries:
                 raise FunctionNotAvailableError(f"Function at {LISTEN_ADDRESS} did not start after {max_retries} attempts")
+
+
+def test_metrics(monkeypatch):
+    """
+    Tests that handled events are recorded, by type, at the metrics endpoint.
+    """
+    monkeypatch.setenv("FUNC_METRICS", "true")
+
+    async def handle(scope, receive, send):
+        await send(CloudEvent(attributes={"type": "com.example.response",
+                                          "source": "test"},
+                              data={"message": "OK"}))
+
+    test_complete = threading.Event()
+    test_results = {"success": False, "error": None}
+
+    def test():
+        try:
+            wait_for_function()
+
+            msg = to_structured_event(CloudEvent(
+                attributes={"type": "com.example.metrics",
+                            "source": "https://example.com/event-producer"},
+                data={"message": "test_metrics"}))
+            response = httpx.post(f"http://{LISTEN_ADDRESS}",
+                                  headers=msg.headers, content=msg.body)
+            assert response.status_code == 200
+
+            response = httpx.get(f"http://{LISTEN_ADDRESS}/metrics")
+            assert response.status_code == 200
+            lines = response.text.splitlines()
+            assert 'func_requests_total{type="com.example.metrics",status="200"} 1' in lines
+            assert 'func_request_duration_seconds_count{type="com.example.metrics"} 1' in lines
+            assert 'func_requests_inflight 0' in lines
+
+            test_results["success"] = True
+        except Exception as e:
+            test_results["error"] = str(e)
+        finally:
+            test_complete.set()
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.daemon = True
+    test_thread.start()
+
+    serve(handle)
+
+    if not test_complete.wait(10):
+        pytest.fail("Test timed out")
+
+    if not test_results["success"]:
+        pytest.fail(test_results["error"] or "Test failed")
+
+
+def test_batch(monkeypatch):
+    """
+    Tests that batched CloudEvents are fanned out to the handler, one event
+    at a time, and that their responses are returned as a batch.
+    """
+    monkeypatch.setenv("FUNC_BATCH_PARALLELISM", "2")
+
+    async def handle(scope, receive, send):
+        event = scope["event"]
+        await send(CloudEvent(
+            attributes={"type": "com.example.response", "source": "test"},
+            data={"received": event.get_data()["n"]}))
+
+    test_complete = threading.Event()
+    test_results = {"success": False, "error": None}
+
+    def test():
+        try:
+            wait_for_function()
+
+            batch = "[" + ",".join(
+                to_structured_event(CloudEvent(
+                    attributes={"type": "com.example.batch",
+                                "source": "https://example.com/producer"},
+                    data={"n": n})).body.decode()
+                for n in range(5)) + "]"
+            response = httpx.post(
+                f"http://{LISTEN_ADDRESS}",
+                headers={"content-type": "application/cloudevents-batch+json"},
+                content=batch)
+
+            assert response.status_code == 200
+            assert response.headers["content-type"] == \
+                "application/cloudevents-batch+json"
+            events = json.loads(response.text)
+            assert [e["data"]["received"] for e in events] == [0, 1, 2, 3, 4]
+            assert all(e["type"] == "com.example.response" for e in events)
+
+            test_results["success"] = True
+        except Exception as e:
+            test_results["error"] = str(e)
+        finally:
+            test_complete.set()
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.daemon = True
+    test_thread.start()
+
+    serve(handle)
+
+    if not test_complete.wait(10):
+        pytest.fail("Test timed out")
+
+    if not test_results["success"]:
+        pytest.fail(test_results["error"] or "Test failed")
+
+
+def test_lazy_events(monkeypatch):
+    """
+    Tests that in lazy mode binary events' attributes are available without
+    reading the body, and that the data can be read on demand.
+    """
+    monkeypatch.setenv("FUNC_LAZY_EVENTS", "true")
+
+    async def handle(scope, receive, send):
+        event = scope["event"]
+        if event.get_type() == "com.example.ignored":
+            await send.http({'type': 'http.response.start', 'status': 202,
+                             'headers': []})
+            await send.http({'type': 'http.response.body', 'body': b''})
+            return
+        data = await event.data()
+        await send(CloudEvent(
+            attributes={"type": "com.example.response", "source": "test"},
+            data={"received": data, "subject": event.get_subject()}))
+
+    test_complete = threading.Event()
+    test_results = {"success": False, "error": None}
+
+    def test():
+        try:
+            wait_for_function()
+
+            headers = {"ce-id": "1", "ce-specversion": "1.0",
+                       "ce-source": "https://example.com/producer",
+                       "ce-subject": "a%20b",
+                       "content-type": "application/json"}
+            response = httpx.post(
+                f"http://{LISTEN_ADDRESS}",
+                headers=dict(headers, **{"ce-type": "com.example.ignored"}),
+                content=b'{"message": "ignored"}')
+            assert response.status_code == 202
+
+            response = httpx.post(
+                f"http://{LISTEN_ADDRESS}",
+                headers=dict(headers, **{"ce-type": "com.example.lazy"}),
+                content=b'{"message": "test_lazy"}')
+            assert response.status_code == 200
+            data = json.loads(response.text)["data"]
+            assert data == {"received": {"message": "test_lazy"},
+                            "subject": "a b"}
+
+            test_results["success"] = True
+        except Exception as e:
+            test_results["error"] = str(e)
+        finally:
+            test_complete.set()
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.daemon = True
+    test_thread.start()
+
+    serve(handle)
+
+    if not test_complete.wait(10):
+        pytest.fail("Test timed out")
+
+    if not test_results["success"]:
+        pytest.fail(test_results["error"] or "Test failed")
+
+
+def test_lazy_event_errors(monkeypatch):
+    """
+    Tests that errors reading the body of a lazy event from within the
+    handler are answered with plain HTTP errors: 413 for an oversize body
+    and 400 for a corrupt compressed one.
+    """
+    monkeypatch.setenv("FUNC_LAZY_EVENTS", "true")
+    monkeypatch.setenv("FUNC_MAX_BODY_SIZE", "50")
+
+    async def handle(scope, receive, send):
+        data = await scope["event"].data()
+        await send(CloudEvent(
+            attributes={"type": "com.example.response", "source": "test"},
+            data={"received": data}))
+
+    test_complete = threading.Event()
+    test_results = {"success": False, "error": None}
+
+    def test():
+        try:
+            wait_for_function()
+
+            headers = {"ce-id": "1", "ce-specversion": "1.0",
+                       "ce-type": "com.example.lazy",
+                       "ce-source": "https://example.com/producer",
+                       "content-type": "application/json"}
+            response = httpx.post(
+                f"http://{LISTEN_ADDRESS}", headers=headers,
+                content=json.dumps({"message": "x" * 100}))
+            assert response.status_code == 413, response.text
+
+            response = httpx.post(
+                f"http://{LISTEN_ADDRESS}",
+                headers=dict(headers, **{"content-encoding": "gzip"}),
+                content=gzip.compress(b'{"message": "corrupt"}')[:-8])
+            assert response.status_code == 400, response.text
+
+            response = httpx.post(f"http://{LISTEN_ADDRESS}", headers=headers,
+                                  content=b'{"message": "ok"}')
+            assert response.status_code == 200, response.text
+
+            test_results["success"] = True
+        except Exception as e:
+            test_results["error"] = str(e)
+        finally:
+            test_complete.set()
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.daemon = True
+    test_thread.start()
+
+    serve(handle)
+
+    if not test_complete.wait(10):
+        pytest.fail("Test timed out")
+
+    if not test_results["success"]:
+        pytest.fail(test_results["error"] or "Test failed")
+
+
+def test_compressed_events(monkeypatch):
+    """
+    Tests that gzip encoded events are decompressed, that a body which
+    decompresses to more than the maximum size is rejected with a 413, and
+    that an unsupported encoding is rejected with a 415.
+    """
+    monkeypatch.setenv("FUNC_MAX_DECOMPRESSED_SIZE", "65536")
+
+    async def handle(scope, receive, send):
+        await send(CloudEvent(
+            attributes={"type": "com.example.response", "source": "test"},
+            data={"received": scope["event"].get_data()}))
+
+    test_complete = threading.Event()
+    test_results = {"success": False, "error": None}
+
+    def test():
+        try:
+            wait_for_function()
+
+            headers = {"ce-id": "1", "ce-specversion": "1.0",
+                       "ce-type": "com.example.compressed",
+                       "ce-source": "https://example.com/producer",
+                       "content-type": "application/json",
+                       "content-encoding": "gzip"}
+            response = httpx.post(
+                f"http://{LISTEN_ADDRESS}", headers=headers,
+                content=gzip.compress(b'{"message": "test_compressed"}'))
+            assert response.status_code == 200
+            data = json.loads(response.text)["data"]
+            assert data == {"received": {"message": "test_compressed"}}
+
+            bomb = gzip.compress(b'{"a": "' + b'0' * 10_000_000 + b'"}')
+            response = httpx.post(f"http://{LISTEN_ADDRESS}",
+                                  headers=headers, content=bomb)
+            assert response.status_code == 413
+
+            response = httpx.post(
+                f"http://{LISTEN_ADDRESS}",
+                headers=dict(headers, **{"content-encoding": "compress"}),
+                content=b'{}')
+            assert response.status_code == 415
+
+            test_results["success"] = True
+        except Exception as e:
+            test_results["error"] = str(e)
+        finally:
+            test_complete.set()
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.daemon = True
+    test_thread.start()
+
+    serve(handle)
+
+    if not test_complete.wait(10):
+        pytest.fail("Test timed out")
+
+    if not test_results["success"]:
+        pytest.fail(test_results["error"] or "Test failed")
+
+
+def test_dedup(monkeypatch):
+    """
+    Tests that redelivered events are answered with the original response
+    without invoking the handler again.
+    """
+    monkeypatch.setenv("FUNC_DEDUP_SIZE", "100")
+    monkeypatch.setenv("FUNC_DEDUP_REPLAY", "true")
+    invocations = []
+
+    async def handle(scope, receive, send):
+        invocations.append(scope["event"].get_id())
+        await send(CloudEvent(
+            attributes={"type": "com.example.response", "source": "test"},
+            data={"invocation": len(invocations)}))
+
+    test_complete = threading.Event()
+    test_results = {"success": False, "error": None}
+
+    def test():
+        try:
+            wait_for_function()
+
+            headers = {"ce-specversion": "1.0", "ce-type": "com.example.dedup",
+                       "ce-source": "https://example.com/producer",
+                       "content-type": "application/json"}
+            responses = [httpx.post(f"http://{LISTEN_ADDRESS}",
+                                    headers=dict(headers, **{"ce-id": id}),
+                                    content=b'{}')
+                         for id in ("1", "1", "2")]
+            assert [r.status_code for r in responses] == [200, 200, 200]
+            assert [json.loads(r.text)["data"]["invocation"]
+                    for r in responses] == [1, 1, 2]
+            assert invocations == ["1", "2"]
+
+            test_results["success"] = True
+        except Exception as e:
+            test_results["error"] = str(e)
+        finally:
+            test_complete.set()
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.daemon = True
+    test_thread.start()
+
+    serve(handle)
+
+    if not test_complete.wait(10):
+        pytest.fail("Test timed out")
+
+    if not test_results["success"]:
+        pytest.fail(test_results["error"] or "Test failed")
+
+
+def test_ordering(monkeypatch):
+    """
+    Tests that events of the same subject are handled one at a time and in
+    order, while events of different subjects are handled concurrently.
+    """
+    monkeypatch.setenv("FUNC_ORDER_BY", "subject")
+    handled = []
+    active = {}
+
+    async def handle(scope, receive, send):
+        event = scope["event"]
+        subject = event.get_subject()
+        active[subject] = active.get(subject, 0) + 1
+        assert active[subject] == 1, "events of a subject overlapped"
+        await asyncio.sleep(0.3)
+        handled.append((subject, event.get_data()["n"], len(active)))
+        active[subject] -= 1
+        if not active[subject]:
+            del active[subject]
+        await send(CloudEvent(
+            attributes={"type": "com.example.response", "source": "test"},
+            data={}))
+
+    test_complete = threading.Event()
+    test_results = {"success": False, "error": None}
+
+    def test():
+        try:
+            wait_for_function()
+
+            def post(subject, n):
+                httpx.post(f"http://{LISTEN_ADDRESS}", headers={
+                    "ce-id": f"{subject}{n}", "ce-specversion": "1.0",
+                    "ce-type": "com.example.ordered", "ce-subject": subject,
+                    "ce-source": "https://example.com/producer",
+                    "content-type": "application/json"},
+                    content=json.dumps({"n": n}))
+
+            threads = []
+            for n in range(3):
+                for subject in ("a", "b"):
+                    t = threading.Thread(target=post, args=(subject, n))
+                    t.start()
+                    threads.append(t)
+                    # Spaced so that the events arrive in the order sent
+                    time.sleep(0.05)
+            for t in threads:
+                t.join()
+
+            assert [n for s, n, _ in handled if s == "a"] == [0, 1, 2]
+            assert [n for s, n, _ in handled if s == "b"] == [0, 1, 2]
+            assert any(concurrent > 1 for _, _, concurrent in handled)
+
+            test_results["success"] = True
+        except Exception as e:
+            test_results["error"] = str(e)
+        finally:
+            test_complete.set()
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.daemon = True
+    test_thread.start()
+
+    serve(handle)
+
+    if not test_complete.wait(10):
+        pytest.fail("Test timed out")
+
+    if not test_results["success"]:
+        pytest.fail(test_results["error"] or "Test failed")
+
+
+def installed_codecs():
+    codecs = []
+    for name in func_python.codec.CODECS:
+        try:
+            codecs.append(func_python.codec.select(name))
+        except ImportError:
+            continue
+    return codecs
+
+
+def test_codec_select(monkeypatch):
+    """
+    Tests that the JSON codec is selected by name or, by default, as the
+    first installed, falling back when a package is missing.
+    """
+    monkeypatch.delenv("FUNC_JSON_CODEC", raising=False)
+    installed = [c.name for c in installed_codecs()]
+    assert installed[-1] == "json"
+    assert func_python.codec.select().name == installed[0]
+    for name in installed:
+        assert func_python.codec.select(name).name == name
+        monkeypatch.setenv("FUNC_JSON_CODEC", name)
+        assert func_python.codec.select().name == name
+    with pytest.raises(ValueError):
+        func_python.codec.select("simplejson")
+
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    assert func_python.codec.select("auto").name == \
+        [n for n in installed if n != "orjson"][0]
+    with pytest.raises(ImportError):
+        func_python.codec.select("orjson")
+    monkeypatch.setitem(sys.modules, "msgspec", None)
+    assert func_python.codec.select("auto").name == "json"
+
+
+def test_codec_dumps():
+    """
+    Tests that each codec encodes datetimes in RFC 3339 with UTC as "Z",
+    and that only msgspec encodes bytes rather than raising a TypeError.
+    """
+    utc = datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+    for codec in installed_codecs():
+        assert codec.loads(codec.dumps({"t": utc})) == \
+            {"t": "2024-01-02T03:04:05Z"}, codec.name
+        if codec.name == "msgspec":
+            assert codec.loads(codec.dumps({"b": b"\x00"})) == {"b": "AA=="}
+        else:
+            with pytest.raises(TypeError):
+                codec.dumps({"b": b"\x00"})
+        with pytest.raises(ValueError):
+            codec.loads(b"{")
+
+
+def test_event_format():
+    """
+    Tests that events written and read with each codec round-trip, and are
+    read identically by the SDK's JSON format: times, JSON data, binary data
+    as data_base64, and v0.3 binary data with datacontentencoding.
+    """
+    time = datetime.datetime(2024, 1, 2, 3, 4, 5, 123456,
+                             tzinfo=datetime.timezone.utc)
+    events = [
+        CloudEvent(attributes={"type": "com.example.json", "source": "/s",
+                               "time": time, "partitionkey": "k"},
+                   data={"message": "é", "n": [1, 2.5, None]}),
+        CloudEvent(attributes={"type": "com.example.binary", "source": "/s",
+                               "datacontenttype": "application/octet-stream"},
+                   data=b"\x00\xff"),
+        CloudEventV03(attributes={"type": "com.example.v03", "source": "/s",
+                                  "id": "1", "specversion": "0.3",
+                                  "datacontenttype": "application/octet-stream"},
+                      data=b"\x00\xff"),
+        CloudEvent(attributes={"type": "com.example.text", "source": "/s",
+                               "datacontenttype": "text/plain"},
+                   data="plain"),
+    ]
+    for codec in installed_codecs():
+        event_format = func_python.cloudevent.EventFormat(codec)
+        for event in events:
+            body = event_format.write(event)
+            structured = json.loads(body)
+            attributes = dict(event.get_attributes())
+            if isinstance(event.get_data(), bytes):
+                if event.get_specversion() == "0.3":
+                    assert structured["datacontentencoding"] == "base64"
+                    assert structured["data"] == "AP8="
+                    attributes["datacontentencoding"] = "base64"
+                else:
+                    assert structured["data_base64"] == "AP8="
+            for read in (event_format.read(None, body),
+                         JSONFormat().read(None, body)):
+                assert read.get_attributes() == attributes, codec.name
+                assert read.get_data() == event.get_data(), codec.name
+
+
+def test_event_time():
+    """
+    Tests that the times of structured and batched events are parsed as the
+    SDK's JSON format parses them, without the percent-decoding of binary
+    mode headers.
+    """
+    times = ["2020-01-01T00:00:00Z", "2020-01-01T00:00:00.123456+01:00"]
+    items = [{"specversion": "1.0", "id": str(i), "type": "com.example.time",
+              "source": "/s", "time": t} for i, t in enumerate(times)]
+    events = func_python.cloudevent.decode_batch(json.dumps(items).encode())
+    expected = [JSONFormat().read(None, json.dumps(item)).get_time()
+                for item in items]
+    assert [e.get_time() for e in events] == expected
+    assert expected[1].utcoffset() == datetime.timedelta(hours=1)
+
+    encoded = dict(items[0], time="2020-01-01T00:00:00%2B01:00")
+    with pytest.raises(ValueError):
+        func_python.cloudevent.decode_batch(json.dumps([encoded]).encode())
+    with pytest.raises(ValueError):
+        func_python.cloudevent.EVENT_FORMAT.read(None, json.dumps(encoded))
+
+
+def test_decode_data():
+    """
+    Tests that decode_data decodes JSON bytes, and strings with a JSON
+    content type, leaving other data and invalid JSON unchanged.
+    """
+    def event(data, datacontenttype=None):
+        attributes = {"type": "com.example.data", "source": "/s"}
+        if datacontenttype:
+            attributes["datacontenttype"] = datacontenttype
+        return CloudEvent(attributes=attributes, data=data)
+
+    decode_data = func_python.cloudevent.decode_data
+    assert decode_data(event(b'{"a": 1}')) == {"a": 1}
+    assert decode_data(event('{"a": 1}', "application/json")) == {"a": 1}
+    assert decode_data(event('{"a": 1}', "text/plain")) == '{"a": 1}'
+    assert decode_data(event(b'{"a"')) == b'{"a"'
+    assert decode_data(event({"a": 1})) == {"a": 1}
+    assert decode_data(event(None)) is None
+
+
+def binary_events():
+    utc = datetime.timezone.utc
+    plus_one = datetime.timezone(datetime.timedelta(hours=1))
+    return [
+        CloudEvent(attributes={
+            "type": "com.example.binary",
+            "source": 'https://example.com/a b?x="1"&y=100%',
+            "id": "é ü", "subject": "naïve/π", "partitionkey": "k 1",
+            "time": datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=utc),
+            "datacontenttype": "application/json"}, data={}),
+        CloudEvent(attributes={
+            "type": "com.example.binary", "source": "/source", "id": "2",
+            "time": datetime.datetime(2024, 1, 2, 3, 4, 5, 123456,
+                                      tzinfo=plus_one),
+            "dataschema": "https://example.com/schema"}, data={}),
+    ]
+
+
+def test_binary_headers():
+    """
+    Tests that binary mode headers are encoded as the SDK encodes them,
+    percent-encoding unsafe and non-ASCII values, formatting times in UTC
+    with a "Z", and that headers of a type are encoded once and reused.
+    """
+    func_python.cloudevent._templates.clear()
+    for event in binary_events():
+        headers = func_python.cloudevent.binary_headers(event)
+        assert all(v.isascii() for _, v in headers)
+        assert {k.decode(): v.decode() for k, v in headers} == \
+            to_binary_event(event).headers
+    assert len(func_python.cloudevent._templates) == 2
+
+    event = binary_events()[0]
+    template = func_python.cloudevent._templates[
+        tuple(event.get_attributes().get(a)
+              for a in func_python.cloudevent.TEMPLATE_ATTRIBUTES)]
+    headers = func_python.cloudevent.binary_headers(event)
+    assert headers[:len(template)] == template
+    assert len(func_python.cloudevent._templates) == 2
+
+
+def test_binary_headers_cache_bound(monkeypatch):
+    """
+    Tests that the header caches stop growing at MAX_CACHED_HEADERS, while
+    events beyond it are still encoded.
+    """
+    monkeypatch.setattr(func_python.cloudevent, "MAX_CACHED_HEADERS", 4)
+    func_python.cloudevent._templates.clear()
+    func_python.cloudevent._header_names.clear()
+    func_python.cloudevent._attribute_names.clear()
+    for i in range(10):
+        event = CloudEvent(attributes={
+            "type": f"com.example.{i}", "source": "/source",
+            f"ext{i}": "value"}, data={})
+        headers = func_python.cloudevent.binary_headers(event)
+        assert {k.decode(): v.decode() for k, v in headers} == \
+            to_binary_event(event).headers
+        attributes = func_python.cloudevent.binary_attributes(headers)
+        assert attributes[f"ext{i}"] == "value"
+    assert len(func_python.cloudevent._templates) == 4
+    assert len(func_python.cloudevent._header_names) == 4
+    assert len(func_python.cloudevent._attribute_names) == 4
+
+
+def test_binary_attributes():
+    """
+    Tests that binary mode attributes are decoded as the SDK decodes them,
+    percent-decoding values, parsing the time and taking datacontenttype
+    from the content-type header, whatever the case of header names.
+    """
+    for event in binary_events():
+        message = to_binary_event(event)
+        headers = [(k.encode(), v.encode())
+                   for k, v in message.headers.items()]
+        expected = from_binary_event(message).get_attributes()
+        assert func_python.cloudevent.binary_attributes(headers) == expected
+        headers = [(k.upper(), v) for k, v in headers]
+        assert func_python.cloudevent.binary_attributes(headers) == expected
+
+
+def test_dedup_cancelled():
+    """
+    Tests that a delivery cancelled while the dedup backend is queried does
+    not leave its duplicates waiting forever, and that a Backend must
+    implement both get and set.
+    """
+    class Incomplete(Backend):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+    class Slow(MemoryBackend):
+        async def get(self, key):
+            await asyncio.sleep(60)
+
+    dedup = Dedup(Slow(10), ttl=60)
+    key = ("/source", "1")
+
+    async def run():
+        first = asyncio.create_task(dedup.acquire(key))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        dedup.backend = MemoryBackend(10)
+        return await asyncio.wait_for(dedup.acquire(key), 1)
+
+    assert asyncio.run(run()) is None
+
+
+def test_ordering_max_keys():
+    """
+    Tests that events keep their order within a key when waiting for one of
+    a limited number of keys to finish, even if a new key arrives as soon as
+    it does.
+    """
+    ordering = Ordering("subject", max_keys=1)
+    handled = []
+    tasks = []
+
+    async def handler(name):
+        await asyncio.sleep(0.01)
+        handled.append(name)
+        if name == "A":
+            # C arrives just as A finishes, before B1 is resumed
+            tasks.append(asyncio.create_task(ordering.run("c", handler("C"))))
+
+    async def run():
+        for key, name in (("a", "A"), ("b", "B1"), ("b", "B2")):
+            tasks.append(asyncio.create_task(ordering.run(key, handler(name))))
+            await asyncio.sleep(0)
+        while not all(t.done() for t in tasks):
+            await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    # B and C take turns once both are waiting, with B's events in order
+    assert handled == ["A", "B1", "C", "B2"]
+    assert ordering.active == 0
+
+
+def test_ordering_fairness():
+    """
+    Tests that a key with steady traffic hands its slot to a key waiting for
+    one, rather than keeping it while it has events.
+    """
+    ordering = Ordering("subject", max_keys=1)
+    handled = []
+
+    async def handler(name):
+        await asyncio.sleep(0.001)
+        handled.append(name)
+
+    async def run():
+        tasks = []
+        for key, name in [("a", "A0"), ("b", "B")] + \
+                [("a", f"A{i}") for i in range(1, 20)]:
+            tasks.append(asyncio.create_task(ordering.run(key, handler(name))))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert handled[:2] == ["A0", "B"]
+    assert handled[2:] == [f"A{i}" for i in range(1, 20)]
+    assert ordering.active == 0
+
+
+def test_emitter(monkeypatch):
+    """
+    Tests that events emitted to K_SINK are delivered over a reused
+    connection, that failed deliveries are retried, and that events still
+    buffered are flushed when the Function stops.
+    """
+    received = []
+    ports = set()
+
+    class Sink(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["content-length"]))
+            ports.add(self.client_address[1])
+            status = 200
+            if self.headers["ce-id"] == "retried" and \
+                    "retried" not in [r for r, _ in received]:
+                status = 503
+            received.append((self.headers["ce-id"], status))
+            self.send_response(status)
+            self.send_header("content-length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    sink = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Sink)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    monkeypatch.setenv("K_SINK", f"http://127.0.0.1:{sink.server_port}/")
+    monkeypatch.setenv("FUNC_EMIT_BACKOFF", "0.01")
+
+    class Function:
+        def start(self, env):
+            self.emitter = Emitter(env["K_SINK"])
+
+        async def handle(self, scope, receive, send):
+            event = scope["event"]
+            await self.emitter.emit(CloudEvent(attributes={
+                "type": "com.example.emitted", "source": "test",
+                "id": event.get_id()}, data={"n": 1}))
+            if event.get_id() != "unflushed":
+                await self.emitter.flush()
+            await send(CloudEvent(
+                attributes={"type": "com.example.response",
+                            "source": "test"}, data={}))
+
+    test_complete = threading.Event()
+    test_results = {"success": False, "error": None}
+
+    def test():
+        try:
+            wait_for_function()
+            for id in ("1", "2", "retried", "3", "unflushed"):
+                response = httpx.post(f"http://{LISTEN_ADDRESS}", headers={
+                    "ce-id": id, "ce-specversion": "1.0",
+                    "ce-type": "com.example.emit",
+                    "ce-source": "https://example.com/producer",
+                    "content-type": "application/json"}, content=b'{}')
+                assert response.status_code == 200
+            test_results["success"] = True
+        except Exception as e:
+            test_results["error"] = str(e)
+        finally:
+            test_complete.set()
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.daemon = True
+    test_thread.start()
+
+    def new():
+        return Function()
+
+    serve(new)
+    sink.shutdown()
+
+    if not test_complete.wait(10):
+        pytest.fail("Test timed out")
+
+    if not test_results["success"]:
+        pytest.fail(test_results["error"] or "Test failed")
+    assert received == [("1", 200), ("2", 200), ("retried", 503),
+                        ("retried", 200), ("3", 200), ("unflushed", 200)]
+    assert len(ports) == 1
+
+
+def test_pool_interim_responses():
+    """
+    Tests that interim (1xx) responses from a sink are skipped, so that each
+    request receives its own final response on a reused connection.
+    """
+    ports = set()
+
+    class Sink(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["content-length"]))
+            ports.add(self.client_address[1])
+            self.send_response_only(103)
+            self.send_header("link", "</style.css>; rel=preload")
+            self.end_headers()
+            self.send_response(202)
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    sink = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Sink)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    async def run():
+        pool = Pool(f"http://127.0.0.1:{sink.server_port}/", size=1)
+        try:
+            return [await pool.request("POST", [], str(i).encode())
+                    for i in range(3)]
+        finally:
+            await pool.close()
+
+    try:
+        responses = asyncio.run(run())
+    finally:
+        sink.shutdown()
+    assert [(r.status, r.body) for r in responses] == \
+        [(202, b"0"), (202, b"1"), (202, b"2")]
+    assert len(ports) == 1
+
+
+def test_router(monkeypatch):
+    """
+    Tests that events are dispatched by exact type, then the longest type
+    prefix, then source pattern, that synchronous routes are supported, and
+    that unmatched events are answered with a 404.
+    """
+    router = Router()
+
+    def reply(send, route):
+        return send(CloudEvent(
+            attributes={"type": "com.example.response", "source": "test"},
+            data={"route": route}))
+
+    @router.type("com.example.order.created")
+    async def created(scope, receive, send):
+        await reply(send, "created")
+
+    @router.prefix("com.example.order.")
+    async def order(scope, receive, send):
+        await reply(send, "order")
+
+    @router.prefix("com.example.order.item.")
+    async def item(scope, receive, send):
+        await reply(send, "item")
+
+    @router.source("https://legacy.example.com/*")
+    def legacy(scope, receive, send):
+        send(CloudEvent(
+            attributes={"type": "com.example.response", "source": "test"},
+            data={"route": "legacy"}))
+
+    test_complete = threading.Event()
+    test_results = {"success": False, "error": None}
+
+    def test():
+        try:
+            wait_for_function()
+
+            def post(type, source="https://example.com/producer"):
+                return httpx.post(f"http://{LISTEN_ADDRESS}", headers={
+                    "ce-id": str(uuid.uuid4()), "ce-specversion": "1.0",
+                    "ce-type": type, "ce-source": source,
+                    "content-type": "application/json"}, content=b'{}')
+
+            routes = {}
+            for type, source in (
+                    ("com.example.order.created", None),
+                    ("com.example.order.cancelled", None),
+                    ("com.example.order.item.added", None),
+                    ("com.example.other", "https://legacy.example.com/a")):
+                response = post(type, source) if source else post(type)
+                assert response.status_code == 200
+                routes[type] = json.loads(response.text)["data"]["route"]
+            assert routes == {"com.example.order.created": "created",
+                              "com.example.order.cancelled": "order",
+                              "com.example.order.item.added": "item",
+                              "com.example.other": "legacy"}
+            assert post("com.example.other").status_code == 404
+
+            test_results["success"] = True
+        except Exception as e:
+            test_results["error"] = str(e)
+        finally:
+            test_complete.set()
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.daemon = True
+    test_thread.start()
+
+    class Function:
+        handle = router
+
+    def new():
+        return Function()
+
+    serve(new)
+
+    if not test_complete.wait(10):
+        pytest.fail("Test timed out")
+
+    if not test_results["success"]:
+        pytest.fail(test_results["error"] or "Test failed")
@@ -1,9 +1,22 @@
+import asyncio
+import gzip
 import httpx
 import logging
+import multiprocessing
 import os
+import pytest
 import signal
+import socket
+import stat
+import subprocess
+import sys
 import threading
 import time
+import func_python.body
+import func_python.response
+import func_python.sock
+import func_python.timeout
+import func_python.workers
 from func_python.http import serve
 
 logging.basicConfig(level=logging.INFO)
@@ -168,3 +181,1206 @@ def test_signal_handling():
         logging.info("SIGINT received and handled gracefully.")
 
     signal_thread.join(timeout=5)
+
+
+def test_workers():
+    """
+    ensures that a function served with multiple workers is handled by
+    separate processes, which may start processes of their own, and that a
+    crashed worker is replaced.
+    """
+    async def handle(scope, receive, send):
+        if scope['path'] == '/crash':
+            os._exit(1)
+        if scope['path'] == '/child':
+            # Daemonic processes are not allowed to have children
+            child = multiprocessing.get_context('fork').Process(target=int)
+            child.start()
+            child.join()
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [[b'content-type', b'text/plain']],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': str(os.getpid()).encode(),
+        })
+
+    results = {"pids": set(), "restarted": False}
+
+    def test():
+        try:
+            for i in range(20):
+                time.sleep(0.5)
+                try:
+                    httpx.get(f"http://{LISTEN_ADDRESS}")
+                    break
+                except httpx.ConnectError:
+                    continue
+
+            for _ in range(50):
+                response = httpx.get(f"http://{LISTEN_ADDRESS}")
+                assert response.status_code == 200
+                results["pids"].add(int(response.text))
+
+            response = httpx.get(f"http://{LISTEN_ADDRESS}/child")
+            results["child"] = response.status_code
+
+            # Crash a worker and expect a replacement to begin serving.
+            crashed = set(results["pids"])
+            try:
+                httpx.get(f"http://{LISTEN_ADDRESS}/crash")
+            except httpx.HTTPError:
+                pass
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                try:
+                    response = httpx.get(f"http://{LISTEN_ADDRESS}")
+                except httpx.HTTPError:
+                    continue
+                if int(response.text) not in crashed:
+                    results["restarted"] = True
+                    break
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle, workers=2)
+
+    test_thread.join(timeout=5)
+    assert os.getpid() not in results["pids"]
+    assert len(results["pids"]) == 2
+    assert results["child"] == 200
+    assert results["restarted"]
+
+
+def test_workers_failing(monkeypatch):
+    """
+    ensures that the supervisor stops with a non-zero exit, rather than
+    restarting them forever, when the workers fail to start.
+    """
+    monkeypatch.setattr(func_python.workers, 'RESTART_BACKOFF', 0.5)
+
+    class Function:
+        def __init__(self):
+            raise RuntimeError("cannot start")
+
+    def new():
+        return Function()
+
+    start = time.monotonic()
+    with pytest.raises(SystemExit) as e:
+        serve(new, workers=2)
+    assert e.value.code == 1
+    assert time.monotonic() - start < 10
+
+
+def test_body(monkeypatch):
+    """
+    ensures that the request body can be read with receive.body(), and that
+    bodies over the maximum size are rejected with a 413.
+    """
+    monkeypatch.setenv("FUNC_MAX_BODY_SIZE", "1024")
+
+    async def handle(scope, receive, send):
+        body = await receive.body()
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [[b'content-type', b'text/plain']],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': body,
+        })
+
+    results = {}
+
+    def test():
+        try:
+            wait_for_function()
+            results["small"] = httpx.post(f"http://{LISTEN_ADDRESS}",
+                                          content=b"x" * 100)
+            results["large"] = httpx.post(f"http://{LISTEN_ADDRESS}",
+                                          content=b"x" * 2048)
+            # Chunked, without a content-length
+            results["chunked"] = httpx.post(
+                f"http://{LISTEN_ADDRESS}",
+                content=iter([b"x" * 512] * 4))
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle)
+
+    test_thread.join(timeout=5)
+    assert results["small"].status_code == 200
+    assert results["small"].content == b"x" * 100
+    assert results["large"].status_code == 413
+    assert results["chunked"].status_code == 413
+
+
+def wait_for_function():
+    for i in range(20):
+        time.sleep(0.5)
+        try:
+            httpx.get(f"http://{LISTEN_ADDRESS}/health/liveness")
+            return
+        except httpx.ConnectError:
+            logging.info("... retrying server.")
+
+
+def test_probe_cache(monkeypatch):
+    """
+    ensures that readiness results are cached for the configured TTL.
+    """
+    monkeypatch.setenv("FUNC_PROBE_CACHE_TTL", "60")
+
+    class MyFunction:
+        def __init__(self):
+            self.checks = 0
+
+        async def handle(self, scope, receive, send):
+            pass
+
+        def ready(self):
+            self.checks += 1
+            return True, f"checked {self.checks}"
+
+    def new():
+        return MyFunction()
+
+    results = []
+
+    def test():
+        try:
+            wait_for_function()
+            for _ in range(5):
+                results.append(httpx.get(
+                    f"http://{LISTEN_ADDRESS}/health/readiness"))
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(new)
+
+    test_thread.join(timeout=5)
+    assert len(results) == 5
+    for response in results:
+        assert response.status_code == 200
+        assert response.text == "checked 1"
+
+
+def test_sync_handle():
+    """
+    ensures that synchronous handlers and hooks are run off the event loop,
+    such that a blocked handler does not prevent serving other requests.
+    """
+    release = threading.Event()
+
+    class MyFunction:
+        def __init__(self):
+            self.started = False
+
+        def start(self, cfg):
+            self.started = threading.current_thread() is not \
+                threading.main_thread()
+
+        def handle(self, scope, receive, send):
+            if scope['path'] == '/block':
+                release.wait(5)
+            send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [[b'content-type', b'text/plain']],
+            })
+            send({
+                'type': 'http.response.body',
+                'body': f'started on pool: {self.started}'.encode(),
+            })
+
+    def new():
+        return MyFunction()
+
+    results = {}
+
+    def test():
+        try:
+            wait_for_function()
+            blocked = threading.Thread(target=lambda: results.update(
+                blocked=httpx.get(f"http://{LISTEN_ADDRESS}/block")))
+            blocked.start()
+            time.sleep(0.2)
+            results["unblocked"] = httpx.get(f"http://{LISTEN_ADDRESS}/",
+                                             timeout=2)
+            release.set()
+            blocked.join(5)
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(new)
+
+    test_thread.join(timeout=10)
+    assert results["unblocked"].status_code == 200
+    assert results["unblocked"].text == "started on pool: True"
+    assert results["blocked"].status_code == 200
+
+
+def test_admission(monkeypatch):
+    """
+    ensures that requests beyond the maximum concurrency are shed with a 503
+    and that readiness reports the function as overloaded meanwhile.
+    """
+    monkeypatch.setenv("FUNC_MAX_CONCURRENCY", "1")
+    monkeypatch.setenv("FUNC_RETRY_AFTER", "3")
+
+    async def handle(scope, receive, send):
+        if scope['path'] == '/slow':
+            await asyncio.sleep(1)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [[b'content-type', b'text/plain']],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'OK',
+        })
+
+    results = {}
+
+    def test():
+        try:
+            wait_for_function()
+            slow = threading.Thread(target=lambda: results.update(
+                slow=httpx.get(f"http://{LISTEN_ADDRESS}/slow")))
+            slow.start()
+            time.sleep(0.3)
+            results["shed"] = httpx.get(f"http://{LISTEN_ADDRESS}/")
+            results["readiness"] = httpx.get(
+                f"http://{LISTEN_ADDRESS}/health/readiness")
+            slow.join(5)
+            results["admitted"] = httpx.get(f"http://{LISTEN_ADDRESS}/")
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle)
+
+    test_thread.join(timeout=10)
+    assert results["slow"].status_code == 200
+    assert results["shed"].status_code == 503
+    assert results["shed"].headers["retry-after"] == "3"
+    assert results["readiness"].status_code == 503
+    assert results["readiness"].headers["x-func-inflight"] == "1"
+    assert results["admitted"].status_code == 200
+
+
+def test_config(monkeypatch):
+    """
+    ensures that server settings are read from the environment and the
+    config argument, with the latter taking precedence.
+    """
+    monkeypatch.setenv("FUNC_INCLUDE_SERVER_HEADER", "false")
+    monkeypatch.setenv("FUNC_INCLUDE_DATE_HEADER", "false")
+
+    async def handle(scope, receive, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [[b'content-type', b'text/plain']],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'OK',
+        })
+
+    results = {}
+
+    def test():
+        try:
+            wait_for_function()
+            results["response"] = httpx.get(f"http://{LISTEN_ADDRESS}")
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle, config={"include_date_header": True})
+
+    test_thread.join(timeout=5)
+    assert "server" not in results["response"].headers
+    assert "date" in results["response"].headers
+
+
+def test_worker_shutdown_timeout(monkeypatch):
+    """
+    ensures that workers are by default given long enough to drain, through
+    the drain grace period and graceful timeout, before they are killed.
+    """
+    monkeypatch.delenv("FUNC_WORKER_SHUTDOWN_TIMEOUT", raising=False)
+    monkeypatch.delenv("FUNC_DRAIN_GRACE_PERIOD", raising=False)
+    monkeypatch.delenv("FUNC_GRACEFUL_TIMEOUT", raising=False)
+    timeout = func_python.workers.worker_shutdown_timeout
+    margin = func_python.workers.SHUTDOWN_MARGIN
+    assert timeout() == 30 + margin
+    monkeypatch.setenv("FUNC_GRACEFUL_TIMEOUT", "10")
+    monkeypatch.setenv("FUNC_DRAIN_GRACE_PERIOD", "5")
+    assert timeout() == 15 + margin
+    assert timeout(20) == 25 + margin
+    monkeypatch.setenv("FUNC_WORKER_SHUTDOWN_TIMEOUT", "7")
+    assert timeout() == 7
+
+
+def test_unix_socket(monkeypatch, tmp_path):
+    """
+    ensures that a function can be served on a unix domain socket, and that
+    a stale socket left at its path is removed.
+    """
+    path = str(tmp_path / "func.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    monkeypatch.setenv("LISTEN_ADDRESS", f"unix://{path}")
+    monkeypatch.setenv("FUNC_SOCKET_MODE", "660")
+
+    async def handle(scope, receive, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [[b'content-type', b'text/plain']],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'unix OK',
+        })
+
+    results = {}
+
+    def test():
+        try:
+            client = httpx.Client(transport=httpx.HTTPTransport(uds=path))
+            for _ in range(20):
+                time.sleep(0.5)
+                try:
+                    results["response"] = client.get("http://function/")
+                    break
+                except httpx.ConnectError:
+                    continue
+            results["mode"] = stat.S_IMODE(os.stat(path).st_mode)
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle)
+
+    test_thread.join(timeout=5)
+    assert results["response"].text == "unix OK"
+    assert results["mode"] == 0o660
+
+
+def test_unix_socket_workers(monkeypatch, tmp_path):
+    """
+    ensures that a function served with multiple workers listens on a unix
+    domain socket, bound once and shared by the workers.
+    """
+    path = str(tmp_path / "func.sock")
+    monkeypatch.setenv("LISTEN_ADDRESS", f"unix://{path}")
+
+    async def handle(scope, receive, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [[b'content-type', b'text/plain']],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': str(os.getpid()).encode(),
+        })
+
+    results = {"pids": set()}
+
+    def test():
+        try:
+            client = httpx.Client(transport=httpx.HTTPTransport(uds=path))
+            for _ in range(20):
+                time.sleep(0.5)
+                try:
+                    client.get("http://function/")
+                    break
+                except httpx.ConnectError:
+                    continue
+            for _ in range(20):
+                response = client.get("http://function/",
+                                      headers={"connection": "close"})
+                assert response.status_code == 200
+                results["pids"].add(int(response.text))
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle, workers=2)
+
+    test_thread.join(timeout=5)
+    assert results["pids"]
+    assert os.getpid() not in results["pids"]
+
+
+def test_inherited_fd(monkeypatch):
+    """
+    ensures that a function can be served on an inherited listening socket.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    address = "%s:%d" % sock.getsockname()
+    monkeypatch.setenv("LISTEN_ADDRESS", f"fd://{sock.detach()}")
+
+    async def handle(scope, receive, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [[b'content-type', b'text/plain']],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'fd OK',
+        })
+
+    results = {}
+
+    def test():
+        try:
+            for _ in range(20):
+                time.sleep(0.5)
+                try:
+                    results["response"] = httpx.get(f"http://{address}/")
+                    break
+                except httpx.ConnectError:
+                    continue
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle)
+
+    test_thread.join(timeout=5)
+    assert results["response"].text == "fd OK"
+
+
+def test_socket_options(monkeypatch, caplog):
+    """
+    ensures that socket options are applied per listen address, and that
+    the effective values are logged at startup.
+    """
+    caplog.set_level(logging.INFO)
+    monkeypatch.setenv("LISTEN_ADDRESS", f"{LISTEN_ADDRESS}?rcvbuf=65536&reuseport=true")
+    monkeypatch.setenv("FUNC_SOCKET_OPTIONS", "nodelay=1&fastopen=16")
+
+    async def handle(scope, receive, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [[b'content-type', b'text/plain']],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'OK',
+        })
+
+    results = {}
+
+    def test():
+        try:
+            wait_for_function()
+            results["response"] = httpx.get(f"http://{LISTEN_ADDRESS}")
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle)
+
+    test_thread.join(timeout=5)
+    assert results["response"].text == "OK"
+    [startup] = [r.getMessage() for r in caplog.records
+                 if r.getMessage().startswith(f"listening on <{LISTEN_ADDRESS}>")]
+    assert "nodelay=1" in startup
+    assert "reuseport=1" in startup
+    assert "backlog=" in startup
+    # Linux doubles the requested buffer size
+    assert "rcvbuf=131072" in startup or "rcvbuf=65536" in startup
+
+    with pytest.raises(ValueError):
+        func_python.sock.parse_options("nodelay=1&unknown=1")
+
+
+def test_startup_profile(monkeypatch, caplog):
+    """
+    ensures that the startup profile logs each phase of starting when
+    enabled, and that the server is not imported with the middleware.
+    """
+    caplog.set_level(logging.INFO)
+    monkeypatch.setenv("FUNC_STARTUP_PROFILE", "true")
+
+    async def handle(scope, receive, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [[b'content-type', b'text/plain']],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'OK',
+        })
+
+    def test():
+        try:
+            wait_for_function()
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle)
+
+    test_thread.join(timeout=5)
+    phases = [r.getMessage().split()[1] for r in caplog.records
+              if r.getMessage().startswith("startup: ")]
+    assert phases == ["import", "new", "bind", "server", "lifespan", "first"]
+
+    imported = subprocess.run(
+        [sys.executable, "-c", "import sys, func_python.http, "
+         "func_python.cloudevent; print('hypercorn' in sys.modules)"],
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+        capture_output=True, text=True, check=True)
+    assert imported.stdout.strip() == "False"
+
+
+def test_warmup():
+    """
+    ensures that warm-up requests are sent through the function after an
+    asynchronous start, and that readiness fails until they are complete.
+    """
+    release = asyncio.Event()
+
+    class MyFunction:
+        def __init__(self):
+            self.loop = None
+            self.requests = []
+
+        async def start(self, cfg):
+            await asyncio.sleep(0)
+            self.loop = asyncio.get_running_loop()
+            self.requests.append("start")
+
+        async def warmup(self):
+            return [{"path": "/warm", "body": {"hello": "world"}}]
+
+        async def handle(self, scope, receive, send):
+            body = await receive.body()
+            self.requests.append((scope['path'], scope.get('warmup', False),
+                                  body))
+            if scope.get('warmup'):
+                await release.wait()
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [[b'content-type', b'text/plain']],
+            })
+            await send({
+                'type': 'http.response.body',
+                'body': b'OK',
+            })
+
+    f = MyFunction()
+
+    def new():
+        return f
+
+    results = {}
+
+    def test():
+        try:
+            wait_for_function()
+            results["warming"] = httpx.get(
+                f"http://{LISTEN_ADDRESS}/health/readiness")
+            f.loop.call_soon_threadsafe(release.set)
+            time.sleep(0.2)
+            results["ready"] = httpx.get(
+                f"http://{LISTEN_ADDRESS}/health/readiness")
+            httpx.get(f"http://{LISTEN_ADDRESS}/")
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(new)
+
+    test_thread.join(timeout=5)
+    assert results["warming"].status_code == 500
+    assert results["warming"].text == "Warming up"
+    assert results["ready"].status_code == 200
+    assert f.requests == ["start", ("/warm", True, b'{"hello": "world"}'),
+                          ("/", False, b"")]
+
+
+def test_drain(monkeypatch):
+    """
+    ensures that on a signal readiness fails while requests continue to be
+    accepted for the grace period, and that requests in flight complete
+    before the function is stopped.
+    """
+    monkeypatch.setenv("FUNC_DRAIN_GRACE_PERIOD", "1")
+
+    class MyFunction:
+        def __init__(self):
+            self.events = []
+
+        async def handle(self, scope, receive, send):
+            if scope['path'] == '/slow':
+                await asyncio.sleep(1.5)
+            self.events.append(scope['path'])
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [[b'content-type', b'text/plain']],
+            })
+            await send({
+                'type': 'http.response.body',
+                'body': b'OK',
+            })
+
+        def stop(self):
+            self.events.append("stop")
+
+    f = MyFunction()
+
+    def new():
+        return f
+
+    results = {}
+
+    def test():
+        try:
+            wait_for_function()
+            slow = threading.Thread(target=lambda: results.update(
+                slow=httpx.get(f"http://{LISTEN_ADDRESS}/slow", timeout=5)))
+            slow.start()
+            time.sleep(0.2)
+            os.kill(os.getpid(), signal.SIGINT)
+            time.sleep(0.2)
+            results["readiness"] = httpx.get(
+                f"http://{LISTEN_ADDRESS}/health/readiness")
+            results["grace"] = httpx.get(f"http://{LISTEN_ADDRESS}/grace")
+            slow.join(5)
+        except BaseException:
+            os.kill(os.getpid(), signal.SIGINT)
+            raise
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(new)
+
+    test_thread.join(timeout=5)
+    assert results["readiness"].status_code == 500
+    assert results["readiness"].text == "Draining"
+    assert results["readiness"].headers["x-func-inflight"] == "1"
+    assert results["grace"].status_code == 200
+    assert results["slow"].status_code == 200
+    assert f.events == ["/grace", "/slow", "stop"]
+
+
+def test_request_timeout(monkeypatch):
+    """
+    ensures that requests are cancelled after their timeout and answered with
+    a 504, that timeouts may be overridden by path prefix, and that the
+    deadline is available to the handler.
+    """
+    monkeypatch.setenv("FUNC_REQUEST_TIMEOUT", "5")
+    monkeypatch.setenv("FUNC_REQUEST_TIMEOUTS", "/slow=0.5")
+    monkeypatch.setenv("FUNC_METRICS", "true")
+    cancelled = []
+
+    async def handle(scope, receive, send):
+        if scope['path'].startswith('/slow'):
+            try:
+                await asyncio.sleep(3)
+            except asyncio.CancelledError:
+                cancelled.append(scope['path'])
+                raise
+        remaining = func_python.timeout.remaining(scope)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [[b'content-type', b'text/plain']],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': f'{remaining:.1f}'.encode(),
+        })
+
+    results = {}
+
+    def test():
+        try:
+            wait_for_function()
+            results["slow"] = httpx.get(f"http://{LISTEN_ADDRESS}/slow/x")
+            results["fast"] = httpx.get(f"http://{LISTEN_ADDRESS}/")
+            results["metrics"] = httpx.get(f"http://{LISTEN_ADDRESS}/metrics")
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle)
+
+    test_thread.join(timeout=5)
+    assert results["slow"].status_code == 504
+    assert cancelled == ["/slow/x"]
+    assert results["fast"].status_code == 200
+    assert 4.0 < float(results["fast"].text) <= 5.0
+    assert "func_request_timeouts_total 1" in results["metrics"].text
+    assert 'func_requests_total{status="504"} 1' in results["metrics"].text
+
+
+def test_streaming(tmp_path):
+    """
+    ensures that responses may be streamed from generators, as Server-Sent
+    Events, and from files.
+    """
+    path = tmp_path / "export.csv"
+    path.write_bytes(b"id,name\n" + b"".join(
+        b"%d,name %d\n" % (i, i) for i in range(20000)))
+
+    async def chunks():
+        for i in range(3):
+            await asyncio.sleep(0)
+            yield f"chunk {i}\n"
+
+    async def handle(scope, receive, send):
+        if scope['path'] == '/stream':
+            await send.stream(chunks(), content_type="text/plain")
+        elif scope['path'] == '/events':
+            await send.events(["hello", {"event": "update", "id": 2,
+                                         "data": {"n": 1}}])
+        else:
+            await send.file(path)
+
+    results = {}
+
+    def test():
+        try:
+            wait_for_function()
+            results["stream"] = httpx.get(f"http://{LISTEN_ADDRESS}/stream")
+            results["events"] = httpx.get(f"http://{LISTEN_ADDRESS}/events")
+            results["file"] = httpx.get(f"http://{LISTEN_ADDRESS}/file")
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle)
+
+    test_thread.join(timeout=5)
+    assert results["stream"].text == "chunk 0\nchunk 1\nchunk 2\n"
+    assert results["stream"].headers["transfer-encoding"] == "chunked"
+    assert results["events"].headers["content-type"].startswith(
+        "text/event-stream")
+    assert results["events"].text == \
+        'data: hello\n\nevent: update\nid: 2\ndata: {"n":1}\n\n'
+    assert results["file"].content == path.read_bytes()
+    assert results["file"].headers["content-type"] == "text/csv"
+
+    # Servers supporting the pathsend extension are given the path instead
+    messages = []
+
+    async def record(message):
+        messages.append(message)
+
+    sender = func_python.response.ResponseSender(
+        record, {"extensions": {"http.response.pathsend": {}}})
+    asyncio.run(sender.file(path))
+    assert messages[1] == {"type": "http.response.pathsend",
+                           "path": str(path)}
+
+
+def test_streaming_sync(monkeypatch, tmp_path):
+    """
+    ensures that synchronous handlers may use the streaming helpers without
+    deadlocking, even when they occupy every thread of the pool.
+    """
+    monkeypatch.setenv("FUNC_THREADS", "1")
+    monkeypatch.setenv("FUNC_GRACEFUL_TIMEOUT", "1")
+    path = tmp_path / "export.txt"
+    path.write_bytes(b"x" * 100000)
+
+    def handle(scope, receive, send):
+        if scope['path'] == '/stream':
+            send.stream(iter([b"a", b"b"]), content_type="text/plain")
+        else:
+            send.file(path)
+
+    results = {}
+
+    def test():
+        try:
+            wait_for_function()
+            for name in ("stream", "file"):
+                results[name] = httpx.get(
+                    f"http://{LISTEN_ADDRESS}/{name}", timeout=3)
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle)
+
+    test_thread.join(timeout=5)
+    assert results["stream"].text == "ab"
+    assert results["file"].content == path.read_bytes()
+
+def test_compression(monkeypatch):
+    """
+    ensures that responses are compressed with an accepted encoding when
+    large enough and of a compressible type, including streamed responses.
+    """
+    monkeypatch.setenv("FUNC_COMPRESSION", "gzip")
+    monkeypatch.setenv("FUNC_COMPRESSION_OFFLOAD_SIZE", "4096")
+    large = b'{"items": [' + b",".join(b'{"n": %d}' % i for i in range(2000)) \
+        + b']}'
+
+    async def handle(scope, receive, send):
+        if scope['path'] == '/stream':
+            await send.stream([large[:5000], large[5000:]],
+                              content_type="application/json")
+            return
+        content_type = b'image/png' if scope['path'] == '/png' \
+            else b'application/json'
+        body = b'{}' if scope['path'] == '/small' else large
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [[b'content-type', content_type],
+                        [b'content-length', str(len(body)).encode()]],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': body,
+        })
+
+    results = {}
+
+    def test():
+        try:
+            wait_for_function()
+            for path in ("/large", "/small", "/png", "/stream"):
+                results[path] = httpx.get(f"http://{LISTEN_ADDRESS}{path}",
+                                          headers={"accept-encoding": "gzip"})
+            results["identity"] = httpx.get(
+                f"http://{LISTEN_ADDRESS}/large",
+                headers={"accept-encoding": "identity"})
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle)
+
+    test_thread.join(timeout=5)
+    large_response = results["/large"]
+    assert large_response.headers["content-encoding"] == "gzip"
+    assert int(large_response.headers["content-length"]) < len(large)
+    assert large_response.content == large
+    assert "content-encoding" not in results["/small"].headers
+    assert "content-encoding" not in results["/png"].headers
+    assert results["/stream"].headers["content-encoding"] == "gzip"
+    assert results["/stream"].content == large
+    assert "content-encoding" not in results["identity"].headers
+    assert results["identity"].content == large
+
+
+def test_compression_sync(monkeypatch):
+    """
+    ensures that large responses of synchronous handlers are compressed
+    without deadlocking when they occupy every thread of the pool.
+    """
+    monkeypatch.setenv("FUNC_THREADS", "1")
+    monkeypatch.setenv("FUNC_GRACEFUL_TIMEOUT", "1")
+    monkeypatch.setenv("FUNC_COMPRESSION", "gzip")
+    monkeypatch.setenv("FUNC_COMPRESSION_OFFLOAD_SIZE", "1024")
+    body = b"x" * 10000
+
+    def handle(scope, receive, send):
+        send({'type': 'http.response.start', 'status': 200,
+              'headers': [[b'content-type', b'text/plain']]})
+        send({'type': 'http.response.body', 'body': body})
+
+    results = {}
+
+    def test():
+        try:
+            wait_for_function()
+            results["response"] = httpx.get(
+                f"http://{LISTEN_ADDRESS}", timeout=3,
+                headers={"accept-encoding": "gzip"})
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle)
+
+    test_thread.join(timeout=5)
+    assert results["response"].headers["content-encoding"] == "gzip"
+    assert results["response"].content == body
+
+def test_metrics(monkeypatch):
+    """
+    ensures that requests are recorded at the metrics endpoint by status,
+    with the bytes received, including handlers which fail before starting
+    a response (recorded as 500s), and that timeouts and response cache
+    hits and misses are counted.
+    """
+    monkeypatch.setenv("FUNC_METRICS", "true")
+    monkeypatch.setenv("FUNC_REQUEST_TIMEOUTS", "/slow=0.2")
+    monkeypatch.setenv("FUNC_RESPONSE_CACHE_SIZE", "65536")
+
+    async def handle(scope, receive, send):
+        if scope['path'] == '/raise':
+            raise RuntimeError("failed before responding")
+        if scope['path'] == '/slow':
+            await asyncio.sleep(5)
+        body = await receive.body()
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [[b'content-type', b'text/plain']]})
+        await send({'type': 'http.response.body',
+                    'body': str(len(body)).encode()})
+
+    results = {}
+
+    def test():
+        try:
+            wait_for_function()
+            url = f"http://{LISTEN_ADDRESS}"
+            results["post"] = httpx.post(url, content=b'x' * 100)
+            results["raise"] = httpx.post(f"{url}/raise")
+            results["slow"] = httpx.post(f"{url}/slow")
+            for i in range(2):
+                results[f"cached{i}"] = httpx.get(f"{url}/cached")
+            results["metrics"] = httpx.get(f"{url}/metrics")
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle)
+
+    test_thread.join(timeout=5)
+    assert results["post"].text == "100"
+    assert results["raise"].status_code == 500
+    assert results["slow"].status_code == 504
+    assert results["metrics"].status_code == 200
+    lines = results["metrics"].text.splitlines()
+    assert 'func_requests_total{status="200"} 3' in lines
+    assert 'func_requests_total{status="500"} 1' in lines
+    assert 'func_requests_total{status="504"} 1' in lines
+    assert 'func_request_duration_seconds_count 5' in lines
+    assert 'func_request_size_bytes_sum 100.0' in lines
+    assert 'func_requests_inflight 0' in lines
+    assert 'func_request_timeouts_total 1' in lines
+    assert 'func_response_cache_hits_total 1' in lines
+    assert 'func_response_cache_misses_total 1' in lines
+
+
+def test_response_cache(monkeypatch):
+    """
+    ensures that GET responses are cached, with concurrent misses invoking
+    the handler once, that a matching If-None-Match is answered with a 304,
+    that responses are given the ETag they are cached with, and that
+    uncacheable responses, including those varying by headers which are not
+    part of the key, are not cached.
+    """
+    monkeypatch.setenv("FUNC_RESPONSE_CACHE_SIZE", "65536")
+    invocations = {}
+
+    async def handle(scope, receive, send):
+        path = scope['path']
+        invocations[path] = invocations.get(path, 0) + 1
+        await asyncio.sleep(0.2)
+        headers = [[b'content-type', b'text/plain']]
+        if path == '/private':
+            headers.append([b'cache-control', b'private'])
+        elif path == '/language':
+            headers.append([b'vary', b'Accept-Language'])
+        elif path == '/accept':
+            headers.append([b'vary', b'Accept'])
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': headers})
+        await send({'type': 'http.response.body',
+                    'body': f"{path} {invocations[path]}".encode()})
+
+    results = {}
+
+    def test():
+        try:
+            wait_for_function()
+            url = f"http://{LISTEN_ADDRESS}"
+            threads = [threading.Thread(
+                target=lambda i=i: results.__setitem__(
+                    i, httpx.get(f"{url}/lookup?q=1")))
+                for i in range(3)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            results["other"] = httpx.get(f"{url}/lookup?q=2")
+            results["hit"] = httpx.get(f"{url}/lookup?q=1")
+            results["304"] = httpx.get(
+                f"{url}/lookup?q=1",
+                headers={"if-none-match": results["hit"].headers["etag"]})
+            results["no-cache"] = httpx.get(
+                f"{url}/lookup?q=1", headers={"cache-control": "no-cache"})
+            for i in range(2):
+                results[f"private{i}"] = httpx.get(f"{url}/private")
+                results[f"language{i}"] = httpx.get(f"{url}/language")
+                results[f"accept{i}"] = httpx.get(f"{url}/accept")
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    test_thread = threading.Thread(target=test)
+    test_thread.start()
+
+    serve(handle)
+
+    test_thread.join(timeout=5)
+    assert [results[i].text for i in range(3)] == ["/lookup 1"] * 3
+    assert results["other"].text == "/lookup 2"
+    assert results["hit"].text == "/lookup 1"
+    assert [results[i].headers["etag"] for i in range(3)] == \
+        [results["hit"].headers["etag"]] * 3
+    assert results["304"].status_code == 304
+    assert results["304"].headers["etag"] == results["hit"].headers["etag"]
+    assert results["no-cache"].text == "/lookup 3"
+    assert results["private0"].text == "/private 1"
+    assert results["private1"].text == "/private 2"
+    assert results["language1"].text == "/language 2"
+    assert results["accept1"].text == "/accept 1"
+
+
+def test_decompression_limit():
+    """
+    ensures that a request body which decompresses to exactly the maximum
+    size in one chunk can not inflate without bound in the next.
+    """
+    import brotli
+    import zlib
+
+    def gzip_chunks():
+        c = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+        first = c.compress(b'a' * 1000) + c.flush(zlib.Z_SYNC_FLUSH)
+        return first, c.compress(b'b' * 10_000_000) + c.flush()
+
+    def brotli_chunks():
+        c = brotli.Compressor()
+        first = c.process(b'a' * 1000) + c.flush()
+        return first, c.process(b'b' * 10_000_000) + c.finish()
+
+    for encoding, chunks in (('gzip', gzip_chunks), ('br', brotli_chunks)):
+        first, second = chunks()
+        messages = [
+            {'type': 'http.request', 'body': first, 'more_body': True},
+            {'type': 'http.request', 'body': second, 'more_body': False},
+        ]
+
+        async def receive():
+            return messages.pop(0)
+
+        scope = {'headers': [(b'content-encoding', encoding.encode())]}
+        receiver = func_python.body.BodyReceiver(
+            receive, scope, decompress=True, max_decompressed=1000)
+
+        async def run():
+            assert len((await receiver())['body']) == 1000
+            with pytest.raises(func_python.body.BodyTooLarge):
+                await receiver()
+
+        asyncio.run(run())
+        # zlib stops at the byte past the limit, and brotli once its output
+        # buffer (which grows in blocks) reaches it
+        assert receiver.decompressed <= (1001 if encoding == 'gzip'
+                                         else 65536), encoding
+
+
+def test_compressed_requests(monkeypatch):
+    """
+    ensures that compressed request bodies reach HTTP functions as they were
+    sent by default, and are decompressed when enabled, with encodings which
+    can not be decoded still passed through.
+    """
+    received = []
+
+    async def handle(scope, receive, send):
+        encoding = dict(scope['headers']).get(b'content-encoding')
+        received.append((encoding, await receive.body()))
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    compressed = gzip.compress(b'hello')
+
+    def run():
+        statuses = []
+
+        def test():
+            try:
+                wait_for_function()
+                for encoding, body in (("gzip", compressed),
+                                       ("zstd", b"opaque")):
+                    statuses.append(httpx.post(
+                        f"http://{LISTEN_ADDRESS}", content=body,
+                        headers={"content-encoding": encoding}).status_code)
+            finally:
+                os.kill(os.getpid(), signal.SIGINT)
+
+        test_thread = threading.Thread(target=test)
+        test_thread.start()
+        serve(handle)
+        test_thread.join(timeout=5)
+        assert statuses == [200, 200]
+
+    run()
+    assert received == [(b"gzip", compressed), (b"zstd", b"opaque")]
+    received.clear()
+    monkeypatch.setenv("FUNC_DECOMPRESS_REQUESTS", "true")
+    run()
+    assert received == [(None, b"hello"), (b"zstd", b"opaque")]